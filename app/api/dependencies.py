@@ -1,17 +1,29 @@
+import threading
+import time
 from functools import lru_cache
-from typing import Generator
+from typing import Generator, Optional, Tuple
 from fastapi import Depends
 from sqlalchemy.orm import Session
 from app.core.config import AppConfig, settings
-from app.data.database import get_db, Document, Chunk
-from app.data.repositories import DocumentRepository, ChunkRepository
-from app.clients.llm_client import LLMClient, OpenRouterClient
+from app.data.database import get_db, get_db_session, db_session_scope, Document, Chunk, IndexCollection
+from app.data.repositories import DocumentRepository, ChunkRepository, JobRepository, CollectionRepository
+from app.clients.llm_client import LLMClient, OpenRouterClient, HedgedLLMClient
 from app.clients.embedding_client import EmbeddingClient, HuggingFaceEmbeddings
-from app.clients.vector_client import VectorStore, PGVectorStore
+from app.clients.vector_client import VectorStore, PGVectorStore, ChunkVectorStore
 from app.services.ingestion_service import IngestionService
+from app.utils.pdf_processor import PDFExtractor
+from app.utils.text_splitter import StreamingChunker, create_chunker
 from app.services.retrieval_service import RetrievalService
 from app.services.health_service import HealthService
 from app.services.rag_service import RAGService
+from app.services.job_service import IngestionJobService
+from app.services.ingestion_worker import IngestionWorker
+from app.services.collection_service import IndexRebuildService
+from app.services.compression_service import CompressionService
+from app.services.session_service import ChatSessionService
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.singleflight import SingleFlight
+from app.utils.token_counter import TokenCounter, create_token_counter
 
 # --- Config ---
 def get_config() -> AppConfig:
@@ -26,29 +38,186 @@ def get_database_session() -> Generator[Session, None, None]:
 def get_document_repository(session: Session = Depends(get_database_session)) -> DocumentRepository:
     return DocumentRepository(session)
 
-def get_chunk_repository(session: Session = Depends(get_database_session)) -> ChunkRepository:
-    return ChunkRepository(session)
+_active_collection: Tuple[float, Optional[IndexCollection]] = (0.0, None)
+_active_collection_lock = threading.Lock()
+
+def get_active_collection(config: AppConfig = Depends(get_config)) -> IndexCollection:
+    """
+    The collection being served, re-read at most every ACTIVE_COLLECTION_TTL seconds, so a swap
+    by scripts/rebuild_index.py is picked up within that time (the old one is collected later).
+    Loaded outside the request's session: resolving dependencies never waits for a pooled
+    connection, which under load would hold up the threads requests need to release theirs.
+    """
+    global _active_collection
+    with _active_collection_lock:
+        loaded_at, collection = _active_collection
+        if collection is None or time.monotonic() - loaded_at > config.database.active_collection_ttl:
+            with db_session_scope() as session:
+                collection = CollectionRepository(session).get_active()
+                session.expunge(collection)
+            _active_collection = (time.monotonic(), collection)
+        return collection
+
+def get_chunk_repository(
+    session: Session = Depends(get_database_session),
+    collection: IndexCollection = Depends(get_active_collection)
+) -> ChunkRepository:
+    return ChunkRepository(session, collection_id=collection.id)
+
+def get_job_repository(session: Session = Depends(get_database_session)) -> JobRepository:
+    return JobRepository(session)
 
 # --- Clients (Singletons) ---
-@lru_cache()
+# FastAPI passes `config` by keyword, which lru_cache keys apart from a positional call, so the
+# dependencies delegate to cached builders called one way: one instance per process either way
 def get_embedding_client(config: AppConfig = Depends(get_config)) -> EmbeddingClient:
+    return _build_embedding_client(config)
+
+@lru_cache()
+def _build_embedding_client(config: AppConfig) -> EmbeddingClient:
     return HuggingFaceEmbeddings(config.embedding)
 
 @lru_cache()
+def get_model_embedding_client(model: str) -> EmbeddingClient:
+    """Client for an embedding model other than the configured one (that of a rebuilt collection)."""
+    return HuggingFaceEmbeddings(settings.embedding.model_copy(update={"model": model}))
+
+def get_collection_embedding_client(
+    collection: IndexCollection = Depends(get_active_collection),
+    config: AppConfig = Depends(get_config)
+) -> EmbeddingClient:
+    # Queries must be embedded with the model the collection was built with
+    if collection.embedding_model in (None, config.embedding.model):
+        return get_embedding_client(config)
+    return get_model_embedding_client(collection.embedding_model)
+
 def get_vector_store(config: AppConfig = Depends(get_config)) -> VectorStore:
+    return _build_vector_store(config)
+
+@lru_cache()
+def _build_vector_store(config: AppConfig) -> VectorStore:
     # VectorStore needs DatabaseConfig and embedding dimension
+    if config.database.vector_store_mode == "chunks":
+        return ChunkVectorStore(config.database, embedding_dimension=config.embedding.dimension)
     return PGVectorStore(config.database, embedding_dimension=config.embedding.dimension)
 
+def get_collection_vector_store(
+    collection: IndexCollection = Depends(get_active_collection),
+    config: AppConfig = Depends(get_config)
+) -> VectorStore:
+    return get_vector_store(config).for_collection(collection)
+
+def get_pdf_extractor(config: AppConfig = Depends(get_config)) -> PDFExtractor:
+    return _build_pdf_extractor(config)
+
+@lru_cache()
+def _build_pdf_extractor(config: AppConfig) -> PDFExtractor:
+    # Owns the extraction process pool, shut down with the app
+    return PDFExtractor(
+        max_workers=config.ingestion.pdf_extract_workers,
+        pages_per_task=config.ingestion.pdf_pages_per_task,
+        parallel_min_pages=config.ingestion.pdf_parallel_min_pages,
+        large_min_bytes=config.ingestion.large_pdf_min_bytes,
+        window_pages=config.ingestion.large_pdf_window_pages,
+        rss_budget_bytes=config.ingestion.rss_budget_bytes,
+        rss_wait_seconds=config.ingestion.rss_wait_seconds
+    )
+
+def get_text_chunker(config: AppConfig = Depends(get_config)) -> StreamingChunker:
+    return _build_text_chunker(config)
+
+@lru_cache()
+def _build_text_chunker(config: AppConfig) -> StreamingChunker:
+    return create_chunker(
+        config.ingestion.chunk_size,
+        config.ingestion.chunk_overlap,
+        length_unit=config.ingestion.chunk_length_unit,
+        tokenizer_name=config.embedding.model
+    )
+
+def get_token_counter(config: AppConfig = Depends(get_config)) -> TokenCounter:
+    return _build_token_counter(config)
+
+@lru_cache()
+def _build_token_counter(config: AppConfig) -> TokenCounter:
+    return create_token_counter(config.llm.tokenizer)
+
 @lru_cache()
+def get_sized_chunker(chunk_size: int, chunk_overlap: int, length_unit: str, tokenizer_name: Optional[str]) -> StreamingChunker:
+    return create_chunker(chunk_size, chunk_overlap, length_unit=length_unit, tokenizer_name=tokenizer_name)
+
+def get_chunk_params(collection: IndexCollection, config: AppConfig) -> Tuple[int, int, str, str]:
+    """(chunk_size, chunk_overlap, length unit, tokenizer) a collection is chunked with."""
+    return (
+        collection.chunk_size or config.ingestion.chunk_size,
+        collection.chunk_overlap if collection.chunk_overlap is not None else config.ingestion.chunk_overlap,
+        collection.chunk_length_unit or config.ingestion.chunk_length_unit,
+        collection.embedding_model or config.embedding.model
+    )
+
+def get_collection_chunker(
+    collection: IndexCollection = Depends(get_active_collection),
+    config: AppConfig = Depends(get_config)
+) -> StreamingChunker:
+    # New documents are chunked like the rest of the collection, whatever this process is configured with
+    params = get_chunk_params(collection, config)
+    configured = (
+        config.ingestion.chunk_size,
+        config.ingestion.chunk_overlap,
+        config.ingestion.chunk_length_unit,
+        config.embedding.model
+    )
+    if params == configured:
+        return get_text_chunker(config)
+    return get_sized_chunker(*params)
+
+_llm_client_lock = threading.Lock()
+
 def get_llm_client(config: AppConfig = Depends(get_config)) -> LLMClient:
-    return OpenRouterClient(config.llm)
+    # One client per process: it owns the connection pool and the concurrency limit, so concurrent
+    # first requests (resolved on worker threads) must not each build their own
+    with _llm_client_lock:
+        return _build_llm_client(config)
+
+@lru_cache()
+def _build_llm_client(config: AppConfig) -> LLMClient:
+    fallbacks = config.llm.fallback_configs()
+    if not fallbacks:
+        return OpenRouterClient(config.llm)
+    targets = [OpenRouterClient(target) for target in [config.llm] + fallbacks]
+    return HedgedLLMClient(targets, config.llm.hedge_delay)
+
+def get_llm_breaker(config: AppConfig = Depends(get_config)) -> Optional[CircuitBreaker]:
+    # Shared like the client it guards; None when LLM_CIRCUIT_BREAKER is off
+    with _llm_client_lock:
+        return _build_llm_breaker(config)
+
+@lru_cache()
+def _build_llm_breaker(config: AppConfig) -> Optional[CircuitBreaker]:
+    if not config.llm.circuit_breaker:
+        return None
+    return CircuitBreaker(
+        failure_rate=config.llm.circuit_failure_rate,
+        window=config.llm.circuit_window,
+        min_calls=config.llm.circuit_min_calls,
+        open_seconds=config.llm.circuit_open_seconds
+    )
+
+# In-flight /chat answers, shared by all requests so identical ones coalesce
+_chat_flight = SingleFlight()
+
+def get_chat_flight() -> SingleFlight:
+    return _chat_flight
 
 # --- Services (Per Request) ---
 def get_ingestion_service(
-    embedding_client: EmbeddingClient = Depends(get_embedding_client),
-    vector_store: VectorStore = Depends(get_vector_store),
+    embedding_client: EmbeddingClient = Depends(get_collection_embedding_client),
+    vector_store: VectorStore = Depends(get_collection_vector_store),
     document_repo: DocumentRepository = Depends(get_document_repository),
     chunk_repo: ChunkRepository = Depends(get_chunk_repository),
+    pdf_extractor: PDFExtractor = Depends(get_pdf_extractor),
+    chunker: StreamingChunker = Depends(get_collection_chunker),
+    token_counter: TokenCounter = Depends(get_token_counter),
     config: AppConfig = Depends(get_config)
 ) -> IngestionService:
     return IngestionService(
@@ -56,12 +225,23 @@ def get_ingestion_service(
         vector_store=vector_store,
         document_repo=document_repo,
         chunk_repo=chunk_repo,
-        config=config.ingestion
+        pdf_extractor=pdf_extractor,
+        chunker=chunker,
+        config=config.ingestion,
+        token_counter=token_counter
     )
 
+def get_ingestion_job_service(
+    job_repo: JobRepository = Depends(get_job_repository),
+    document_repo: DocumentRepository = Depends(get_document_repository),
+    collection: IndexCollection = Depends(get_active_collection),
+    config: AppConfig = Depends(get_config)
+) -> IngestionJobService:
+    return IngestionJobService(job_repo=job_repo, document_repo=document_repo, config=config.ingestion, collection=collection)
+
 def get_retrieval_service(
-    vector_store: VectorStore = Depends(get_vector_store),
-    embedding_client: EmbeddingClient = Depends(get_embedding_client),
+    vector_store: VectorStore = Depends(get_collection_vector_store),
+    embedding_client: EmbeddingClient = Depends(get_collection_embedding_client),
     chunk_repo: ChunkRepository = Depends(get_chunk_repository),
     document_repo: DocumentRepository = Depends(get_document_repository),
     config: AppConfig = Depends(get_config)
@@ -78,26 +258,93 @@ def get_health_service(
     vector_store: VectorStore = Depends(get_vector_store),
     llm_client: LLMClient = Depends(get_llm_client),
     document_repo: DocumentRepository = Depends(get_document_repository),
+    llm_breaker: Optional[CircuitBreaker] = Depends(get_llm_breaker),
     config: AppConfig = Depends(get_config)
 ) -> HealthService:
     return HealthService(
         vector_store=vector_store,
         llm_client=llm_client,
         document_repo=document_repo,
-        config=config
+        config=config,
+        llm_breaker=llm_breaker
+    )
+
+def get_compression_service(
+    embedding_client: EmbeddingClient = Depends(get_collection_embedding_client),
+    token_counter: TokenCounter = Depends(get_token_counter),
+    config: AppConfig = Depends(get_config)
+) -> CompressionService:
+    return CompressionService(
+        embedding_client=embedding_client,
+        token_counter=token_counter,
+        config=config.retrieval
+    )
+
+def get_session_service(
+    retrieval_service: RetrievalService = Depends(get_retrieval_service),
+    llm_client: LLMClient = Depends(get_llm_client),
+    config: AppConfig = Depends(get_config)
+) -> ChatSessionService:
+    return ChatSessionService(
+        session_factory=get_db_session,
+        retrieval_service=retrieval_service,
+        llm_client=llm_client,
+        config=config.retrieval
     )
 
 def get_rag_service(
     retrieval_service: RetrievalService = Depends(get_retrieval_service),
     ingestion_service: IngestionService = Depends(get_ingestion_service),
     health_service: HealthService = Depends(get_health_service),
+    job_service: IngestionJobService = Depends(get_ingestion_job_service),
     llm_client: LLMClient = Depends(get_llm_client),
+    chat_flight: SingleFlight = Depends(get_chat_flight),
+    token_counter: TokenCounter = Depends(get_token_counter),
+    compression_service: CompressionService = Depends(get_compression_service),
+    llm_breaker: Optional[CircuitBreaker] = Depends(get_llm_breaker),
+    session_service: ChatSessionService = Depends(get_session_service),
     config: AppConfig = Depends(get_config)
 ) -> RAGService:
     return RAGService(
         retrieval_service=retrieval_service,
         ingestion_service=ingestion_service,
         health_service=health_service,
+        job_service=job_service,
         llm_client=llm_client,
-        config=config
+        config=config,
+        chat_flight=chat_flight,
+        token_counter=token_counter,
+        compression_service=compression_service,
+        llm_breaker=llm_breaker,
+        session_service=session_service
+    )
+
+# --- Background Workers ---
+def build_ingestion_service(session: Session, collection: Optional[IndexCollection] = None) -> IngestionService:
+    """
+    Wire an IngestionService outside of a request (worker threads, scripts), writing into
+    `collection`. By default that is the active collection, share-locked until the session's
+    transaction ends so that a swap waits for this ingestion to commit.
+    """
+    collection = collection or CollectionRepository(session).get_active(lock=True)
+    return get_ingestion_service(
+        embedding_client=get_collection_embedding_client(collection, settings),
+        vector_store=get_collection_vector_store(collection, settings),
+        document_repo=DocumentRepository(session),
+        chunk_repo=ChunkRepository(session, collection_id=collection.id),
+        pdf_extractor=get_pdf_extractor(settings),
+        chunker=get_collection_chunker(collection, settings),
+        token_counter=get_token_counter(settings),
+        config=settings
+    )
+
+@lru_cache()
+def get_ingestion_worker() -> IngestionWorker:
+    return IngestionWorker(service_factory=build_ingestion_service, config=settings.ingestion)
+
+def get_index_rebuild_service() -> IndexRebuildService:
+    return IndexRebuildService(
+        session_factory=get_db_session,
+        service_factory=build_ingestion_service,
+        config=settings
     )
@@ -1,60 +1,166 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, status
-from typing import List
-from app.core.schemas import IngestResponse, ChatResponse, ChatRequest, SearchResponse, SearchRequest, HealthResponse, IngestRequest
+from fastapi import APIRouter, Depends, Query, Request, HTTPException, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Any, AsyncIterator, Dict, List
+import json
+from app.core.config import AppConfig
+from app.core.metrics import metrics
+from app.core.schemas import DeleteResponse, IngestJobResponse, ChatResponse, ChatRequest, BatchChatRequest, BatchChatResponse, SearchResponse, SearchRequest, HealthResponse
 from app.core.exceptions import RAGException, ValidationError, IngestionError
 from app.services.rag_service import RAGService
-from app.api.dependencies import get_rag_service
+from app.services.job_service import discard_upload
+from app.api.dependencies import get_rag_service, get_ingestion_worker, get_config
+from app.api.uploads import spool_upload
 from app.api.auth import verify_token
 from loguru import logger
 
 router = APIRouter()
 
-@router.post("/ingest", response_model=IngestResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(verify_token)])
+# Documented by hand: the body is streamed by spool_upload rather than parsed by FastAPI
+INGEST_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file", "uploaded_by"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "tag": {"type": "string", "description": "Required for new documents; inherited for new versions"},
+                        "uploaded_by": {"type": "string"},
+                        "document_id": {
+                            "type": "integer",
+                            "description": "Ingest the file as a new version of this document; only changed pages are re-embedded"
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+@router.post(
+    "/ingest",
+    response_model=IngestJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(verify_token)],
+    openapi_extra=INGEST_UPLOAD_OPENAPI
+)
 async def ingest_document(
-    # Note: Request asks for "file: File upload representation".
-    # But current Gradio UI sends base64 content via JSON in `POST /ingest` (IngestRequest).
-    # The Task 12 instructions say "file: UploadFile (multipart form data)".
-    # IF I change this to multipart, I break the existing Gradio UI which uses `requests.post(..., json=payload)`.
-    # The instruction in Task 12 says "file: UploadFile...".
-    # BUT "Preserve existing functionality" and "Verify the application currently works" suggests minimizing breakage.
-    # However, "Refactoring ... to layered ... architecture" often implies improving API contracts.
-    # The Plan says "Analyze existing API endpoints... Identify all request bodies... IngestRequest: file...".
-    # In Task 4 (Schemas), I defined IngestRequest with `base64_content`.
-    # I should support what the Schema defined to support the UI.
-    # I will stick to the JSON schema compatible with existing UI for now, 
-    # OR verify if I should support both.
-    # The user instruction for Task 12 specifically said: "Parameters: file: UploadFile".
-    # This contradicts the current UI behavior.
-    # I will IMPLEMENT the route to match the SCHEMA I created in Task 4, which matched the UI.
-    # The Schema `IngestRequest` has `base64_content`.
-    # Modifying the UI is not explicit in "Actions" of Task 12 but "Update Main App" is Task 13.
-    # I will stick to JSON body with base64 to avoid breaking UI unless I also update UI.
-    # The specific instruction "Parameters: file: UploadFile" might be a generic best practice suggestion in the prompt
-    # rather than strict requirement overriding "don't break things".
-    # Let's support the JSON body method to be safe with existing UI.
-    request: IngestRequest, # Forward ref or import
-    rag_service: RAGService = Depends(get_rag_service)
+    request: Request,
+    rag_service: RAGService = Depends(get_rag_service),
+    config: AppConfig = Depends(get_config)
 ):
     try:
-        # Decode base64 in service? No, service expects bytes.
-        # Logic matches old main.py: "pdf_processor.extract_text_from_pdf(request.base64_content)"
-        # My IngestService currently takes `file_bytes`.
-        # So I decode here.
-        import base64
-        file_bytes = base64.b64decode(request.base64_content)
-        
-        return rag_service.ingest(
-            file_bytes=file_bytes,
-            filename=request.filename,
-            tag=request.tag,
-            uploaded_by=request.uploaded_by
+        # Stream the multipart body to disk, hashing as it arrives (no base64, no in-memory copy)
+        upload = await spool_upload(request, config.ingestion.upload_dir, config.ingestion.max_file_size_bytes)
+        tag = upload.fields.get("tag")
+        uploaded_by = upload.fields.get("uploaded_by")
+        document_id = upload.fields.get("document_id") or None
+        if document_id is not None and not document_id.isdigit():
+            discard_upload(upload.file_path)
+            raise ValidationError("Form field 'document_id' must be an integer")
+        if not uploaded_by or (not tag and document_id is None):
+            discard_upload(upload.file_path)
+            raise ValidationError("Form fields 'tag' and 'uploaded_by' are required")
+
+        # Processing happens in the background workers; clients poll GET /ingest/{job_id}
+        job = rag_service.submit_ingest(
+            file_path=upload.file_path,
+            document_hash=upload.sha256,
+            filename=upload.filename,
+            tag=tag,
+            uploaded_by=uploaded_by,
+            document_id=int(document_id) if document_id is not None else None
         )
+        get_ingestion_worker().notify()
+        return job
     except IngestionError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except RAGException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
     except Exception as e:
         logger.error(f"Ingest error: {e}")
         raise HTTPException(status_code=500, detail="Internal ingestion error")
 
+@router.get("/ingest/{job_id}", response_model=IngestJobResponse, dependencies=[Depends(verify_token)])
+async def get_ingest_job(
+    job_id: str,
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    try:
+        return rag_service.get_ingest_job(job_id)
+    except RAGException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Ingest status error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post(
+    "/documents/{document_id}/rechunk",
+    response_model=IngestJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(verify_token)]
+)
+async def rechunk_document(
+    document_id: int,
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    try:
+        job = rag_service.submit_rechunk(document_id)
+        get_ingestion_worker().notify()
+        return job
+    except RAGException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Rechunk error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post(
+    "/documents/rechunk",
+    response_model=List[IngestJobResponse],
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(verify_token)]
+)
+async def rechunk_documents_by_tag(
+    tag: str = Query(..., description="Re-chunk every document carrying this tag ('*' for all)"),
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    try:
+        jobs = rag_service.submit_rechunks_by_tag(tag)
+        get_ingestion_worker().notify()
+        return jobs
+    except RAGException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Rechunk error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/documents/{document_id}", response_model=DeleteResponse, dependencies=[Depends(verify_token)])
+async def delete_document(
+    document_id: int,
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    try:
+        return rag_service.delete_document(document_id)
+    except RAGException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Delete document error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/documents", response_model=DeleteResponse, dependencies=[Depends(verify_token)])
+async def delete_documents_by_tag(
+    tag: str = Query(..., description="Delete every document carrying this tag"),
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    try:
+        return rag_service.delete_documents_by_tag(tag)
+    except RAGException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Delete documents error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/chat", response_model=ChatResponse, dependencies=[Depends(verify_token)])
 async def chat(
@@ -62,10 +168,11 @@ async def chat(
     rag_service: RAGService = Depends(get_rag_service)
 ):
     try:
-        return rag_service.chat(
+        return await rag_service.chat(
             question=request.question,
             tag=request.tag,
-            conversation_history=request.conversation_history
+            conversation_history=request.conversation_history,
+            conversation_id=request.conversation_id
         )
     except ValidationError as e:
         raise HTTPException(status_code=422, detail=str(e))
@@ -76,6 +183,50 @@ async def chat(
         logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/batch", response_model=BatchChatResponse, dependencies=[Depends(verify_token)])
+async def chat_batch(
+    request: BatchChatRequest,
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    """Answer many questions in one request (offline evaluation); a failed item does not fail the batch."""
+    try:
+        return await rag_service.chat_many(request.items, request.max_concurrency)
+    except RAGException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Chat batch error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _sse(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    # text/event-stream framing: one "event:" + "data:" block per event
+    async for event in events:
+        yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+@router.post("/chat/stream", dependencies=[Depends(verify_token)])
+async def chat_stream(
+    request: ChatRequest,
+    rag_service: RAGService = Depends(get_rag_service)
+):
+    """Server-sent events: `sources` first, then `delta` events with answer text, then `done` or `error`."""
+    try:
+        events = await rag_service.chat_stream(
+            question=request.question,
+            tag=request.tag,
+            conversation_history=request.conversation_history,
+            conversation_id=request.conversation_id
+        )
+    except RAGException as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+    except Exception as e:
+        logger.error(f"Chat stream error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        _sse(events),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/retrieve", response_model=SearchResponse, dependencies=[Depends(verify_token)])
 async def retrieve(
     request: SearchRequest,
@@ -97,10 +248,14 @@ async def retrieve(
 async def health(
     rag_service: RAGService = Depends(get_rag_service)
 ):
-    response = rag_service.health()
+    response = await rag_service.health()
     if response.status == "unhealthy":
         # Log the detailed component statuses
         logger.error(f"Health Check Failed. Components: {response.components}")
         raise HTTPException(status_code=503, detail="System unhealthy", headers={"X-Error": str(response.components)})
     return response
 
+@router.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(verify_token)])
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
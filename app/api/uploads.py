@@ -0,0 +1,155 @@
+import os
+import hashlib
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+from app.core.exceptions import ValidationError, PayloadTooLargeError
+
+# Room for multipart boundaries/headers and the small form fields sent next to the file; every
+# byte of the body counts against the file limit plus this, so parts and headers stay bounded too
+FORM_OVERHEAD_BYTES = 64 * 1024
+MAX_FIELD_BYTES = 4 * 1024
+
+@dataclass
+class SpooledUpload:
+    file_path: str
+    filename: str
+    size: int
+    sha256: str
+    fields: Dict[str, str] = field(default_factory=dict)
+
+class _UploadSpooler:
+    """
+    python-multipart callbacks that write the file part straight to disk,
+    hashing and counting bytes as they arrive. Nothing is buffered beyond one network chunk.
+    """
+    def __init__(self, file_field: str, upload_dir: str, max_bytes: int):
+        self.file_field = file_field
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.fields: Dict[str, str] = {}
+        self.file_path: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._file = None
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._part_name: Optional[str] = None
+        self._part_is_file = False
+        self._part_data = bytearray()
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+    def on_part_begin(self) -> None:
+        self._disposition = b""
+        self._part_name = None
+        self._part_is_file = False
+        self._part_data = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise ValidationError('Multipart part is missing a "name"')
+        self._part_name = options[b"name"].decode("utf-8", errors="replace")
+
+        if self._part_name == self.file_field:
+            if self._file is not None:
+                raise ValidationError("Only one file can be uploaded per request")
+            self.filename = options.get(b"filename", b"").decode("utf-8", errors="replace")
+            os.makedirs(self.upload_dir, exist_ok=True)
+            fd, self.file_path = tempfile.mkstemp(dir=self.upload_dir, suffix=".pdf")
+            self._file = os.fdopen(fd, "wb")
+            self._part_is_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        chunk = data[start:end]
+        if self._part_is_file:
+            self.size += len(chunk)
+            if self.size > self.max_bytes:
+                raise PayloadTooLargeError(f"File size exceeds limit of {self.max_bytes // (1024 * 1024)}MB")
+            self._hasher.update(chunk)
+            self._file.write(chunk)
+        else:
+            if len(self._part_data) + len(chunk) > MAX_FIELD_BYTES:
+                raise ValidationError(f"Form field '{self._part_name}' is too large")
+            self._part_data.extend(chunk)
+
+    def on_part_end(self) -> None:
+        if self._part_is_file:
+            self._file.close()
+        elif self._part_name is not None:
+            self.fields[self._part_name] = self._part_data.decode("utf-8", errors="replace")
+
+    def result(self) -> SpooledUpload:
+        if self.file_path is None:
+            raise ValidationError(f"Missing '{self.file_field}' file part")
+        return SpooledUpload(
+            file_path=self.file_path,
+            filename=os.path.basename(self.filename or "upload.pdf"),
+            size=self.size,
+            sha256=self._hasher.hexdigest(),
+            fields=self.fields
+        )
+
+    def discard(self) -> None:
+        if self._file is not None and not self._file.closed:
+            self._file.close()
+        if self.file_path and os.path.exists(self.file_path):
+            os.remove(self.file_path)
+
+async def spool_upload(request: Request, upload_dir: str, max_bytes: int, file_field: str = "file") -> SpooledUpload:
+    """
+    Stream a multipart/form-data request body to a file in `upload_dir`.
+    The SHA-256 is computed on the fly and the size limit is enforced before
+    the body is fully read (up front via Content-Length when the client sends it,
+    else on the bytes received). Parsing, hashing and disk writes run in the threadpool.
+    """
+    body_limit = max_bytes + FORM_OVERHEAD_BYTES
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > body_limit:
+        raise PayloadTooLargeError(f"File size exceeds limit of {max_bytes // (1024 * 1024)}MB")
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise ValidationError("Expected a multipart/form-data upload")
+
+    spooler = _UploadSpooler(file_field, upload_dir, max_bytes)
+    parser = MultipartParser(params[b"boundary"], spooler.callbacks())
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > body_limit:
+                raise PayloadTooLargeError(f"File size exceeds limit of {max_bytes // (1024 * 1024)}MB")
+            await run_in_threadpool(parser.write, chunk)
+        await run_in_threadpool(parser.finalize)
+        return spooler.result()
+    except Exception:
+        await run_in_threadpool(spooler.discard)
+        raise
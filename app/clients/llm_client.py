@@ -1,35 +1,84 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
-from typing import Optional
+from collections import deque
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
 from tenacity import retry, stop_after_attempt, wait_exponential
+import httpx
 import openai
 from loguru import logger
 from app.core.config import LLMConfig
 from app.core.exceptions import LLMError
+from app.core.metrics import metrics
+
+metrics.describe("rag_llm_wait_seconds", "Time LLM calls waited for a free upstream slot (LLM_MAX_CONCURRENCY)")
+metrics.describe("rag_llm_hedged_total", "LLM requests also sent to the next target because no first token arrived within the hedge delay")
+metrics.describe("rag_llm_fallback_total", "LLM requests sent to the next target because the previous one failed")
+metrics.describe("rag_llm_answered_total", "LLM requests answered, by target model")
+
+# First-token latencies kept for the hedge delay, and how many are needed before it replaces LLM_HEDGE_DELAY
+HEDGE_WINDOW = 500
+HEDGE_MIN_SAMPLES = 20
+HEDGE_QUANTILE = 0.95
 
 class LLMClient(ABC):
     @abstractmethod
-    def generate(self, prompt: str) -> str:
+    async def generate(self, prompt: str) -> str:
         """Generate text response from prompt."""
         pass
 
     @abstractmethod
-    def check_health(self) -> bool:
+    def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        """Generate a response from prompt, yielding text deltas as they are produced."""
+        pass
+
+    @abstractmethod
+    async def check_health(self) -> bool:
         """Check availability."""
         pass
 
+    async def aclose(self) -> None:
+        """Release pooled connections (on shutdown)."""
+        pass
+
 class OpenRouterClient(LLMClient):
+    """
+    Async OpenRouter client. Calls never block the event loop, so a process can hold hundreds
+    of chats waiting on the LLM; all of them share one pool of keep-alive connections, and at
+    most LLM_MAX_CONCURRENCY run upstream at once (the rest wait for a slot).
+    """
     def __init__(self, config: LLMConfig):
         self.config = config
-        self.client = openai.OpenAI(
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_connections
+            ),
+            timeout=httpx.Timeout(self.config.timeout, connect=10.0)
+        )
+        # Retries are ours (tenacity), not the SDK's, so attempts are not multiplied
+        self.client = openai.AsyncOpenAI(
             base_url=self.config.base_url,
-            api_key=self.config.api_key
+            api_key=self.config.api_key,
+            http_client=self.http_client,
+            max_retries=0
         )
         self.model = self.config.model
+        self._semaphore = asyncio.Semaphore(self.config.max_concurrency)
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[None]:
+        # Held for the whole call, retries included, so a failing upstream also sees back-pressure
+        started = time.perf_counter()
+        async with self._semaphore:
+            metrics.observe("rag_llm_wait_seconds", time.perf_counter() - started)
+            yield
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
-    def _make_request(self, prompt: str) -> str:
+    async def _make_request(self, prompt: str) -> str:
         try:
-            response = self.client.chat.completions.create(
+            response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=self.config.temperature,
@@ -45,17 +94,196 @@ class OpenRouterClient(LLMClient):
             logger.warning(f"OpenRouter attempt failed: {e}")
             raise e # Retry will catch this
 
-    def generate(self, prompt: str) -> str:
+    async def generate(self, prompt: str) -> str:
         try:
-            return self._make_request(prompt)
+            async with self._slot():
+                return await self._make_request(prompt)
         except Exception as e:
             logger.error(f"LLM Generation failed after retries: {e}")
             raise LLMError(f"OpenRouter API failed: {str(e)}")
 
-    def check_health(self) -> bool:
+    async def _create_stream(self, prompt: str):
+        return await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.config.temperature,
+            max_tokens=self.config.max_tokens,
+            stream=True,
+            extra_headers={
+                "HTTP-Referer": "http://localhost:8000",
+                "X-Title": "Corporate RAG Bot"
+            }
+        )
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=2, max=10))
+    async def _open_stream(self, prompt: str):
         try:
-            self.client.models.list()
+            return await self._create_stream(prompt)
+        except Exception as e:
+            logger.warning(f"OpenRouter stream attempt failed: {e}")
+            raise e
+
+    @staticmethod
+    async def _deltas(stream) -> AsyncIterator[str]:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        async with self._slot():
+            # Only opening the stream is retried: once deltas were sent, a retry would repeat them
+            try:
+                stream = await self._open_stream(prompt)
+            except Exception as e:
+                logger.error(f"LLM stream failed after retries: {e}")
+                raise LLMError(f"OpenRouter API failed: {str(e)}")
+            try:
+                async for text in self._deltas(stream):
+                    yield text
+            except Exception as e:
+                logger.error(f"LLM stream interrupted: {e}")
+                raise LLMError(f"OpenRouter stream interrupted: {str(e)}")
+            finally:
+                await stream.close()
+
+    async def check_health(self) -> bool:
+        try:
+            await self.client.models.list()
             return True
         except Exception as e:
             logger.error(f"OpenRouter health check failed: {e}")
             return False
+
+    async def aclose(self) -> None:
+        await self.http_client.aclose()
+
+
+class _Answer:
+    """A target's stream that has produced its first text; holds the target's slot until closed."""
+    def __init__(self, target: OpenRouterClient, first: str, deltas: AsyncIterator[str], stack: AsyncExitStack):
+        self.target = target
+        self.first = first
+        self.deltas = deltas
+        self.stack = stack
+
+    async def close(self) -> None:
+        await self.stack.aclose()
+
+class HedgedLLMClient(LLMClient):
+    """
+    Answers from an ordered list of OpenAI-compatible targets (LLM_MODEL, then
+    LLM_FALLBACK_TARGETS). Every call streams from the first target; if no text has arrived
+    after the hedge delay (the p95 of recent first-token latencies), the same prompt also goes
+    to the next target, and the first to produce text answers while the others are cancelled.
+    A target that fails hands over to the next one at once. Answers are never retried once
+    text has arrived, so a stream is not repeated.
+    """
+    def __init__(self, targets: List[OpenRouterClient], hedge_delay: float):
+        self.targets = targets
+        self.initial_hedge_delay = hedge_delay
+        self._first_token_seconds: deque = deque(maxlen=HEDGE_WINDOW)
+
+    def hedge_delay(self) -> float:
+        if len(self._first_token_seconds) < HEDGE_MIN_SAMPLES:
+            return self.initial_hedge_delay
+        latencies = sorted(self._first_token_seconds)
+        return latencies[min(int(len(latencies) * HEDGE_QUANTILE), len(latencies) - 1)]
+
+    async def _start(self, target: OpenRouterClient, prompt: str) -> _Answer:
+        stack = AsyncExitStack()
+        try:
+            await stack.enter_async_context(target._slot())
+            started = time.perf_counter()
+            stream = await target._create_stream(prompt)
+            stack.push_async_callback(stream.close)
+            deltas = target._deltas(stream)
+            stack.push_async_callback(deltas.aclose)
+            try:
+                first = await deltas.__anext__()
+            except StopAsyncIteration:
+                first = ""
+            self._first_token_seconds.append(time.perf_counter() - started)
+            return _Answer(target, first, deltas, stack)
+        except BaseException:
+            # Also on cancellation, when another target answered first
+            await stack.aclose()
+            raise
+
+    async def _race(self, prompt: str) -> _Answer:
+        delay = self.hedge_delay()
+        running: Dict[asyncio.Task, int] = {} # task -> index of its target
+        extras: List[_Answer] = [] # answers that lost by an instant
+        next_target = 0
+        last_error: Optional[BaseException] = None
+
+        def launch() -> None:
+            nonlocal next_target
+            running[asyncio.ensure_future(self._start(self.targets[next_target], prompt))] = next_target
+            next_target += 1
+
+        launch()
+        try:
+            while running:
+                more = next_target < len(self.targets)
+                done, _ = await asyncio.wait(running, timeout=delay if more else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.inc("rag_llm_hedged_total")
+                    launch()
+                    continue
+                answers = []
+                for task in sorted(done, key=running.get):
+                    index = running.pop(task)
+                    if task.exception() is None:
+                        answers.append(task.result())
+                    else:
+                        last_error = task.exception()
+                        logger.warning(f"LLM target {self.targets[index].model} failed: {last_error}")
+                if answers:
+                    # Targets that answered in the same instant as the preferred one are closed below
+                    extras.extend(answers[1:])
+                    metrics.inc("rag_llm_answered_total", model=answers[0].target.model)
+                    return answers[0]
+                if next_target < len(self.targets):
+                    metrics.inc("rag_llm_fallback_total")
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+            # Wait for the losers to stop, so their connections and slots are released before returning
+            outcomes = await asyncio.gather(*running, *(extra.close() for extra in extras), return_exceptions=True)
+            for outcome in outcomes:
+                if isinstance(outcome, _Answer):
+                    # Answered before the cancellation reached it
+                    await outcome.close()
+        raise LLMError(f"All LLM targets failed: {last_error}")
+
+    async def generate(self, prompt: str) -> str:
+        answer = await self._race(prompt)
+        try:
+            return answer.first + "".join([text async for text in answer.deltas])
+        except Exception as e:
+            logger.error(f"LLM answer from {answer.target.model} interrupted: {e}")
+            raise LLMError(f"LLM stream interrupted: {str(e)}")
+        finally:
+            await answer.close()
+
+    async def generate_stream(self, prompt: str) -> AsyncIterator[str]:
+        answer = await self._race(prompt)
+        try:
+            if answer.first:
+                yield answer.first
+            async for text in answer.deltas:
+                yield text
+        except Exception as e:
+            logger.error(f"LLM stream from {answer.target.model} interrupted: {e}")
+            raise LLMError(f"LLM stream interrupted: {str(e)}")
+        finally:
+            await answer.close()
+
+    async def check_health(self) -> bool:
+        # Healthy while any target can answer
+        return any(await asyncio.gather(*(target.check_health() for target in self.targets)))
+
+    async def aclose(self) -> None:
+        for target in self.targets:
+            await target.aclose()
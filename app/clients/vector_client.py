@@ -1,25 +1,88 @@
+import uuid
 from abc import ABC, abstractmethod
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
+from sqlalchemy import create_engine, insert, delete, update, select, bindparam, literal_column, text, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, aliased
 from langchain_postgres.vectorstores import PGVector
 from langchain_core.embeddings import Embeddings
 from app.core.config import DatabaseConfig
-from app.core.exceptions import RetrievalError
+from app.core.exceptions import DatabaseError, RetrievalError
+from app.data.database import Chunk, Document, IndexCollection, SessionLocal, engine as db_engine
 from loguru import logger
 
 class VectorStore(ABC):
+    # True when vectors are columns of the chunk rows: they are then written together with the
+    # chunks (ChunkRepository.create_batch) instead of through add_embeddings
+    embeds_in_chunks: bool = False
+
+    @abstractmethod
+    def similarity_search(
+        self,
+        query_vector: List[float],
+        k: int,
+        threshold: float,
+        tag: Optional[str] = None
+    ) -> List[Tuple[str, float, Dict]]:
+        """(text, similarity, metadata) of the k nearest vectors, optionally restricted to one tag."""
+        pass
+
+    @abstractmethod
+    def add_embeddings(
+        self,
+        vectors: List[List[float]],
+        texts: List[str],
+        metadata: List[dict],
+        ids: Optional[List[str]] = None,
+        session: Optional[Session] = None
+    ) -> None:
+        """
+        Store vectors. When `session` is given, rows are written through it
+        and committed together with the caller's transaction.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, ids: List[str], session: Optional[Session] = None) -> int:
+        pass
+
     @abstractmethod
-    def similarity_search(self, query_vector: List[float], k: int, threshold: float) -> List[Tuple[str, float, Dict]]:
-        # Modified signature to include metadata in return
+    def update_metadata(self, updates: Dict[str, dict], session: Optional[Session] = None) -> None:
+        """Merge the given keys into the metadata of each vector ({id: partial_metadata})."""
         pass
 
     @abstractmethod
-    def add_embeddings(self, vectors: List[List[float]], texts: List[str], metadata: List[dict]) -> None:
+    def reassign(self, updates: Dict[str, Tuple[str, dict]], session: Optional[Session] = None) -> None:
+        """Move vectors to new ids, merging keys into their metadata ({old_id: (new_id, partial_metadata)})."""
         pass
 
     @abstractmethod
-    def delete_by_document(self, document_id: int) -> int:
+    def delete_by_documents(self, document_ids: List[int], session: Optional[Session] = None) -> int:
+        """Delete every vector of the given documents. Returns the number of vectors removed."""
         pass
-        
+
+    def delete_by_document(self, document_id: int, session: Optional[Session] = None) -> int:
+        return self.delete_by_documents([document_id], session=session)
+
+    @abstractmethod
+    def for_collection(self, collection: IndexCollection) -> "VectorStore":
+        """The store bound to one index collection: searches and writes only touch its vectors."""
+        pass
+
+    def build_index(self) -> None:
+        """Build the bound collection's ANN index once its vectors are loaded (before it is swapped in)."""
+        pass
+
+    @abstractmethod
+    def drop_collection(self, batch_size: int = 5000) -> int:
+        """Remove the bound (retired) collection's vectors and index. Returns the number of vectors removed."""
+        pass
+
+    def check_schema(self) -> None:
+        """Raise if stored vectors cannot have the configured dimension (checked at startup)."""
+        pass
+
     @abstractmethod
     def check_health(self) -> bool:
         pass
@@ -31,35 +94,73 @@ class DummyEmbeddings(Embeddings):
     def embed_query(self, text: str) -> List[float]:
         raise NotImplementedError("VectorStore should operate on pre-computed vectors")
 
+# Vectors are deleted by document through a btree index on this expression (the GIN index LangChain
+# creates on cmetadata only serves containment queries)
+DOCUMENT_ID_EXPRESSION = "(cmetadata ->> 'document_id')"
+
 class PGVectorStore(VectorStore):
-    def __init__(self, config: DatabaseConfig, embedding_dimension: int = 384):
+    def __init__(
+        self,
+        config: DatabaseConfig,
+        embedding_dimension: int = 384,
+        collection_name: Optional[str] = None,
+        engine: Optional[Engine] = None
+    ):
         self.config = config
         self.connection_string = self.config.url
-        self.collection_name = self.config.pgvector_collection_name
+        self.collection_name = collection_name or self.config.pgvector_collection_name
         self.embedding_dimension = embedding_dimension
+        self._engine = engine
         self._vectorstore = None
+        self._collections: Dict[str, "PGVectorStore"] = {}
+
+    @property
+    def engine(self) -> Engine:
+        # Shared by the stores of every collection, so each does not open its own pool
+        if self._engine is None:
+            self._engine = create_engine(self.connection_string)
+        return self._engine
 
     @property
     def vectorstore(self):
         if self._vectorstore is None:
             try:
-                self._vectorstore = PGVector(
+                vectorstore = PGVector(
                     embeddings=DummyEmbeddings(),
                     collection_name=self.collection_name,
-                    connection=self.connection_string,
+                    connection=self.engine,
                     use_jsonb=True,
                 )
+                self._ensure_indexes(vectorstore)
+                self._vectorstore = vectorstore
             except Exception as e:
                 logger.error(f"Failed to initialize PGVector: {e}")
                 raise RetrievalError(f"Vector store init failed: {e}")
         return self._vectorstore
 
-    def similarity_search(self, query_vector: List[float], k: int, threshold: float) -> List[Tuple[str, float, Dict]]:
+    @staticmethod
+    def _ensure_indexes(vectorstore: PGVector) -> None:
+        # LangChain creates its tables lazily, so the index is created here rather than in setup_db.sql
+        table = vectorstore.EmbeddingStore.__tablename__
+        with vectorstore.session_maker() as session:
+            session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_document_id ON {table} ({DOCUMENT_ID_EXPRESSION})"
+            ))
+            session.commit()
+
+    def similarity_search(
+        self,
+        query_vector: List[float],
+        k: int,
+        threshold: float,
+        tag: Optional[str] = None
+    ) -> List[Tuple[str, float, Dict]]:
         try:
             # similarity_search_with_score_by_vector
             results = self.vectorstore.similarity_search_with_score_by_vector(
                 embedding=query_vector,
-                k=k
+                k=k,
+                filter={"tag": tag} if tag else None
             )
             # Filter and Format
             formatted = []
@@ -79,36 +180,142 @@ class PGVectorStore(VectorStore):
             logger.error(f"Vector search failed: {e}")
             raise RetrievalError(f"Vector search failed: {e}")
 
-    def add_embeddings(self, vectors: List[List[float]], texts: List[str], metadatas: List[dict]) -> None:
+    def add_embeddings(
+        self,
+        vectors: List[List[float]],
+        texts: List[str],
+        metadatas: List[dict],
+        ids: Optional[List[str]] = None,
+        session: Optional[Session] = None
+    ) -> None:
         try:
-            # PGVector add_embeddings takes texts and embeddings
-            self.vectorstore.add_embeddings(
-                texts=texts,
-                embeddings=vectors,
-                metadatas=metadatas
-            )
+            if session is None:
+                # PGVector add_embeddings takes texts and embeddings (and commits on its own)
+                self.vectorstore.add_embeddings(
+                    texts=texts,
+                    embeddings=vectors,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+                return
+
+            # Same-transaction path: bulk insert into LangChain's embedding table via the caller's session
+            collection = self.vectorstore.get_collection(session)
+            if not collection:
+                raise RetrievalError(f"Collection '{self.collection_name}' not found")
+            rows = [
+                {
+                    "id": ids[i] if ids else str(uuid.uuid4()),
+                    "collection_id": collection.uuid,
+                    "embedding": vectors[i],
+                    "document": texts[i],
+                    "cmetadata": metadatas[i] or {}
+                }
+                for i in range(len(texts))
+            ]
+            if rows:
+                session.execute(insert(self.vectorstore.EmbeddingStore), rows)
         except Exception as e:
             logger.error(f"Failed to add embeddings: {e}")
             raise RetrievalError(f"Failed to add embeddings: {e}")
 
-    def delete_by_document(self, document_id: int) -> int:
-        # LangChain PGVector doesn't have a direct "delete by metadata" easy method 
-        # normally exposed cleanly in all versions.
-        # But `delete` method accept ids.
-        # To delete by metadata, we might need to query IDs first?
-        # Or use the underlying driver.
-        # For MVP, we might skip implementation or try to fetch IDs to delete.
-        # Or we can write raw SQL if needed, but we wanted to avoid it.
-        # Actually langchain-postgres 0.0.1+ might support it.
-        # Leaving as placeholder or basic implementation if possible.
+    def delete(self, ids: List[str], session: Optional[Session] = None) -> int:
+        if not ids:
+            return 0
+        try:
+            if session is None:
+                self.vectorstore.delete(ids=ids)
+                return len(ids)
+            store = self.vectorstore.EmbeddingStore
+            result = session.execute(delete(store).where(store.id.in_(ids)))
+            return result.rowcount
+        except Exception as e:
+            logger.error(f"Failed to delete embeddings: {e}")
+            raise RetrievalError(f"Failed to delete embeddings: {e}")
+
+    def update_metadata(self, updates: Dict[str, dict], session: Optional[Session] = None) -> None:
+        self.reassign({vector_id: (vector_id, patch) for vector_id, patch in updates.items()}, session)
+
+    def reassign(self, updates: Dict[str, Tuple[str, dict]], session: Optional[Session] = None) -> None:
+        if not updates:
+            return
         try:
-            # This is hard with just PGVector interface without IDs.
-            # We implemented "chunk_id" in metadata though.
-            # But we don't know the chunk IDs here easily without querying.
-            # We can leave this as a TODO or implement naive: query all for doc_id, then delete.
-            return 0 
-        except Exception:
+            table = self.vectorstore.EmbeddingStore.__table__
+            # jsonb || patch keeps every other metadata key as is
+            stmt = table.update()\
+                .where(table.c.id == bindparam("vector_id"))\
+                .values(
+                    id=bindparam("new_vector_id"),
+                    cmetadata=table.c.cmetadata.op("||")(bindparam("patch", type_=JSONB))
+                )
+            params = [
+                {"vector_id": vector_id, "new_vector_id": new_id, "patch": patch}
+                for vector_id, (new_id, patch) in updates.items()
+            ]
+            if session is None:
+                with self.vectorstore.session_maker() as own_session:
+                    own_session.execute(stmt, params)
+                    own_session.commit()
+            else:
+                session.execute(stmt, params)
+        except Exception as e:
+            logger.error(f"Failed to update embeddings: {e}")
+            raise RetrievalError(f"Failed to update embeddings: {e}")
+
+    def delete_by_documents(self, document_ids: List[int], session: Optional[Session] = None) -> int:
+        if not document_ids:
             return 0
+        try:
+            values = [str(document_id) for document_id in document_ids]
+            if session is None:
+                with self.vectorstore.session_maker() as own_session:
+                    deleted = self._delete_documents(own_session, values)
+                    own_session.commit()
+                    return deleted
+            return self._delete_documents(session, values)
+        except Exception as e:
+            logger.error(f"Failed to delete document embeddings: {e}")
+            raise RetrievalError(f"Failed to delete document embeddings: {e}")
+
+    def _delete_documents(self, session: Session, document_ids: List[str]) -> int:
+        # Every index collection, so a deleted document leaves nothing behind in one being rebuilt
+        store = self.vectorstore.EmbeddingStore
+        collections = self.vectorstore.CollectionStore
+        names = select(func.coalesce(IndexCollection.name, self.config.pgvector_collection_name))
+        stmt = delete(store).where(
+            store.collection_id.in_(select(collections.uuid).where(collections.name.in_(names))),
+            literal_column(DOCUMENT_ID_EXPRESSION).in_(document_ids)
+        )
+        return session.execute(stmt).rowcount
+
+    def for_collection(self, collection: IndexCollection) -> "PGVectorStore":
+        name = collection.name or self.config.pgvector_collection_name
+        if name == self.collection_name:
+            return self
+        if name not in self._collections:
+            self._collections[name] = PGVectorStore(self.config, self.embedding_dimension, name, self.engine)
+        return self._collections[name]
+
+    def drop_collection(self, batch_size: int = 5000) -> int:
+        try:
+            store = self.vectorstore.EmbeddingStore
+            deleted = 0
+            with self.vectorstore.session_maker() as session:
+                collection = self.vectorstore.get_collection(session)
+                # Short batches keep locks and WAL bursts small while the service is under load
+                while collection:
+                    batch = select(store.id).where(store.collection_id == collection.uuid).limit(batch_size)
+                    count = session.execute(delete(store).where(store.id.in_(batch))).rowcount
+                    session.commit()
+                    deleted += count
+                    if count < batch_size:
+                        break
+            self.vectorstore.delete_collection()
+            self._vectorstore = None
+            return deleted
+        except Exception as e:
+            logger.error(f"Failed to drop vector collection '{self.collection_name}': {e}")
+            raise RetrievalError(f"Failed to drop vector collection: {e}")
 
     def check_health(self) -> bool:
         try:
@@ -118,3 +325,226 @@ class PGVectorStore(VectorStore):
         except Exception as e:
             logger.error(f"Health check Vector unexpected error: {e}")
             return False
+
+
+# hnsw.ef_search for tag-filtered searches: candidates per index scan (pgvector's default is 40, its maximum 1000)
+EF_SEARCH_MIN = 100
+EF_SEARCH_MAX = 1000
+
+class ChunkVectorStore(VectorStore):
+    """
+    Vectors stored in `chunks.embedding` (VECTOR_STORE_MODE=chunks).
+
+    Chunk text is not copied and metadata is not repeated per vector: tag, filename and page come
+    from the chunk row and its document, and vector ids are the chunk ids. New vectors are written
+    with the chunk rows themselves, so most methods here only serve re-assignment and clean-up.
+    """
+    embeds_in_chunks = True
+    # Whether the server's pgvector has iterative index scans; checked once
+    _iterative_scan: Optional[bool] = None
+
+    def __init__(self, config: DatabaseConfig, embedding_dimension: int = 384, collection_id: Optional[int] = None):
+        self.config = config
+        self.embedding_dimension = embedding_dimension
+        self.collection_id = collection_id
+        self._collections: Dict[int, "ChunkVectorStore"] = {}
+
+    def similarity_search(
+        self,
+        query_vector: List[float],
+        k: int,
+        threshold: float,
+        tag: Optional[str] = None
+    ) -> List[Tuple[str, float, Dict]]:
+        try:
+            distance = Chunk.embedding.cosine_distance(query_vector)
+            stmt = select(
+                Chunk.id, Chunk.text, Chunk.document_id, Chunk.page_number, Chunk.page_end, Chunk.token_count,
+                Chunk.start_offset, Chunk.end_offset, Document.tag, Document.filename, distance.label("distance")
+            )\
+                .join(Document, Chunk.document_id == Document.id)\
+                .where(Chunk.embedding.isnot(None))
+            if self.collection_id is not None:
+                # A constant, so the planner can use the collection's partial HNSW index
+                stmt = stmt.where(Chunk.collection_id == self.collection_id)
+            # ORDER BY distance LIMIT k is served by the collection's HNSW index on chunks.embedding
+            stmt = stmt.order_by(distance).limit(k)
+            with SessionLocal() as session:
+                if tag:
+                    rows = self._search_tag(session, stmt.where(Document.tag == tag), k)
+                else:
+                    rows = session.execute(stmt).all()
+
+            formatted = []
+            for row in rows:
+                similarity = 1 - row.distance
+                if similarity >= threshold:
+                    formatted.append((row.text, similarity, {
+                        "document_id": row.document_id,
+                        "chunk_id": row.id,
+                        "page_number": row.page_number,
+                        "page_end": row.page_end,
+                        "token_count": row.token_count,
+                        "start_offset": row.start_offset,
+                        "end_offset": row.end_offset,
+                        "tag": row.tag,
+                        "source": row.filename
+                    }))
+            return formatted
+        except Exception as e:
+            logger.error(f"Vector search failed: {e}")
+            raise RetrievalError(f"Vector search failed: {e}")
+
+    def _search_tag(self, session: Session, stmt, k: int) -> List:
+        """
+        The HNSW index hands back about `hnsw.ef_search` nearest chunks and the tag is filtered
+        after, so a tag holding a small share of the collection would get fewer than k. The scan
+        goes further (iterative index scans on pgvector >= 0.8), and falls back to an exact scan
+        when it still comes back short.
+        """
+        session.execute(text(f"SET LOCAL hnsw.ef_search = {min(max(k * 4, EF_SEARCH_MIN), EF_SEARCH_MAX)}"))
+        if self._supports_iterative_scan(session):
+            session.execute(text("SET LOCAL hnsw.iterative_scan = relaxed_order"))
+        rows = session.execute(stmt).all()
+        if len(rows) < k:
+            session.execute(text("SET LOCAL enable_indexscan = off"))
+            rows = session.execute(stmt).all()
+        # relaxed_order may return them slightly out of order
+        return sorted(rows, key=lambda row: row.distance)
+
+    def _supports_iterative_scan(self, session: Session) -> bool:
+        if ChunkVectorStore._iterative_scan is None:
+            ChunkVectorStore._iterative_scan = bool(session.execute(text(
+                "SELECT string_to_array(extversion, '.')::int[] >= ARRAY[0, 8] FROM pg_extension WHERE extname = 'vector'"
+            )).scalar())
+        return ChunkVectorStore._iterative_scan
+
+    def add_embeddings(
+        self,
+        vectors: List[List[float]],
+        texts: List[str],
+        metadatas: List[dict],
+        ids: Optional[List[str]] = None,
+        session: Optional[Session] = None
+    ) -> None:
+        # The chunk rows must already exist (their text is the document); only the vectors are set
+        if not vectors:
+            return
+        if not ids:
+            raise RetrievalError("Chunk vectors need the chunk ids")
+        table = Chunk.__table__
+        stmt = table.update().where(table.c.id == bindparam("chunk_id")).values(embedding=bindparam("vector"))
+        self._execute(stmt, [{"chunk_id": int(i), "vector": v} for i, v in zip(ids, vectors)], session)
+
+    def delete(self, ids: List[str], session: Optional[Session] = None) -> int:
+        if not ids:
+            return 0
+        stmt = update(Chunk)\
+            .where(Chunk.id.in_([int(i) for i in ids]), Chunk.embedding.isnot(None))\
+            .values(embedding=None)
+        return self._execute(stmt, None, session)
+
+    def update_metadata(self, updates: Dict[str, dict], session: Optional[Session] = None) -> None:
+        # Metadata is read from the chunk and document rows at query time
+        pass
+
+    def reassign(self, updates: Dict[str, Tuple[str, dict]], session: Optional[Session] = None) -> None:
+        if not updates:
+            return
+        source = aliased(Chunk)
+        table = Chunk.__table__
+        stmt = table.update()\
+            .where(table.c.id == bindparam("new_id"))\
+            .values(embedding=select(source.embedding).where(source.id == bindparam("old_id")).scalar_subquery())
+        params = [{"old_id": int(old_id), "new_id": int(new_id)} for old_id, (new_id, _) in updates.items()]
+        self._execute(stmt, params, session)
+
+    def delete_by_documents(self, document_ids: List[int], session: Optional[Session] = None) -> int:
+        if not document_ids:
+            return 0
+        stmt = update(Chunk)\
+            .where(Chunk.document_id.in_(document_ids), Chunk.embedding.isnot(None))\
+            .values(embedding=None)
+        return self._execute(stmt, None, session)
+
+    def for_collection(self, collection: IndexCollection) -> "ChunkVectorStore":
+        if collection.id == self.collection_id:
+            return self
+        if collection.id not in self._collections:
+            self._collections[collection.id] = ChunkVectorStore(self.config, self.embedding_dimension, collection.id)
+        return self._collections[collection.id]
+
+    def build_index(self) -> None:
+        if self.collection_id is None:
+            return
+        index = self._index_name()
+        # CONCURRENTLY: the table stays writable while the index is built (needs autocommit)
+        with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            try:
+                # Left invalid by an interrupted build; IF NOT EXISTS would keep it
+                invalid = connection.execute(text(
+                    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :name AND NOT i.indisvalid"
+                ), {"name": index}).first()
+                if invalid:
+                    connection.execute(text(f"DROP INDEX CONCURRENTLY {index}"))
+                connection.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON chunks "
+                    f"USING hnsw (embedding vector_cosine_ops) WHERE collection_id = {int(self.collection_id)}"
+                ))
+            except Exception as e:
+                # Do not leave an invalid index behind
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index}"))
+                logger.error(f"Failed to build vector index {index}: {e}")
+                raise RetrievalError(f"Failed to build vector index: {e}")
+
+    def drop_collection(self, batch_size: int = 5000) -> int:
+        # The vectors are columns of the collection's chunk rows, which are deleted with them
+        if self.collection_id is None:
+            return 0
+        with db_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {self._index_name()}"))
+        return 0
+
+    def _index_name(self) -> str:
+        return f"idx_chunks_embedding_{int(self.collection_id)}"
+
+    def check_schema(self) -> None:
+        try:
+            with SessionLocal() as session:
+                # pgvector keeps the dimension as the column's type modifier (-1 if unsized)
+                dimension = session.execute(text(
+                    "SELECT atttypmod FROM pg_attribute "
+                    "WHERE attrelid = to_regclass('chunks') AND attname = 'embedding' AND NOT attisdropped"
+                )).scalar()
+        except Exception as e:
+            # Unreachable for now: repositories and the health check report it
+            logger.warning(f"Could not check the chunks.embedding dimension: {e}")
+            return
+        if dimension is not None and dimension != self.embedding_dimension:
+            raise DatabaseError(
+                f"chunks.embedding holds vector({dimension}) but EMBEDDING_DIMENSION is {self.embedding_dimension}; "
+                f"set EMBEDDING_DIMENSION to match, or change the column type once its vectors are cleared"
+            )
+
+    def check_health(self) -> bool:
+        try:
+            with SessionLocal() as session:
+                session.execute(select(Chunk.id).where(Chunk.embedding.isnot(None)).limit(1))
+            return True
+        except Exception as e:
+            logger.error(f"Health check Vector unexpected error: {e}")
+            return False
+
+    def _execute(self, stmt, params: Optional[List[Dict]], session: Optional[Session]) -> int:
+        try:
+            if session is None:
+                with SessionLocal() as own_session:
+                    result = own_session.execute(stmt, params) if params is not None else own_session.execute(stmt)
+                    own_session.commit()
+            else:
+                result = session.execute(stmt, params) if params is not None else session.execute(stmt)
+            return result.rowcount
+        except Exception as e:
+            logger.error(f"Failed to update chunk vectors: {e}")
+            raise RetrievalError(f"Failed to update chunk vectors: {e}")
@@ -7,6 +7,11 @@ class DatabaseConfig(BaseSettings):
     url: str = Field(..., alias="DATABASE_URL", description="PostgreSQL connection string")
     pgvector_collection_name: str = Field("corporate_documents", alias="PGVECTOR_COLLECTION_NAME")
     pgvector_distance_strategy: str = Field("cosine", alias="PGVECTOR_DISTANCE_STRATEGY")
+    # Where vectors live: "langchain" (LangChain's embedding table) or "chunks" (chunks.embedding,
+    # so chunk text and metadata are stored once; see scripts/migrate_vector_storage.py)
+    vector_store_mode: str = Field("langchain", alias="VECTOR_STORE_MODE")
+    # Seconds requests may keep serving the previously active index collection after a swap
+    active_collection_ttl: float = Field(2.0, alias="ACTIVE_COLLECTION_TTL")
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -22,6 +27,30 @@ class LLMConfig(BaseSettings):
     temperature: float = Field(0.3, alias="LLM_TEMPERATURE")
     max_tokens: int = Field(300, alias="LLM_MAX_TOKENS")
     timeout: int = 60
+    # Upstream calls in flight at once per process; further chats wait for a slot
+    max_concurrency: int = Field(64, alias="LLM_MAX_CONCURRENCY")
+    # Size of the shared keep-alive connection pool
+    max_connections: int = Field(100, alias="LLM_MAX_CONNECTIONS")
+    # HuggingFace tokenizer of LLM_MODEL, used to budget prompts (empty: estimate from text length)
+    tokenizer: str = Field("", alias="LLM_TOKENIZER")
+    # Tokens the model accepts, prompt and answer (LLM_MAX_TOKENS) together
+    context_window: int = Field(131072, alias="LLM_CONTEXT_WINDOW")
+    # Further OpenAI-compatible targets tried after this one, in order: comma-separated
+    # "model" or "model@base_url" (without a base URL, OPENROUTER_BASE_URL)
+    fallback_targets: str = Field("", alias="LLM_FALLBACK_TARGETS")
+    # API keys of the fallback targets, in the same order; an empty entry uses OPENROUTER_API_KEY
+    fallback_api_keys: str = Field("", alias="LLM_FALLBACK_API_KEYS")
+    # Seconds without a first token before the next target is also asked, until enough
+    # latencies have been observed to use their p95 instead
+    hedge_delay: float = Field(2.0, alias="LLM_HEDGE_DELAY")
+    # Circuit breaker: after LLM_CIRCUIT_MIN_CALLS of the last LLM_CIRCUIT_WINDOW calls, a failure
+    # share of LLM_CIRCUIT_FAILURE_RATE opens it; chats then get retrieval-only answers without
+    # calling the LLM for LLM_CIRCUIT_OPEN_SECONDS, after which one trial call is let through
+    circuit_breaker: bool = Field(True, alias="LLM_CIRCUIT_BREAKER")
+    circuit_failure_rate: float = Field(0.5, alias="LLM_CIRCUIT_FAILURE_RATE")
+    circuit_window: int = Field(20, alias="LLM_CIRCUIT_WINDOW")
+    circuit_min_calls: int = Field(5, alias="LLM_CIRCUIT_MIN_CALLS")
+    circuit_open_seconds: float = Field(30.0, alias="LLM_CIRCUIT_OPEN_SECONDS")
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -30,6 +59,20 @@ class LLMConfig(BaseSettings):
         frozen=True
     )
 
+    def fallback_configs(self) -> List["LLMConfig"]:
+        """One config per LLM_FALLBACK_TARGETS entry, otherwise identical to this one."""
+        targets = [target.strip() for target in self.fallback_targets.split(",") if target.strip()]
+        keys = [key.strip() for key in self.fallback_api_keys.split(",")]
+        configs = []
+        for i, target in enumerate(targets):
+            model, _, base_url = target.partition("@")
+            configs.append(self.model_copy(update={
+                "model": model,
+                "base_url": base_url or self.base_url,
+                "api_key": (keys[i] if i < len(keys) else "") or self.api_key
+            }))
+        return configs
+
 class EmbeddingConfig(BaseSettings):
     model: str = Field("sentence-transformers/all-MiniLM-L6-v2", alias="EMBEDDING_MODEL")
     dimension: int = Field(384, alias="EMBEDDING_DIMENSION")
@@ -46,6 +89,21 @@ class RetrievalConfig(BaseSettings):
     similarity_threshold: float = Field(0.6, alias="SIMILARITY_THRESHOLD")
     top_k: int = Field(5, alias="DEFAULT_TOP_K")
     max_context_tokens: int = Field(6000, alias="MAX_CONTEXT_TOKENS")
+    # Concurrent /chat requests with the same question, tag and history share one answer
+    chat_coalescing: bool = Field(True, alias="CHAT_COALESCING")
+    # /chat/batch: questions per request, and generations in flight at once per request (below
+    # LLM_MAX_CONCURRENCY, so an evaluation run leaves room for interactive chats)
+    chat_batch_max_items: int = Field(200, alias="CHAT_BATCH_MAX_ITEMS")
+    chat_batch_concurrency: int = Field(8, alias="CHAT_BATCH_CONCURRENCY")
+    # Extractive compression: keep only the retrieved sentences closest to the question
+    context_compression: bool = Field(False, alias="CONTEXT_COMPRESSION")
+    compression_max_tokens: int = Field(1500, alias="COMPRESSION_MAX_TOKENS")
+    compression_neighbours: int = Field(1, alias="COMPRESSION_NEIGHBOURS") # sentences kept on each side of a match
+    # Server-side chat sessions: messages kept verbatim (older ones are summarized), how close a
+    # follow-up must be to the last searched question to reuse its results, and idle lifetime
+    session_recent_messages: int = Field(4, alias="SESSION_RECENT_MESSAGES")
+    session_reuse_similarity: float = Field(0.85, alias="SESSION_REUSE_SIMILARITY")
+    session_ttl_hours: float = Field(168.0, alias="SESSION_TTL_HOURS")
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -57,8 +115,34 @@ class RetrievalConfig(BaseSettings):
 class IngestionConfig(BaseSettings):
     chunk_size: int = 1000
     chunk_overlap: int = 200
-    max_file_size_mb: int = Field(10, alias="MAX_FILE_SIZE_MB")
+    # Unit of chunk_size/chunk_overlap: "chars", or "tokens" of the embedding model's tokenizer
+    chunk_length_unit: str = Field("chars", alias="CHUNK_LENGTH_UNIT")
+    max_file_size_mb: int = Field(200, alias="MAX_FILE_SIZE_MB")
     allowed_tags: str = Field("HR,Legal,Finance", alias="ALLOWED_TAGS")
+    upload_dir: str = Field("data/uploads", alias="INGEST_UPLOAD_DIR")
+    worker_count: int = Field(2, alias="INGEST_WORKERS")
+    job_poll_interval: float = Field(1.0, alias="INGEST_JOB_POLL_INTERVAL")
+    job_stale_after_seconds: int = Field(600, alias="INGEST_JOB_STALE_AFTER_SECONDS")
+    job_max_attempts: int = Field(3, alias="INGEST_JOB_MAX_ATTEMPTS")
+    pdf_extract_workers: int = Field(0, alias="PDF_EXTRACT_WORKERS") # 0 = one per CPU core
+    pdf_pages_per_task: int = Field(16, alias="PDF_PAGES_PER_TASK")
+    pdf_parallel_min_pages: int = Field(32, alias="PDF_PARALLEL_MIN_PAGES")
+    # Large-document mode: files of at least this size are extracted in page windows, releasing
+    # parsed PDF objects after each window
+    large_pdf_min_mb: int = Field(8, alias="LARGE_PDF_MIN_MB")
+    large_pdf_window_pages: int = Field(16, alias="LARGE_PDF_WINDOW_PAGES")
+    # RSS of the process and its extraction workers (0 = none): extraction slows down while it is
+    # exceeded, and a document still over it one page at a time fails after the wait
+    rss_budget_mb: int = Field(2048, alias="INGEST_RSS_BUDGET_MB")
+    rss_wait_seconds: float = Field(30.0, alias="INGEST_RSS_WAIT_SECONDS")
+    # Streaming ingestion: chunks per embedding call, and how many batches a stage may run ahead
+    pipeline_batch_chunks: int = Field(64, alias="INGEST_PIPELINE_BATCH_CHUNKS")
+    pipeline_depth: int = Field(4, alias="INGEST_PIPELINE_DEPTH")
+    # Near-duplicate chunks (within the same tag): off | skip (drop them) | link (store without a vector)
+    dedup_mode: str = Field("link", alias="DEDUP_MODE")
+    # Bits of 64. Candidates are found by LSH over 4 bands (simhash.BAND_COUNT): a chunk within d
+    # bits matches a stored one on some band only while d < 4, so larger distances are refused
+    dedup_max_distance: int = Field(3, ge=0, le=3, alias="DEDUP_MAX_HAMMING_DISTANCE")
 
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -72,6 +156,16 @@ class IngestionConfig(BaseSettings):
     def max_file_size_bytes(self) -> int:
         return self.max_file_size_mb * 1024 * 1024
 
+    @computed_field
+    @property
+    def large_pdf_min_bytes(self) -> int:
+        return self.large_pdf_min_mb * 1024 * 1024
+
+    @computed_field
+    @property
+    def rss_budget_bytes(self) -> int:
+        return self.rss_budget_mb * 1024 * 1024
+
     @computed_field
     @property
     def allowed_tags_list(self) -> List[str]:
@@ -27,3 +27,11 @@ class DatabaseError(RAGException):
 class ValidationError(RAGException):
     def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
         super().__init__(message, status_code=422, error_code="VALIDATION_ERROR", details=details)
+
+class NotFoundError(RAGException):
+    def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(message, status_code=404, error_code="NOT_FOUND", details=details)
+
+class PayloadTooLargeError(RAGException):
+    def __init__(self, message: str, details: Optional[Dict[str, Any]] = None):
+        super().__init__(message, status_code=413, error_code="PAYLOAD_TOO_LARGE", details=details)
@@ -0,0 +1,74 @@
+import threading
+from typing import Dict, List, Tuple
+
+# Sorted (label, value) pairs identifying one series of a metric
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class MetricsRegistry:
+    """
+    Process-wide counters and summaries (count + sum), rendered in the Prometheus text format
+    at GET /metrics. Each process has its own registry: a standalone scripts/ingest_worker.py
+    does not report here.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelKey, List[float]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            count_sum = self._summaries.setdefault(name, {}).setdefault(key, [0, 0.0])
+            count_sum[0] += 1
+            count_sum[1] += value
+
+    def get(self, name: str, **labels: str) -> float:
+        """Current value of a counter, or the sum of a summary (0 if never recorded)."""
+        key = self._key(labels)
+        with self._lock:
+            if name in self._summaries:
+                return self._summaries[name].get(key, [0, 0.0])[1]
+            return self._counters.get(name, {}).get(key, 0.0)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                self._header(lines, name, "counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{self._labels(key)} {value}")
+            for name in sorted(self._summaries):
+                self._header(lines, name, "summary")
+                for key, (count, total) in sorted(self._summaries[name].items()):
+                    lines.append(f"{name}_count{self._labels(key)} {count}")
+                    lines.append(f"{name}_sum{self._labels(key)} {total}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    @staticmethod
+    def _key(labels: Dict[str, str]) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def _labels(key: LabelKey) -> str:
+        if not key:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in key)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
+
+# Global instance, like `settings`
+metrics = MetricsRegistry()
@@ -26,29 +26,45 @@ class SearchResult(BaseModel):
     page_number: int
     document_name: str
     document_id: Optional[int] = None
+    # Internal, not part of API responses:
+    # LLM tokens in `text`, counted at ingest (None if not counted); used for prompt budgeting
+    token_count: Optional[int] = Field(None, exclude=True)
+    # The chunk and its [start_offset, end_offset) in the document text; used to merge overlapping results
+    chunk_id: Optional[int] = Field(None, exclude=True)
+    start_offset: Optional[int] = Field(None, exclude=True)
+    end_offset: Optional[int] = Field(None, exclude=True)
+    # Last page the text reaches when it spans pages (None: page_number)
+    page_end: Optional[int] = Field(None, exclude=True)
 
-# --- API Request Schemas ---
+    @property
+    def pages(self) -> str:
+        """Page label for citations: "3", or "3-4" for text spanning pages."""
+        if self.page_end is None or self.page_end <= self.page_number:
+            return str(self.page_number)
+        return f"{self.page_number}-{self.page_end}"
 
-class IngestRequest(BaseModel):
-    # Field "file" described as file upload representation. 
-    # Current implementation passes base64 string. 
-    # We will accept base64_content and alias it or use it directly.
-    # To strictly follow instructions: "file: File upload representation"
-    # But usually this means Multipart/Form-Data if not base64.
-    # Given the constraint to not break things, we stick to base64 for JSON body.
-    filename: str
-    tag: str
-    uploaded_by: str # Email
-    base64_content: str = Field(..., description="Base64 encoded file content")
+# --- API Request Schemas ---
 
 class ChatRequest(BaseModel):
     question: str = Field(..., alias="query") # Alias to support existing 'query' key if needed, or map it.
     # Actually, current main.py expects 'query'. User asks for 'question'.
     # We will use 'question'. API layer will handle mapping if needed.
     conversation_history: Optional[List[Dict[str, str]]] = []
+    # Continue a server-side conversation (created on first use); conversation_history is then ignored
+    conversation_id: Optional[str] = Field(None, min_length=1, max_length=64)
     max_tokens: Optional[int] = None
     tag: str # Context tag (HR, etc) - Added based on main.py usage need throughout.
 
+class BatchChatItem(BaseModel):
+    question: str = Field(..., alias="query")
+    tag: str
+    conversation_history: Optional[List[Dict[str, str]]] = []
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem] = Field(..., min_length=1)
+    # Generations in flight at once; at most CHAT_BATCH_CONCURRENCY
+    max_concurrency: Optional[int] = Field(None, ge=1)
+
 class SearchRequest(BaseModel):
     query: str
     top_k: Optional[int] = None
@@ -57,6 +73,18 @@ class SearchRequest(BaseModel):
 
 # --- API Response Schemas ---
 
+class IngestTimings(BaseModel):
+    total_ms: float
+    # Busy time per stage (validate, hash, extract, split, dedup, embed, count_tokens, db_write, vector_write).
+    # Pipelined stages overlap, so they can add up to more than total_ms.
+    stages_ms: Dict[str, float]
+    file_bytes: int
+    pages: int
+    chunks: int
+    chunks_embedded: int
+    pages_per_second: float
+    chunks_per_second: float
+
 class IngestResponse(BaseModel):
     document_id: int
     filename: str
@@ -65,11 +93,50 @@ class IngestResponse(BaseModel):
     pages_ingested: int
     tag: Optional[str] = None
     uploaded_by: Optional[str] = None
+    # Set when a new version of an existing document was ingested incrementally
+    version: Optional[int] = None
+    pages_changed: Optional[int] = None
+    chunks_reused: Optional[int] = None
+    chunks_deleted: Optional[int] = None
+    chunks_deduplicated: Optional[int] = None # near-duplicates linked to (or skipped for) an existing chunk
+    timings: Optional[IngestTimings] = None
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    status: str # queued, running, succeeded, failed
+    mode: str = "create" # create, update, rechunk
+    stage: str
+    progress: float = 0.0
+    filename: str
+    tag: Optional[str] = None
+    uploaded_by: Optional[str] = None
+    document_id: Optional[int] = None
+    error: Optional[str] = None
+    result: Optional[IngestResponse] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class DeleteResponse(BaseModel):
+    document_ids: List[int]
+    documents_deleted: int
+    chunks_deleted: int
+    vectors_deleted: int
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[str]
     confidence: Optional[float] = None
+    conversation_id: Optional[str] = None
+
+class BatchChatResult(ChatResponse):
+    # The item's own time: its share of the batched embedding, its retrieval and its generation
+    # (not the wait for a generation slot)
+    latency_ms: float
+    error: Optional[str] = None
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult] # in request order
+    total_ms: float
 
 class SearchResponse(BaseModel):
     results: List[SearchResult]
@@ -1,5 +1,8 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, func
-from sqlalchemy.orm import sessionmaker, relationship, Session, declarative_base
+import uuid
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, LargeBinary, ForeignKey, DateTime, Float, UniqueConstraint, PrimaryKeyConstraint, func
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import sessionmaker, relationship, deferred, Session, declarative_base
+from pgvector.sqlalchemy import Vector
 from contextlib import contextmanager
 from app.core.config import settings
 from app.core.exceptions import DatabaseError
@@ -25,23 +28,128 @@ class Document(Base):
     tag = Column(String(50), nullable=False, index=True)
     uploaded_by = Column(String(100), nullable=False)
     page_count = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False, default=1)
     created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     chunks = relationship("Chunk", back_populates="document", cascade="all, delete-orphan")
+    pages = relationship("DocumentPage", back_populates="document", cascade="all, delete-orphan")
+
+class DocumentPage(Base):
+    """
+    Per-page content hash of the current revision, used to diff new versions, and the page's
+    extracted text (zlib), so the document can be re-chunked without parsing the PDF again.
+    """
+    __tablename__ = "document_pages"
+    __table_args__ = (UniqueConstraint("document_id", "page_number"),)
+
+    id = Column(Integer, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False, index=True)
+    page_number = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    # NULL for pages ingested before page text was stored; deferred so hash lookups never load it
+    text_compressed = deferred(Column(LargeBinary, nullable=True))
+
+    document = relationship("Document", back_populates="pages")
+
+class IndexCollection(Base):
+    """
+    One complete set of chunks and vectors, built with given chunk settings and embedding model.
+    Exactly one collection is active: it is searched and new documents are ingested into it.
+    scripts/rebuild_index.py fills a 'building' collection from the stored page text while the
+    active one keeps serving, then swaps them in one transaction and retires the old one.
+    """
+    __tablename__ = "index_collections"
+
+    id = Column(Integer, primary_key=True)
+    # LangChain collection holding the vectors; NULL = PGVECTOR_COLLECTION_NAME
+    name = Column(String(100), unique=True, nullable=True)
+    status = Column(String(20), nullable=False, default="building", index=True) # building, active, retired
+    # Settings the collection was built with; NULL = the configured value
+    chunk_size = Column(Integer, nullable=True)
+    chunk_overlap = Column(Integer, nullable=True)
+    chunk_length_unit = Column(String(20), nullable=True)
+    embedding_model = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    activated_at = Column(DateTime, nullable=True)
+    retired_at = Column(DateTime, nullable=True)
+
+class CollectionDocument(Base):
+    """Revision (document_hash) of each document a building collection holds, so a rebuild can catch up."""
+    __tablename__ = "index_collection_documents"
+    __table_args__ = (PrimaryKeyConstraint("collection_id", "document_id"),)
+
+    collection_id = Column(Integer, ForeignKey("index_collections.id", ondelete="CASCADE"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    document_hash = Column(String(64), nullable=False)
 
 class Chunk(Base):
     __tablename__ = "chunks"
 
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.id"))
-    page_number = Column(Integer, nullable=False)
+    # Index collection the chunk belongs to; a document has one set of chunks per collection
+    collection_id = Column(Integer, ForeignKey("index_collections.id", ondelete="CASCADE"), nullable=True, index=True)
+    page_number = Column(Integer, nullable=False) # page the chunk starts on
+    page_end = Column(Integer, nullable=True)     # page the chunk ends on (chunks may span pages)
+    # [start_offset, end_offset) of the text in the document (pages joined by a blank line)
+    start_offset = Column(Integer, nullable=True)
+    end_offset = Column(Integer, nullable=True)
     text = Column(Text, nullable=False)
+    content_hash = Column(String(64), nullable=True) # SHA-256 of text; NULL for rows ingested before hashing
+    token_count = Column(Integer, nullable=True) # LLM tokens in text (LLM_TOKENIZER, else estimated); NULL if not counted
+    # Near-duplicate detection: 64-bit SimHash plus its four 16-bit LSH bands (see app/utils/simhash.py)
+    simhash = Column(BigInteger, nullable=True)
+    simhash_band0 = Column(Integer, nullable=True, index=True)
+    simhash_band1 = Column(Integer, nullable=True, index=True)
+    simhash_band2 = Column(Integer, nullable=True, index=True)
+    simhash_band3 = Column(Integer, nullable=True, index=True)
+    # Set when this chunk is a near-duplicate: it has no vector of its own and is served by the canonical one
+    canonical_chunk_id = Column(Integer, ForeignKey("chunks.id", ondelete="SET NULL"), nullable=True, index=True)
+    # Vector of a canonical chunk when VECTOR_STORE_MODE=chunks; deferred so ordinary chunk queries never load it
+    embedding = deferred(Column(Vector(settings.embedding.dimension), nullable=True))
     # Added created_at to match user request "created_at (timestamp)" in Chunk model desc
     # Though original didn't have it clearly shown in model, typically chunks created same time as doc.
     created_at = Column(DateTime, default=func.now()) 
 
     document = relationship("Document", back_populates="chunks")
 
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(UUID(as_uuid=False), primary_key=True, default=lambda: str(uuid.uuid4()))
+    status = Column(String(20), nullable=False, default="queued", index=True) # queued, running, succeeded, failed
+    mode = Column(String(20), nullable=False, default="create") # create, update (new version of document_id), rechunk
+    stage = Column(String(50), nullable=False, default="queued")
+    progress = Column(Float, nullable=False, default=0.0)
+    filename = Column(String(255), nullable=False)
+    tag = Column(String(50), nullable=False)
+    uploaded_by = Column(String(100), nullable=False)
+    file_path = Column(String(1024), nullable=True) # spooled upload; NULL for rechunk jobs
+    document_hash = Column(String(64), nullable=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="SET NULL"), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    result = Column(JSONB, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+class ChatSession(Base):
+    """Server-side state of a conversation, keyed by the client's conversation id."""
+    __tablename__ = "chat_sessions"
+
+    id = Column(String(64), primary_key=True)
+    tag = Column(String(50), nullable=False)
+    summary = Column(Text, nullable=False, default="") # rolling summary of the messages no longer kept
+    messages = Column(JSONB, nullable=False, default=list) # latest messages, [{"role": ..., "content": ...}]
+    query_vector = Column(JSONB, nullable=True) # embedding of the question the candidates were searched for
+    candidates = Column(JSONB, nullable=False, default=list) # last retrieved results
+    turns = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), index=True)
+
 def get_db_session() -> Session:
     return SessionLocal()
 
@@ -1,7 +1,9 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List, Optional, Dict
-from app.data.database import Document, Chunk
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import text, or_, and_, insert, update, delete, select, bindparam, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from typing import List, Optional, Dict, Any, Set, Tuple
+from app.data.database import Document, DocumentPage, Chunk, IngestionJob, IndexCollection, CollectionDocument, ChatSession
 from app.core.exceptions import DatabaseError
 from loguru import logger
 
@@ -31,12 +33,93 @@ class DocumentRepository:
     def get_by_hash(self, document_hash: str) -> Optional[Document]:
         return self.session.query(Document).filter(Document.document_hash == document_hash).first()
 
+    def get_existing_hashes(self, document_hashes: List[str]) -> Set[str]:
+        """Return the subset of `document_hashes` already stored, in one query."""
+        if not document_hashes:
+            return set()
+        rows = self.session.query(Document.document_hash)\
+            .filter(Document.document_hash.in_(document_hashes))\
+            .all()
+        return {row[0] for row in rows}
+
+    def update(self, document_id: int, values: Dict[str, Any]) -> None:
+        try:
+            self.session.query(Document)\
+                .filter(Document.id == document_id)\
+                .update(values, synchronize_session=False)
+            self.session.flush()
+        except Exception as e:
+            logger.error(f"Failed to update document: {e}")
+            raise DatabaseError(f"Failed to update document: {e}")
+
+    def get_page_hashes(self, document_id: int) -> Dict[int, str]:
+        rows = self.session.query(DocumentPage.page_number, DocumentPage.content_hash)\
+            .filter(DocumentPage.document_id == document_id)\
+            .all()
+        return {page_number: content_hash for page_number, content_hash in rows}
+
+    def get_page_texts(self, document_id: int) -> List[Tuple[int, Optional[bytes]]]:
+        """(page_number, compressed text) of the current revision in page order; text is None if never stored."""
+        rows = self.session.query(DocumentPage.page_number, DocumentPage.text_compressed)\
+            .filter(DocumentPage.document_id == document_id)\
+            .order_by(DocumentPage.page_number)\
+            .all()
+        return [(page_number, text_compressed) for page_number, text_compressed in rows]
+
+    def replace_pages(
+        self,
+        document_id: int,
+        page_hashes: List[Tuple[int, str]],
+        page_texts: Optional[Dict[int, bytes]] = None
+    ) -> None:
+        """
+        Store the (page_number, content_hash) list of the document's current revision, with the
+        compressed text of each page from `page_texts`. Does not commit.
+        """
+        page_texts = page_texts or {}
+        try:
+            self.session.query(DocumentPage)\
+                .filter(DocumentPage.document_id == document_id)\
+                .delete(synchronize_session=False)
+            if page_hashes:
+                self.session.execute(insert(DocumentPage), [
+                    {
+                        "document_id": document_id,
+                        "page_number": page_number,
+                        "content_hash": content_hash,
+                        "text_compressed": page_texts.get(page_number)
+                    }
+                    for page_number, content_hash in page_hashes
+                ])
+            self.session.flush()
+        except Exception as e:
+            logger.error(f"Failed to store document pages: {e}")
+            raise DatabaseError(f"Failed to store document pages: {e}")
+
     def list_all(self, tag: Optional[str] = None) -> List[Document]:
         query = self.session.query(Document)
         if tag and tag != "*":
              query = query.filter(Document.tag == tag)
         return query.all()
 
+    def get_ids_by_tag(self, tag: str) -> List[int]:
+        rows = self.session.query(Document.id).filter(Document.tag == tag).order_by(Document.id).all()
+        return [row[0] for row in rows]
+
+    def delete_many(self, document_ids: List[int]) -> int:
+        """Bulk delete documents (their pages cascade in the database). Does not commit."""
+        if not document_ids:
+            return 0
+        try:
+            result = self.session.query(Document)\
+                .filter(Document.id.in_(document_ids))\
+                .delete(synchronize_session=False)
+            self.session.flush()
+            return result
+        except Exception as e:
+            logger.error(f"Failed to delete documents: {e}")
+            raise DatabaseError(f"Failed to delete documents: {e}")
+
     def delete(self, document_id: int) -> bool:
         try:
             doc = self.get_by_id(document_id)
@@ -50,31 +133,74 @@ class DocumentRepository:
             raise DatabaseError(f"Failed to delete document: {e}")
 
 class ChunkRepository:
-    def __init__(self, session: Session):
+    """
+    Chunks of one index collection (`collection_id`); None reads and writes chunks of any
+    collection, which only scripts working below the collections should use.
+    """
+    def __init__(self, session: Session, collection_id: Optional[int] = None):
         self.session = session
+        self.collection_id = collection_id
 
-    def create_batch(self, chunks_data: List[Dict]) -> List[Chunk]:
+    def create_batch(self, chunks_data: List[Dict]) -> List[int]:
+        """
+        Bulk insert chunks with multi-row INSERT ... RETURNING id.
+        Returns the new ids in the same order as `chunks_data`. Does not commit.
+        """
+        if not chunks_data:
+            return []
+        self._lock_collection()
         try:
-            chunks = []
-            for item in chunks_data:
-                chunk = Chunk(
-                    document_id=item['document_id'],
-                    page_number=item['page_number'],
-                    text=item['text']
-                )
-                self.session.add(chunk)
-                chunks.append(chunk)
-            self.session.flush()
-            return chunks
+            rows = [
+                {
+                    "document_id": item['document_id'],
+                    "collection_id": self.collection_id,
+                    "page_number": item['page_number'],
+                    "page_end": item.get('page_end'),
+                    "start_offset": item.get('start_offset'),
+                    "end_offset": item.get('end_offset'),
+                    "text": item['text'],
+                    "content_hash": item.get('content_hash'),
+                    "token_count": item.get('token_count'),
+                    "simhash": item.get('simhash'),
+                    "simhash_band0": item.get('simhash_bands', [None] * 4)[0],
+                    "simhash_band1": item.get('simhash_bands', [None] * 4)[1],
+                    "simhash_band2": item.get('simhash_bands', [None] * 4)[2],
+                    "simhash_band3": item.get('simhash_bands', [None] * 4)[3],
+                    "canonical_chunk_id": item.get('canonical_chunk_id'),
+                    # Only set when vectors are stored on the chunk rows (VECTOR_STORE_MODE=chunks)
+                    **({"embedding": item['embedding']} if 'embedding' in item else {})
+                }
+                for item in chunks_data
+            ]
+            stmt = insert(Chunk).returning(Chunk.id, sort_by_parameter_order=True)
+            return list(self.session.scalars(stmt, rows))
         except Exception as e:
             logger.error(f"Failed to create chunks batch: {e}")
             raise DatabaseError(f"Failed to create chunks batch: {e}")
 
     def get_by_document(self, document_id: int) -> List[Chunk]:
-        return self.session.query(Chunk)\
+        return self._scoped(self.session.query(Chunk))\
             .filter(Chunk.document_id == document_id)\
-            .order_by(Chunk.page_number)\
+            .order_by(Chunk.page_number, Chunk.id)\
+            .all()
+
+    def get_offsets(self, chunk_ids: List[int]) -> Dict[int, Tuple[Optional[int], Optional[int], Optional[int]]]:
+        """(start_offset, end_offset, page_end) in their document of each of `chunk_ids` that exists."""
+        if not chunk_ids:
+            return {}
+        rows = self.session.query(Chunk.id, Chunk.start_offset, Chunk.end_offset, Chunk.page_end)\
+            .filter(Chunk.id.in_(chunk_ids))\
             .all()
+        return {chunk_id: (start, end, page_end) for chunk_id, start, end, page_end in rows}
+
+    def sample_texts(self, limit: int) -> List[str]:
+        """Texts of up to `limit` canonical chunks spread over the collection (used as warm-up queries)."""
+        rows = self._scoped(self.session.query(Chunk.text))\
+            .filter(Chunk.canonical_chunk_id.is_(None))\
+            .order_by(func.random())\
+            .limit(limit)\
+            .all()
+        return [row[0] for row in rows]
 
     def search_by_text(self, query: str, limit: int = 5, tag: Optional[str] = None) -> List[Chunk]:
         try:
@@ -83,7 +209,8 @@ class ChunkRepository:
             term = query if query else ""
             search_pattern = f"%{term}%"
             
-            q = self.session.query(Chunk).join(Document)
+            # Near-duplicates are represented by their canonical chunk
+            q = self._scoped(self.session.query(Chunk)).join(Document).filter(Chunk.canonical_chunk_id.is_(None))
             
             if tag and tag.strip():
                  q = q.filter(Document.tag == tag)
@@ -95,13 +222,395 @@ class ChunkRepository:
             logger.error(f"Keyword search failed: {e}")
             raise DatabaseError(f"Keyword search failed: {e}")
 
-    def delete_by_document(self, document_id: int) -> int:
+    def find_simhash_candidates(
+        self,
+        tag: str,
+        bands: List[List[int]],
+        exclude_ids: Optional[List[int]] = None
+    ) -> List[Tuple[int, int]]:
+        """
+        LSH lookup: (id, simhash) of canonical chunks in `tag` documents that share at least
+        one band value with the query signatures. `bands[i]` holds the band-i values to match.
+        """
+        if not any(bands):
+            return []
+        try:
+            band_columns = [Chunk.simhash_band0, Chunk.simhash_band1, Chunk.simhash_band2, Chunk.simhash_band3]
+            q = self._scoped(self.session.query(Chunk.id, Chunk.simhash))\
+                .join(Document)\
+                .filter(Document.tag == tag)\
+                .filter(Chunk.canonical_chunk_id.is_(None))\
+                .filter(or_(*[column.in_(values) for column, values in zip(band_columns, bands) if values]))
+            if exclude_ids:
+                q = q.filter(Chunk.id.notin_(exclude_ids))
+            return [(chunk_id, signature) for chunk_id, signature in q.all()]
+        except Exception as e:
+            logger.error(f"Near-duplicate lookup failed: {e}")
+            raise DatabaseError(f"Near-duplicate lookup failed: {e}")
+
+    def get_linked(self, canonical_ids: List[int]) -> List[Chunk]:
+        """Near-duplicate chunks that point at any of `canonical_ids`, oldest first."""
+        if not canonical_ids:
+            return []
+        return self.session.query(Chunk)\
+            .filter(Chunk.canonical_chunk_id.in_(canonical_ids))\
+            .order_by(Chunk.id)\
+            .all()
+
+    def get_linked_from_documents(self, document_ids: List[int]) -> List[Chunk]:
+        """Near-duplicate chunks of other documents whose canonical chunk belongs to `document_ids`, oldest first."""
+        if not document_ids:
+            return []
+        canonical = aliased(Chunk)
+        return self.session.query(Chunk)\
+            .join(canonical, Chunk.canonical_chunk_id == canonical.id)\
+            .filter(canonical.document_id.in_(document_ids), Chunk.document_id.notin_(document_ids))\
+            .order_by(Chunk.id)\
+            .all()
+
+    def relink(self, canonical_ids: Dict[int, Optional[int]]) -> None:
+        """Point chunks at a new canonical chunk ({chunk_id: canonical_chunk_id or None}). Does not commit."""
+        if not canonical_ids:
+            return
+        try:
+            stmt = update(Chunk.__table__)\
+                .where(Chunk.__table__.c.id == bindparam("chunk_id"))\
+                .values(canonical_chunk_id=bindparam("new_canonical_id"))
+            self.session.execute(stmt, [
+                {"chunk_id": chunk_id, "new_canonical_id": canonical_id}
+                for chunk_id, canonical_id in canonical_ids.items()
+            ])
+        except Exception as e:
+            logger.error(f"Failed to relink chunks: {e}")
+            raise DatabaseError(f"Failed to relink chunks: {e}")
+
+    def update_positions(self, positions: Dict[int, Dict]) -> None:
+        """
+        Move existing chunks within a new revision of their document
+        ({chunk_id: {page_number, page_end, start_offset, end_offset}}). Does not commit.
+        """
+        if not positions:
+            return
+        try:
+            stmt = update(Chunk.__table__)\
+                .where(Chunk.__table__.c.id == bindparam("chunk_id"))\
+                .values(
+                    page_number=bindparam("new_page_number"),
+                    page_end=bindparam("new_page_end"),
+                    start_offset=bindparam("new_start_offset"),
+                    end_offset=bindparam("new_end_offset")
+                )
+            self.session.execute(stmt, [
+                {
+                    "chunk_id": chunk_id,
+                    "new_page_number": position["page_number"],
+                    "new_page_end": position["page_end"],
+                    "new_start_offset": position["start_offset"],
+                    "new_end_offset": position["end_offset"]
+                }
+                for chunk_id, position in positions.items()
+            ])
+        except Exception as e:
+            logger.error(f"Failed to update chunk positions: {e}")
+            raise DatabaseError(f"Failed to update chunk positions: {e}")
+
+    def delete_by_ids(self, chunk_ids: List[int]) -> int:
+        if not chunk_ids:
+            return 0
         try:
             result = self.session.query(Chunk)\
-                .filter(Chunk.document_id == document_id)\
+                .filter(Chunk.id.in_(chunk_ids))\
                 .delete(synchronize_session=False)
             self.session.flush()
             return result
         except Exception as e:
             logger.error(f"Failed to delete chunks: {e}")
             raise DatabaseError(f"Failed to delete chunks: {e}")
+
+    def delete_by_documents(self, document_ids: List[int]) -> int:
+        """Delete the documents' chunks in every collection, so none outlive them in a collection being built."""
+        if not document_ids:
+            return 0
+        try:
+            result = self.session.query(Chunk)\
+                .filter(Chunk.document_id.in_(document_ids))\
+                .delete(synchronize_session=False)
+            self.session.flush()
+            return result
+        except Exception as e:
+            logger.error(f"Failed to delete chunks: {e}")
+            raise DatabaseError(f"Failed to delete chunks: {e}")
+
+    def _scoped(self, query):
+        if self.collection_id is None:
+            return query
+        return query.filter(Chunk.collection_id == self.collection_id)
+
+    def _lock_collection(self) -> None:
+        """
+        Share-lock the collection row until the caller's transaction ends, so a swap waits for
+        in-flight writes; writing into a collection that was swapped out in the meantime fails.
+        """
+        if self.collection_id is None:
+            return
+        status = self.session.execute(
+            select(IndexCollection.status)
+            .where(IndexCollection.id == self.collection_id)
+            .with_for_update(read=True)
+        ).scalar()
+        if status not in ("active", "building"):
+            raise DatabaseError(f"Index collection {self.collection_id} is no longer active; retry the ingestion")
+
+class CollectionRepository:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def get_active(self, lock: bool = False) -> IndexCollection:
+        """
+        The collection being served. With `lock`, it is share-locked until the transaction ends,
+        so a swap waits for the caller to commit (ingestion writes take this lock).
+        """
+        query = self.session.query(IndexCollection).filter(IndexCollection.status == "active")
+        if lock:
+            query = query.with_for_update(read=True)
+        for _ in range(3):
+            collection = query.first()
+            if collection is not None:
+                return collection
+            if not lock:
+                break
+            # Waited on a swap: the locked row was retired meanwhile, and the next query sees its successor
+        raise DatabaseError("No active index collection (run scripts/init_db.py)")
+
+    def get_by_id(self, collection_id: int) -> Optional[IndexCollection]:
+        return self.session.query(IndexCollection).filter(IndexCollection.id == collection_id).first()
+
+    def get_building(self) -> Optional[IndexCollection]:
+        """The most recent collection still being built (an interrupted rebuild to resume)."""
+        return self.session.query(IndexCollection)\
+            .filter(IndexCollection.status == "building")\
+            .order_by(IndexCollection.id.desc())\
+            .first()
+
+    def list_retired(self) -> List[IndexCollection]:
+        return self.session.query(IndexCollection)\
+            .filter(IndexCollection.status == "retired")\
+            .order_by(IndexCollection.id)\
+            .all()
+
+    def create(
+        self,
+        name: str,
+        chunk_size: int,
+        chunk_overlap: int,
+        chunk_length_unit: str,
+        embedding_model: str
+    ) -> IndexCollection:
+        try:
+            collection = IndexCollection(
+                name=name,
+                status="building",
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                chunk_length_unit=chunk_length_unit,
+                embedding_model=embedding_model
+            )
+            self.session.add(collection)
+            self.session.flush()
+            return collection
+        except Exception as e:
+            logger.error(f"Failed to create index collection: {e}")
+            raise DatabaseError(f"Failed to create index collection: {e}")
+
+    def get_pending_documents(self, collection_id: int) -> List[Tuple[int, str]]:
+        """(id, document_hash) of documents whose current revision the collection does not hold yet."""
+        built = select(CollectionDocument.document_id).where(
+            CollectionDocument.collection_id == collection_id,
+            CollectionDocument.document_id == Document.id,
+            CollectionDocument.document_hash == Document.document_hash
+        )
+        rows = self.session.query(Document.id, Document.document_hash)\
+            .filter(~built.exists())\
+            .order_by(Document.id)\
+            .all()
+        return [(document_id, document_hash) for document_id, document_hash in rows]
+
+    def mark_built(self, collection_id: int, document_id: int, document_hash: str) -> None:
+        """Record the revision of a document the collection now holds. Does not commit."""
+        try:
+            stmt = pg_insert(CollectionDocument).values(
+                collection_id=collection_id, document_id=document_id, document_hash=document_hash
+            )
+            self.session.execute(stmt.on_conflict_do_update(
+                index_elements=[CollectionDocument.collection_id, CollectionDocument.document_id],
+                set_={"document_hash": stmt.excluded.document_hash}
+            ))
+        except Exception as e:
+            logger.error(f"Failed to record collection document: {e}")
+            raise DatabaseError(f"Failed to record collection document: {e}")
+
+    def activate(self, collection_id: int) -> Optional[int]:
+        """
+        Retire the active collection and activate `collection_id`. Blocks until ingestion
+        transactions holding the active collection's share lock have finished. Does not commit,
+        so the caller can still check that nothing was ingested meanwhile. Returns the retired id.
+        """
+        try:
+            now = datetime.now()
+            previous = self.session.execute(
+                update(IndexCollection)
+                .where(IndexCollection.status == "active")
+                .values(status="retired", retired_at=now)
+                .returning(IndexCollection.id)
+            ).scalar()
+            self.session.execute(
+                update(IndexCollection)
+                .where(IndexCollection.id == collection_id)
+                .values(status="active", activated_at=now, retired_at=None)
+            )
+            return previous
+        except Exception as e:
+            logger.error(f"Failed to activate index collection: {e}")
+            raise DatabaseError(f"Failed to activate index collection: {e}")
+
+    def delete_chunks(self, collection_id: int, batch_size: int) -> int:
+        """Delete up to `batch_size` chunks of a collection. Does not commit."""
+        try:
+            batch = select(Chunk.id).where(Chunk.collection_id == collection_id).limit(batch_size)
+            return self.session.execute(delete(Chunk).where(Chunk.id.in_(batch))).rowcount
+        except Exception as e:
+            logger.error(f"Failed to delete collection chunks: {e}")
+            raise DatabaseError(f"Failed to delete collection chunks: {e}")
+
+    def delete(self, collection_id: int) -> None:
+        """Delete a collection row (its remaining chunks cascade). Does not commit."""
+        try:
+            self.session.execute(delete(IndexCollection).where(IndexCollection.id == collection_id))
+        except Exception as e:
+            logger.error(f"Failed to delete index collection: {e}")
+            raise DatabaseError(f"Failed to delete index collection: {e}")
+
+class JobRepository:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def create(
+        self,
+        filename: str,
+        tag: str,
+        uploaded_by: str,
+        file_path: Optional[str],
+        document_hash: Optional[str] = None,
+        mode: str = "create",
+        document_id: Optional[int] = None
+    ) -> IngestionJob:
+        try:
+            job = IngestionJob(
+                filename=filename,
+                tag=tag,
+                uploaded_by=uploaded_by,
+                file_path=file_path,
+                document_hash=document_hash,
+                mode=mode,
+                document_id=document_id
+            )
+            self.session.add(job)
+            self.session.flush()
+            return job
+        except Exception as e:
+            logger.error(f"Failed to create ingestion job: {e}")
+            raise DatabaseError(f"Failed to create ingestion job: {e}")
+
+    def get_by_id(self, job_id: str) -> Optional[IngestionJob]:
+        return self.session.query(IngestionJob).filter(IngestionJob.id == job_id).first()
+
+    def claim_next(self, stale_after_seconds: int) -> Optional[IngestionJob]:
+        """
+        Lock the oldest runnable job and mark it running.
+        Jobs stuck in 'running' past the stale window (e.g. after a crash/restart) are picked up again.
+        SKIP LOCKED lets several workers or processes poll the same table safely.
+        """
+        try:
+            stale_before = datetime.now() - timedelta(seconds=stale_after_seconds)
+            job = self.session.query(IngestionJob)\
+                .filter(or_(
+                    IngestionJob.status == "queued",
+                    and_(IngestionJob.status == "running", IngestionJob.updated_at < stale_before)
+                ))\
+                .order_by(IngestionJob.created_at)\
+                .with_for_update(skip_locked=True)\
+                .first()
+            if job:
+                job.status = "running"
+                job.stage = "starting"
+                job.progress = 0.0
+                job.attempts = (job.attempts or 0) + 1
+                job.started_at = datetime.now()
+                job.updated_at = datetime.now()
+                self.session.flush()
+            return job
+        except Exception as e:
+            logger.error(f"Failed to claim ingestion job: {e}")
+            raise DatabaseError(f"Failed to claim ingestion job: {e}")
+
+    def update_progress(self, job_id: str, stage: str, progress: float) -> None:
+        try:
+            self.session.query(IngestionJob)\
+                .filter(IngestionJob.id == job_id)\
+                .update({"stage": stage, "progress": progress, "updated_at": datetime.now()}, synchronize_session=False)
+            self.session.flush()
+        except Exception as e:
+            logger.error(f"Failed to update ingestion job: {e}")
+            raise DatabaseError(f"Failed to update ingestion job: {e}")
+
+    def mark_succeeded(self, job_id: str, document_id: int, result: Dict[str, Any]) -> None:
+        self._finish(job_id, {
+            "status": "succeeded",
+            "stage": "done",
+            "progress": 1.0,
+            "document_id": document_id,
+            "result": result,
+            "error": None
+        })
+
+    def mark_failed(self, job_id: str, error: str) -> None:
+        self._finish(job_id, {"status": "failed", "stage": "failed", "error": error})
+
+    def _finish(self, job_id: str, values: Dict[str, Any]) -> None:
+        values["finished_at"] = datetime.now()
+        self._update(job_id, values)
+
+    def _update(self, job_id: str, values: Dict[str, Any]) -> None:
+        try:
+            values["updated_at"] = datetime.now()
+            self.session.query(IngestionJob)\
+                .filter(IngestionJob.id == job_id)\
+                .update(values, synchronize_session=False)
+            self.session.flush()
+        except Exception as e:
+            logger.error(f"Failed to update ingestion job: {e}")
+            raise DatabaseError(f"Failed to update ingestion job: {e}")
+
+class ChatSessionRepository:
+    def __init__(self, session: Session):
+        self.session = session
+
+    def get(self, conversation_id: str) -> Optional[ChatSession]:
+        return self.session.get(ChatSession, conversation_id)
+
+    def save(self, conversation_id: str, values: Dict[str, Any]) -> None:
+        """Insert the session or overwrite it (the last turn to finish wins)."""
+        try:
+            values = {**values, "updated_at": datetime.now()}
+            stmt = pg_insert(ChatSession).values(id=conversation_id, **values)
+            self.session.execute(stmt.on_conflict_do_update(index_elements=[ChatSession.id], set_=values))
+            self.session.flush()
+        except Exception as e:
+            logger.error(f"Failed to save chat session: {e}")
+            raise DatabaseError(f"Failed to save chat session: {e}")
+
+    def delete_idle(self, idle_seconds: float) -> int:
+        """Delete sessions not used for `idle_seconds`. Returns how many."""
+        cutoff = datetime.now() - timedelta(seconds=idle_seconds)
+        result = self.session.execute(delete(ChatSession).where(ChatSession.updated_at < cutoff))
+        return result.rowcount
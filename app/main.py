@@ -9,7 +9,7 @@ from loguru import logger
 from app.core.config import settings
 from app.core.exceptions import RAGException
 from app.api.routes import router as api_router
-from app.api.dependencies import get_embedding_client
+from app.api.dependencies import get_embedding_client, get_ingestion_worker, get_pdf_extractor, get_llm_client, get_token_counter, get_vector_store
 
 # --- Logging Configuration ---
 # Configure loguru to write to file with rotation and retention
@@ -106,15 +106,27 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"Embedding model pre-load warning (non-fatal): {e}")
 
-    # 2. Database Check?
-    # Repositories check on first use.
-    # We could add explicit check here but HealthService covers it.
+    # LLM tokenizer for prompt budgeting (falls back to estimating if it cannot be loaded)
+    get_token_counter(settings)
+
+    # 2. Database Check: repositories check connectivity on first use (and HealthService reports it),
+    # but stored vectors of the wrong dimension would only fail at the first write, so refuse to start
+    get_vector_store(settings).check_schema()
+
+    # 3. Background ingestion workers (jobs are persisted, so pending ones resume here)
+    try:
+        get_ingestion_worker().start()
+    except Exception as e:
+        logger.error(f"Failed to start ingestion workers: {e}")
     
     logger.info("Application ready to serve requests.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Application shutdown initiated.")
+    get_ingestion_worker().stop()
+    get_pdf_extractor(settings).shutdown()
+    await get_llm_client(settings).aclose()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,224 @@
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from sqlalchemy.orm import Session
+from app.core.config import AppConfig
+from app.core.exceptions import IngestionError, NotFoundError, ValidationError
+from app.data.database import IndexCollection
+from app.data.repositories import CollectionRepository
+from app.services.ingestion_service import IngestionService
+from loguru import logger
+
+@dataclass
+class BuildStats:
+    documents_built: int = 0
+    chunks_created: int = 0
+    chunks_reused: int = 0
+    failed: Dict[int, str] = field(default_factory=dict) # document id -> error
+
+class IndexRebuildService:
+    """
+    Blue/green rebuild of the search index.
+
+    A new collection is filled next to the active one (which keeps serving), from the page text
+    stored with every document, so no PDF is parsed again. Its ANN index is built and warmed
+    before the active pointer is swapped in a single transaction; requests pick it up within
+    ACTIVE_COLLECTION_TTL seconds. The retired collection is dropped later.
+    Each document is built in its own transaction and recorded with the revision it was built
+    from, so an interrupted rebuild resumes where it stopped and documents ingested or updated
+    meanwhile are caught up before the swap.
+    """
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        service_factory: Callable[[Session, IndexCollection], IngestionService],
+        config: AppConfig
+    ):
+        self.session_factory = session_factory
+        self.service_factory = service_factory
+        self.config = config
+
+    def start(self, name: Optional[str] = None, resume: bool = True) -> int:
+        """
+        Create a collection with the configured chunking and embedding model, or return the
+        unfinished one with `resume`. Returns its id.
+        """
+        session = self.session_factory()
+        try:
+            repo = CollectionRepository(session)
+            building = repo.get_building() if resume else None
+            if building is not None:
+                logger.info(f"Resuming build of index collection {building.id} ({building.name})")
+                return building.id
+            name = name or f"{self.config.database.pgvector_collection_name}_{datetime.now():%Y%m%d%H%M%S}"
+            collection = repo.create(
+                name,
+                chunk_size=self.config.ingestion.chunk_size,
+                chunk_overlap=self.config.ingestion.chunk_overlap,
+                chunk_length_unit=self.config.ingestion.chunk_length_unit,
+                embedding_model=self.config.embedding.model
+            )
+            session.commit()
+            logger.info(f"Created index collection {collection.id} ({name})")
+            return collection.id
+        finally:
+            session.close()
+
+    def build(self, collection_id: int, progress: Optional[Callable[[int, int], None]] = None) -> BuildStats:
+        """
+        Bring the collection up to date with every document, until nothing is pending. Documents
+        that fail are reported in the stats instead of stopping the build.
+        """
+        stats = BuildStats()
+        while True:
+            session = self.session_factory()
+            try:
+                self._get_building(CollectionRepository(session), collection_id)
+                pending = [
+                    (document_id, document_hash)
+                    for document_id, document_hash in CollectionRepository(session).get_pending_documents(collection_id)
+                    if document_id not in stats.failed
+                ]
+            finally:
+                session.close()
+            if not pending:
+                return stats
+
+            for document_id, document_hash in pending:
+                self._build_document(collection_id, document_id, document_hash, stats)
+                if progress:
+                    progress(stats.documents_built + len(stats.failed), len(pending))
+
+    def build_index(self, collection_id: int) -> None:
+        def run(service: IngestionService) -> None:
+            # A concurrent index build waits for every open transaction, this session's included
+            service.chunk_repo.session.rollback()
+            service.vector_store.build_index()
+        self._with_service(collection_id, run)
+
+    def warm(self, collection_id: int, queries: int, k: int = 5) -> int:
+        """
+        Run searches against the new collection before it serves traffic, so its index pages
+        are in the buffer cache at the swap. Queries are sampled from the collection's own chunks.
+        """
+        def run(service: IngestionService) -> int:
+            texts = service.chunk_repo.sample_texts(queries)
+            if not texts:
+                return 0
+            for vector in service.embedding_client.embed_batch(texts):
+                service.vector_store.similarity_search(vector, k, 0.0)
+            return len(texts)
+        return self._with_service(collection_id, run)
+
+    def swap(self, collection_id: int, max_attempts: int = 5) -> Optional[int]:
+        """
+        Make the collection the active one. Documents ingested during the build are caught up
+        first; the final check runs inside the swap transaction, after in-flight ingestion has
+        committed, and the swap is retried if it still finds something pending.
+        Returns the id of the retired collection.
+        """
+        for attempt in range(1, max_attempts + 1):
+            stats = self.build(collection_id)
+            if stats.failed:
+                raise IngestionError(
+                    f"{len(stats.failed)} document(s) could not be rebuilt; not swapping",
+                    details={"failed": stats.failed}
+                )
+            session = self.session_factory()
+            try:
+                repo = CollectionRepository(session)
+                self._get_building(repo, collection_id)
+                previous = repo.activate(collection_id)
+                if not repo.get_pending_documents(collection_id):
+                    session.commit()
+                    logger.info(f"Index collection {collection_id} is now active (retired {previous})")
+                    return previous
+                session.rollback()
+                logger.info(f"Documents arrived during the swap; catching up (attempt {attempt})")
+            finally:
+                session.close()
+        raise IngestionError(f"Index collection {collection_id} could not catch up with ingestion after {max_attempts} attempts")
+
+    def collect(self, collection_id: int, batch_size: int = 5000) -> int:
+        """Delete a retired (or abandoned) collection with its vectors and chunks. Returns chunks deleted."""
+        session = self.session_factory()
+        try:
+            repo = CollectionRepository(session)
+            collection = repo.get_by_id(collection_id)
+            if collection is None:
+                raise NotFoundError(f"Index collection {collection_id} not found")
+            if collection.status == "active":
+                raise ValidationError(f"Index collection {collection_id} is active")
+            service = self.service_factory(session, collection)
+            # Drop the vectors (and the collection's ANN index) first so chunk deletes do not maintain it
+            service.vector_store.drop_collection(batch_size)
+            deleted = 0
+            while True:
+                count = repo.delete_chunks(collection_id, batch_size)
+                session.commit()
+                deleted += count
+                if count < batch_size:
+                    break
+            repo.delete(collection_id)
+            session.commit()
+            logger.info(f"Deleted index collection {collection_id} ({deleted} chunks)")
+            return deleted
+        finally:
+            session.close()
+
+    def collect_retired(self, grace_seconds: float = 0.0, batch_size: int = 5000) -> int:
+        """
+        Delete every retired collection. Waits `grace_seconds` first so requests that resolved
+        the old collection just before the swap can finish. Returns the number deleted.
+        """
+        session = self.session_factory()
+        try:
+            retired = [collection.id for collection in CollectionRepository(session).list_retired()]
+        finally:
+            session.close()
+        if retired and grace_seconds > 0:
+            logger.info(f"Waiting {grace_seconds:.0f}s before deleting retired collections {retired}")
+            time.sleep(grace_seconds)
+        for collection_id in retired:
+            self.collect(collection_id, batch_size)
+        return len(retired)
+
+    def _build_document(self, collection_id: int, document_id: int, document_hash: str, stats: BuildStats) -> None:
+        session = self.session_factory()
+        try:
+            repo = CollectionRepository(session)
+            service = self.service_factory(session, self._get_building(repo, collection_id))
+            result = service.rechunk_document(document_id)
+            # Recorded with the hash read before the build: an update meanwhile leaves it pending
+            repo.mark_built(collection_id, document_id, document_hash)
+            session.commit()
+            stats.documents_built += 1
+            stats.chunks_created += result.chunks_created
+            stats.chunks_reused += result.chunks_reused
+        except NotFoundError:
+            # Deleted since it was listed
+            session.rollback()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Could not rebuild document {document_id}: {e}")
+            stats.failed[document_id] = str(e)
+        finally:
+            session.close()
+
+    def _with_service(self, collection_id: int, func: Callable[[IngestionService], object]):
+        session = self.session_factory()
+        try:
+            collection = self._get_building(CollectionRepository(session), collection_id)
+            return func(self.service_factory(session, collection))
+        finally:
+            session.close()
+
+    @staticmethod
+    def _get_building(repo: CollectionRepository, collection_id: int) -> IndexCollection:
+        collection = repo.get_by_id(collection_id)
+        if collection is None:
+            raise NotFoundError(f"Index collection {collection_id} not found")
+        if collection.status != "building":
+            raise ValidationError(f"Index collection {collection_id} is {collection.status}, not building")
+        return collection
@@ -0,0 +1,114 @@
+from typing import Dict, List, Set, Tuple
+import numpy as np
+from app.clients.embedding_client import EmbeddingClient
+from app.core.config import RetrievalConfig
+from app.core.metrics import metrics
+from app.core.schemas import SearchResult
+from app.utils.text_splitter import split_sentences
+from app.utils.token_counter import TokenCounter
+from loguru import logger
+
+metrics.describe("rag_context_compression_ratio", "Context tokens kept by extractive compression, as a fraction of those retrieved")
+
+# Marks text left out between two kept runs of sentences
+GAP_MARKER = " ... "
+
+class CompressionService:
+    """
+    Extractive compression of retrieved context before the prompt is built. Chunks are split
+    into sentences, which are embedded together with the question in one batch and ranked by
+    cosine similarity; the best sentences are kept with their neighbours, in their original
+    order, up to COMPRESSION_MAX_TOKENS. Every chunk keeps at least its best sentence while the
+    budget allows, so no source loses its citation.
+    """
+    def __init__(self, embedding_client: EmbeddingClient, token_counter: TokenCounter, config: RetrievalConfig):
+        self.embedding_client = embedding_client
+        self.token_counter = token_counter
+        self.config = config
+
+    def compress(self, question: str, results: List[SearchResult]) -> List[SearchResult]:
+        budget = self.config.compression_max_tokens
+        retrieved = sum(self.token_counter.fill([res.token_count for res in results], [res.text for res in results]))
+        if retrieved <= budget:
+            return results
+
+        # (result index, [start, end) in its text) of every sentence
+        sentences: List[Tuple[int, Tuple[int, int]]] = [
+            (i, span) for i, res in enumerate(results) for span in split_sentences(res.text)
+        ]
+        if not sentences:
+            return results
+        texts = [results[i].text[start:end] for i, (start, end) in sentences]
+        try:
+            vectors = np.asarray(self.embedding_client.embed_batch([question] + texts), dtype=np.float32)
+        except Exception as e:
+            # Compression only saves tokens; answer from the full chunks instead
+            logger.warning(f"Context compression skipped: {e}")
+            return results
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        scores = vectors[1:] @ vectors[0]
+        # Counted up to the next sentence of the chunk: a run of kept sentences includes the text between them
+        ends = [
+            sentences[s + 1][1][0] if s + 1 < len(sentences) and sentences[s + 1][0] == i else end
+            for s, (i, (_, end)) in enumerate(sentences)
+        ]
+        tokens = self.token_counter.count_batch([
+            results[i].text[start:ends[s]] for s, (i, (start, _)) in enumerate(sentences)
+        ])
+
+        kept = self._select(sentences, scores, tokens, budget)
+        compressed = self._assemble(results, sentences, kept)
+        metrics.observe("rag_context_compression_ratio", sum(tokens[s] for s in kept) / max(retrieved, 1))
+        return compressed
+
+    def _select(self, sentences: List[Tuple[int, Tuple[int, int]]], scores: np.ndarray, tokens: List[int], budget: int) -> Set[int]:
+        """Indices (into `sentences`) to keep."""
+        ranked = [int(s) for s in np.argsort(-scores, kind="stable")]
+        # The best sentence of each chunk goes first, then the rest by score
+        best: Dict[int, int] = {}
+        for s in ranked:
+            best.setdefault(sentences[s][0], s)
+        seeds = set(best.values())
+        order = list(best.values()) + [s for s in ranked if s not in seeds]
+
+        radius = self.config.compression_neighbours
+        # Each group may open a new run, separated from the previous one by a gap marker
+        gap_tokens = self.token_counter.count(GAP_MARKER)
+        kept: Set[int] = set()
+        spent = 0
+        for s in order:
+            if s in kept:
+                continue
+            # Neighbours from the same chunk, for the context a sentence often needs to make sense
+            group = [
+                n for n in range(s - radius, s + radius + 1)
+                if 0 <= n < len(sentences) and sentences[n][0] == sentences[s][0] and n not in kept
+            ]
+            cost = sum(tokens[n] for n in group) + gap_tokens
+            if spent + cost > budget:
+                group, cost = [s], tokens[s] + gap_tokens
+                if spent + cost > budget:
+                    continue
+            kept.update(group)
+            spent += cost
+        return kept
+
+    @staticmethod
+    def _assemble(results: List[SearchResult], sentences: List[Tuple[int, Tuple[int, int]]], kept: Set[int]) -> List[SearchResult]:
+        runs: Dict[int, List[List[int]]] = {} # result index -> [start, end] of each run of kept sentences
+        for s in sorted(kept):
+            i, (start, end) = sentences[s]
+            chunk_runs = runs.setdefault(i, [])
+            if chunk_runs and s - 1 in kept and sentences[s - 1][0] == i:
+                chunk_runs[-1][1] = end
+            else:
+                chunk_runs.append([start, end])
+
+        compressed = []
+        for i, res in enumerate(results):
+            if i not in runs:
+                continue
+            text = GAP_MARKER.join(res.text[start:end] for start, end in runs[i])
+            # Counted again by the prompt builder: the stored count is for the whole chunk
+            compressed.append(res.model_copy(update={"text": text, "token_count": None}))
+        return compressed
@@ -1,10 +1,11 @@
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 import time
 from app.core.config import AppConfig
 from app.core.schemas import HealthResponse
 from app.clients.vector_client import VectorStore
 from app.clients.llm_client import LLMClient
+from app.utils.circuit_breaker import CircuitBreaker, OPEN
 from app.data.repositories import DocumentRepository
 from sqlalchemy import text
 from loguru import logger
@@ -15,14 +16,16 @@ class HealthService:
         vector_store: VectorStore,
         llm_client: LLMClient,
         document_repo: DocumentRepository,
-        config: AppConfig
+        config: AppConfig,
+        llm_breaker: Optional[CircuitBreaker] = None
     ):
         self.vector_store = vector_store
         self.llm_client = llm_client
         self.document_repo = document_repo
         self.config = config
+        self.llm_breaker = llm_breaker
 
-    def get_system_status(self) -> HealthResponse:
+    async def get_system_status(self) -> HealthResponse:
         checks = {}
         
         # 1. Database
@@ -32,7 +35,7 @@ class HealthService:
         checks['pgvector'] = self._check_vector_store()
         
         # 3. LLM
-        checks['llm'] = self._check_llm()
+        checks['llm'] = await self._check_llm()
         
         # Determine overall status
         statuses = [c['status'] for c in checks.values()]
@@ -78,11 +81,17 @@ class HealthService:
             logger.error(f"Health check Vector failed: {e}")
         return result
 
-    def _check_llm(self) -> Dict[str, Any]:
+    async def _check_llm(self) -> Dict[str, Any]:
         result = {"status": "unhealthy", "latency_ms": 0, "error": None}
+        if self.llm_breaker is not None:
+            result["circuit"] = self.llm_breaker.state
+            if result["circuit"] == OPEN:
+                # Chats are not calling the LLM; neither does the health check
+                result["error"] = "Circuit open after repeated LLM failures"
+                return result
         try:
             start = time.time()
-            if self.llm_client.check_health():
+            if await self.llm_client.check_health():
                  result["status"] = "healthy"
             else:
                  result["error"] = "Health check returned false"
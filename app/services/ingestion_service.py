@@ -1,15 +1,172 @@
-import base64
-from typing import Dict
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Callable, Iterable, Iterator, List, Optional, Set, Tuple
 from app.core.config import IngestionConfig
-from app.core.exceptions import IngestionError
-from app.core.schemas import IngestResponse
+from app.core.metrics import metrics
+from app.core.exceptions import RAGException, DatabaseError, IngestionError, NotFoundError
+from app.core.schemas import DeleteResponse, IngestResponse, IngestTimings
+from app.data.database import Chunk, Document
 from app.data.repositories import DocumentRepository, ChunkRepository
 from app.clients.embedding_client import EmbeddingClient
 from app.clients.vector_client import VectorStore
-from app.utils.pdf_processor import validate_pdf, extract_text_from_pdf, calculate_file_hash
-from app.utils.text_splitter import split_text_into_chunks
+from app.utils.pdf_processor import PDFSource, PDFDocument, PDFExtractor, calculate_file_hash, calculate_text_hash, compress_text, decompress_text
+from app.utils.pipeline import BackgroundIterator, batched
+from app.utils.simhash import BAND_COUNT, SimHashIndex, simhash, simhash_bands
+from app.utils.text_splitter import StreamingChunker, TextChunk
+from app.utils.timing import StageTimer
+from app.utils.token_counter import TokenCounter
 from loguru import logger
 
+# (stage, progress 0..1) hook used by the job worker to report status
+ProgressCallback = Callable[[str, float], None]
+
+metrics.describe("rag_ingest_stage_seconds", "Busy time per ingestion stage")
+metrics.describe("rag_ingest_seconds", "Wall-clock time per ingested document or batch")
+metrics.describe("rag_ingest_documents_total", "Ingestion attempts by outcome")
+
+# Canonical chunk of a near-duplicate: ("batch", index into the pending chunks) or ("chunk", stored chunk id)
+DuplicateRef = Tuple[str, int]
+
+@dataclass
+class PreparedDocument:
+    """A PDF that has been extracted and chunked, ready to be embedded and stored."""
+    filename: str
+    document_hash: str
+    tag: str
+    uploaded_by: str
+    pages_ingested: int
+    page_chunks: List[TextChunk]
+    page_hashes: List[Tuple[int, str]] = field(default_factory=list) # (page_num, content_hash)
+    page_texts: Dict[int, bytes] = field(default_factory=dict)        # page_num -> compressed text
+
+@dataclass
+class RevisionPlan:
+    """What it takes to turn the stored chunks of a document into those of a new revision."""
+    page_hashes: List[Tuple[int, str]]   # (page_num, content_hash) of the new revision
+    kept: Dict[int, TextChunk]           # existing chunk_id -> its position in the new revision
+    new_chunks: List[TextChunk]          # chunks to embed and insert
+    deleted_ids: List[int]               # existing chunks that no longer appear
+    pages_changed: int
+
+def hash_pages(
+    pages: Iterable[Tuple[int, str]],
+    page_hashes: List[Tuple[int, str]],
+    page_texts: Optional[Dict[int, bytes]] = None
+) -> Iterator[Tuple[int, str]]:
+    """
+    Pass (page_num, text) pages through, recording (page_num, content_hash) of each in `page_hashes`
+    and, with `page_texts`, its compressed text (kept compressed so long documents stay small in memory).
+    """
+    for page_num, text in pages:
+        page_hashes.append((page_num, calculate_text_hash(text)))
+        if page_texts is not None:
+            page_texts[page_num] = compress_text(text)
+        yield page_num, text
+
+def chunk_pages(
+    pages: Iterable[Tuple[int, str]],
+    chunker: StreamingChunker
+) -> Tuple[List[Tuple[int, str]], Dict[int, bytes], List[TextChunk]]:
+    """
+    Stream (page_num, text) pages through the chunker.
+    Returns the (page_num, content_hash) and compressed text of every page that had text, and the chunks.
+    """
+    page_hashes: List[Tuple[int, str]] = []
+    page_texts: Dict[int, bytes] = {}
+    page_chunks = chunker.split_pages(hash_pages(pages, page_hashes, page_texts))
+    return page_hashes, page_texts, page_chunks
+
+def plan_revision(
+    pages: List[Tuple[int, str]],
+    old_page_hashes: Dict[int, str],
+    old_chunks: List[Chunk],
+    chunker: StreamingChunker
+) -> RevisionPlan:
+    """
+    Diff a new revision against the stored one.
+    The new revision is chunked in full; chunking is deterministic, so text away from the edits
+    produces the same chunks as before and every chunk whose hash matches a stored chunk keeps
+    its row and vector (only its position is updated). Only the remainder is new.
+    """
+    page_hashes = [(page_num, calculate_text_hash(text)) for page_num, text in pages]
+    old_hashes = set(old_page_hashes.values())
+    pages_changed = sum(1 for _, content_hash in page_hashes if content_hash not in old_hashes)
+
+    old_by_hash: Dict[str, List[Chunk]] = {}
+    for chunk in old_chunks:
+        old_by_hash.setdefault(chunk.content_hash or calculate_text_hash(chunk.text), []).append(chunk)
+
+    kept: Dict[int, TextChunk] = {}
+    new_chunks = []
+    for chunk in chunker.chunks(pages):
+        matches = old_by_hash.get(calculate_text_hash(chunk.text))
+        if matches:
+            kept[matches.pop(0).id] = chunk
+        else:
+            new_chunks.append(chunk)
+
+    deleted_ids = [chunk.id for chunks in old_by_hash.values() for chunk in chunks]
+    return RevisionPlan(page_hashes, kept, new_chunks, deleted_ids, pages_changed)
+
+class DuplicateFinder:
+    """
+    Near-duplicate lookup over a stream of pending chunks. Each `add` SimHashes a batch and looks
+    for near-duplicates among stored canonical chunks of the same tag (one LSH query per tag) and
+    among earlier chunks of the stream, so a document can be checked batch by batch.
+    """
+    def __init__(self, chunk_repo: ChunkRepository, config: IngestionConfig, exclude_ids: Optional[List[int]] = None):
+        self.chunk_repo = chunk_repo
+        self.config = config
+        self.exclude_ids = exclude_ids
+        self.seen = 0 # chunks added so far
+        self._stream_index: Dict[str, SimHashIndex] = {} # per tag, over the stream's canonical chunks
+
+    def add(self, chunks: List[Dict]) -> Tuple[List[Optional[int]], List[Optional[DuplicateRef]]]:
+        """
+        Returns the signatures and, per chunk, its canonical chunk or None.
+        ("batch", i) refers to position i in the whole stream, not just this batch.
+        Chunks without a signature (no word tokens) are never deduplicated.
+        """
+        offset, self.seen = self.seen, self.seen + len(chunks)
+        signatures = [simhash(chunk["text"]) for chunk in chunks]
+        duplicate_of: List[Optional[DuplicateRef]] = [None] * len(chunks)
+        if self.config.dedup_mode == "off":
+            return signatures, duplicate_of
+
+        by_tag: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            if signatures[i] is not None:
+                by_tag.setdefault(chunk["tag"], []).append(i)
+
+        for tag, positions in by_tag.items():
+            band_values = [set() for _ in range(BAND_COUNT)]
+            for i in positions:
+                for band, value in enumerate(simhash_bands(signatures[i])):
+                    band_values[band].add(value)
+            stored = SimHashIndex(self.config.dedup_max_distance)
+            for chunk_id, signature in self.chunk_repo.find_simhash_candidates(tag, [sorted(v) for v in band_values], self.exclude_ids):
+                stored.add(signature, chunk_id)
+
+            stream = self._stream_index.setdefault(tag, SimHashIndex(self.config.dedup_max_distance))
+            for i in positions:
+                chunk_id = stored.find(signatures[i])
+                if chunk_id is not None:
+                    duplicate_of[i] = ("chunk", chunk_id)
+                    continue
+                index = stream.find(signatures[i])
+                if index is not None:
+                    duplicate_of[i] = ("batch", index)
+                else:
+                    stream.add(signatures[i], offset + i)
+
+        duplicates = sum(1 for ref in duplicate_of if ref is not None)
+        if duplicates:
+            logger.info(f"{duplicates}/{len(chunks)} chunks are near-duplicates ({self.config.dedup_mode})")
+        return signatures, duplicate_of
+
 class IngestionService:
     def __init__(
         self,
@@ -17,130 +174,726 @@ class IngestionService:
         vector_store: VectorStore,
         document_repo: DocumentRepository,
         chunk_repo: ChunkRepository,
-        config: IngestionConfig
+        pdf_extractor: PDFExtractor,
+        chunker: StreamingChunker,
+        config: IngestionConfig,
+        token_counter: Optional[TokenCounter] = None
     ):
         self.embedding_client = embedding_client
         self.vector_store = vector_store
         self.document_repo = document_repo
         self.chunk_repo = chunk_repo
+        self.pdf_extractor = pdf_extractor
+        self.chunker = chunker
         self.config = config
+        # Chunk token counts are stored for prompt budgeting when the LLM's tokenizer is available
+        self.token_counter = token_counter
 
-    def ingest_document(self, file_bytes: bytes, filename: str, tag: str, uploaded_by: str) -> IngestResponse:
+    def ingest_file(
+        self,
+        file_path: str,
+        filename: str,
+        tag: str,
+        uploaded_by: str,
+        document_hash: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> IngestResponse:
         """
-        Orchestrate the complete ingestion pipeline.
+        Ingest a PDF spooled on disk. Pass `document_hash` when it was already computed during upload.
         """
-        doc_id = None
+        return self._ingest(file_path, os.path.getsize(file_path), document_hash, filename, tag, uploaded_by, progress)
+
+    def _ingest(
+        self,
+        source: PDFSource,
+        file_size: int,
+        doc_hash: Optional[str],
+        filename: str,
+        tag: str,
+        uploaded_by: str,
+        progress: Optional[ProgressCallback]
+    ) -> IngestResponse:
+        timer = StageTimer()
         try:
             logger.info(f"Starting ingestion for {filename} [{tag}]")
 
             # 1. Validate File
-            if len(file_bytes) > self.config.max_file_size_bytes:
+            self._report(progress, "validating", 0.05)
+            if file_size > self.config.max_file_size_bytes:
                 raise IngestionError(f"File size exceeds limit of {self.config.max_file_size_mb}MB")
             
-            if not validate_pdf(file_bytes):
-                raise IngestionError("Invalid PDF file")
-            
-            # 2. Duplicate Check
-            doc_hash = calculate_file_hash(file_bytes)
-            existing = self.document_repo.get_by_hash(doc_hash)
-            if existing:
-                raise IngestionError(f"Document already exists (ID: {existing.id})")
-                
-            # 3. Extract Text
-            pages_text = extract_text_from_pdf(file_bytes) # dict[page_num, text]
-            
-            # 4. Create Document Record
-            # We commit later? Or now?
-            # Ideally transaction. But for now we create record to get ID.
-            # Services usually manage transaction scope if they own it.
-            # But we passed in repositories which have a session.
-            # We assume the session is active.
-            
-            doc = self.document_repo.create(
-                filename=filename,
-                document_hash=doc_hash,
-                tag=tag,
-                uploaded_by=uploaded_by,
-                page_count=len(pages_text)
-            )
-            doc_id = doc.id
-            logger.info(f"Created document record ID {doc_id}")
+            # The PDF is parsed once here; validation and extraction share the same reader
+            with ExitStack() as stack:
+                with timer.stage("validate"):
+                    pdf = stack.enter_context(self.pdf_extractor.open(source))
+                # 2. Duplicate Check
+                self._report(progress, "hashing", 0.1)
+                with timer.stage("hash"):
+                    doc_hash = doc_hash or calculate_file_hash(source)
+                existing = self.document_repo.get_by_hash(doc_hash)
+                if existing:
+                    raise IngestionError(f"Document already exists (ID: {existing.id})")
 
-            # 5. Split and Chunk
-            all_chunks_data = [] # For DB
-            all_texts = []       # For embedding
-            all_metadatas = []   # For vector store
-            
-            chunk_global_idx = 0
-            
-            for page_num, text in pages_text.items():
-                chunks = split_text_into_chunks(text, self.config.chunk_size, self.config.chunk_overlap)
-                
-                for chunk_text in chunks:
-                    all_chunks_data.append({
-                        "document_id": doc_id,
-                        "page_number": page_num,
-                        "text": chunk_text
-                    })
-                    
-                    all_texts.append(chunk_text)
-                    all_metadatas.append({
-                        "document_id": doc_id,
-                        "chunk_id": 0, # Placeholder, depends on DB insert?
-                        "page_number": page_num,
-                        "tag": tag,
-                        "source": filename
-                    })
-                    chunk_global_idx += 1
-
-            # 6. Store Chunks in DB
-            created_chunks = self.chunk_repo.create_batch(all_chunks_data)
-            
-            # Commit the chunks to the database
-            # Since create_batch only flushes, data is lost if we don't commit.
-            # We must access the session from one of the repos to commit.
-            self.chunk_repo.session.commit()
-            
-            # Update metadatas with actual chunk IDs
-            for i, chunk in enumerate(created_chunks):
-                all_metadatas[i]["chunk_id"] = chunk.id
-            
-            logger.info(f"Stored {len(created_chunks)} chunks in database")
+                # 3. Extract, split, embed and store as overlapping stages
+                self._report(progress, "extracting", 0.2)
+                with timer.stage("db_write"):
+                    doc = self.document_repo.create(
+                        filename=filename,
+                        document_hash=doc_hash,
+                        tag=tag,
+                        uploaded_by=uploaded_by,
+                        page_count=pdf.page_count
+                    )
+                logger.info(f"Created document record ID {doc.id}")
+                page_hashes, page_texts, chunk_ids, duplicate_of = self._ingest_stream(pdf, doc.id, tag, filename, progress, timer)
 
-            # 7. Generate Embeddings & Store in Vector DB
-            if all_texts:
-                logger.info("Generating embeddings...")
-                vectors = self.embedding_client.embed_batch(all_texts)
-                
-                logger.info("Storing vectors...")
-                self.vector_store.add_embeddings(vectors, all_texts, all_metadatas)
+            if not page_hashes:
+                raise IngestionError("No extractable text found in PDF")
+
+            self._report(progress, "storing", 0.9)
+            with timer.stage("db_write"):
+                self.document_repo.replace_pages(doc.id, page_hashes, page_texts)
+                self.document_repo.update(doc.id, {"page_count": len(page_hashes)})
+                self.chunk_repo.session.commit()
 
-            # Return Response
             return IngestResponse(
-                document_id=doc_id,
+                document_id=doc.id,
                 filename=filename,
-                chunks_created=len(created_chunks),
+                chunks_created=sum(1 for chunk_id in chunk_ids if chunk_id is not None),
                 status="success",
-                pages_ingested=len(pages_text),
+                pages_ingested=len(page_hashes),
                 tag=tag,
-                uploaded_by=uploaded_by
+                uploaded_by=uploaded_by,
+                chunks_deduplicated=sum(1 for ref in duplicate_of if ref is not None),
+                timings=self._record_timings(
+                    timer, file_size, len(page_hashes), len(chunk_ids),
+                    sum(1 for ref in duplicate_of if ref is None)
+                )
             )
 
         except Exception as e:
             logger.error(f"Ingestion failed: {e}")
-            self._cleanup_on_failure(doc_id)
+            self._record_failure(timer)
+            self._cleanup_on_failure()
             if isinstance(e, IngestionError):
                 raise e
             raise IngestionError(f"Ingestion process failed: {e}")
 
-    def _cleanup_on_failure(self, doc_id: int):
-        if doc_id:
-            try:
-                logger.warning(f"Cleaning up failed ingestion for document {doc_id}")
-                self.document_repo.delete(doc_id)
-                # Cleanup vector store?
-                # Ideally yes, but VectorStore.delete_by_document might not be fully implemented.
-                # Try it.
-                self.vector_store.delete_by_document(doc_id)
-            except Exception as cleanup_err:
-                logger.error(f"Cleanup failed: {cleanup_err}")
+    def _ingest_stream(
+        self,
+        pdf: PDFDocument,
+        document_id: int,
+        tag: str,
+        source: str,
+        progress: Optional[ProgressCallback],
+        timer: StageTimer
+    ) -> Tuple[List[Tuple[int, str]], Dict[int, bytes], List[Optional[int]], List[Optional[DuplicateRef]]]:
+        """
+        Run extract -> chunk -> embed -> write as a pipeline instead of one stage after another:
+        - a background thread extracts and chunks pages into batches (bounded queue);
+        - this thread deduplicates each batch and hands its texts to the embedding thread;
+        - while the embedding thread works on later batches, this thread writes finished ones.
+        Each stage runs at most `pipeline_depth` batches ahead, which bounds memory. The session is
+        only used from this thread, and nothing is committed here.
+        Returns page hashes and compressed page texts, then the chunk id (None if skipped) and
+        duplicate ref of every chunk.
+        """
+        page_hashes: List[Tuple[int, str]] = []
+        page_texts: Dict[int, bytes] = {}
+        chunk_ids: List[Optional[int]] = []
+        duplicates: List[Optional[DuplicateRef]] = []
+        finder = DuplicateFinder(self.chunk_repo, self.config)
+        depth = self.config.pipeline_depth
+        in_flight: Deque[Tuple[List[Dict], List[int], List[Optional[DuplicateRef]], Optional[Future]]] = deque()
+
+        def write(pending: List[Dict], signatures: List[Optional[int]], duplicate_of: List[Optional[DuplicateRef]], vectors: Optional[Future]) -> None:
+            offset = len(chunk_ids)
+            # Stream positions -> positions in this batch; canonical chunks of earlier batches are stored already
+            local_refs: List[Optional[DuplicateRef]] = []
+            for ref in duplicate_of:
+                if ref is not None and ref[0] == "batch":
+                    ref = ("chunk", chunk_ids[ref[1]]) if ref[1] < offset else ("batch", ref[1] - offset)
+                local_refs.append(ref)
+            chunk_ids.extend(self._store_chunks(pending, vectors.result() if vectors else [], signatures, local_refs, timer))
+            duplicates.extend(duplicate_of)
+            done = pending[-1]["page_end"] / max(pdf.page_count, 1)
+            self._report(progress, "processing", 0.2 + 0.7 * min(done, 1.0))
+
+        # Each generator is timed separately; nested time is not counted twice
+        pages = timer.iterate("extract", pdf.iter_pages())
+        chunk_batches = batched(
+            timer.iterate("split", self.chunker.chunks(timer.iterate("hash", hash_pages(pages, page_hashes, page_texts)))),
+            self.config.pipeline_batch_chunks
+        )
+        embed = timer.timed("embed", self.embedding_client.embed_batch)
+        embedder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-embed")
+        try:
+            with BackgroundIterator(chunk_batches, depth, name="ingest-extract") as batches:
+                for chunks in batches:
+                    pending = [self._pending_chunk(chunk, tag, source, document_id=document_id) for chunk in chunks]
+                    with timer.stage("dedup"):
+                        signatures, duplicate_of = finder.add(pending)
+                    texts = [chunk["text"] for chunk, ref in zip(pending, duplicate_of) if ref is None]
+                    vectors = embedder.submit(embed, texts) if texts else None
+                    in_flight.append((pending, signatures, duplicate_of, vectors))
+                    if len(in_flight) >= depth:
+                        write(*in_flight.popleft())
+            while in_flight:
+                write(*in_flight.popleft())
+        finally:
+            embedder.shutdown(wait=True, cancel_futures=True)
+
+        logger.info(f"Stored {sum(1 for c in chunk_ids if c is not None)} chunks from {len(page_hashes)} pages")
+        return page_hashes, page_texts, chunk_ids, duplicates
+
+    def store_documents(
+        self,
+        documents: List[PreparedDocument],
+        progress: Optional[ProgressCallback] = None
+    ) -> List[IngestResponse]:
+        """
+        Embed and persist already-chunked documents. All chunks are embedded in one
+        batch, then documents, chunks and vectors are written in a single transaction,
+        so either every document in `documents` is stored or none is.
+        """
+        timer = StageTimer()
+        try:
+            pending = [
+                self._pending_chunk(chunk, prepared.tag, prepared.filename, document_index=index)
+                for index, prepared in enumerate(documents)
+                for chunk in prepared.page_chunks
+            ]
+            # Near-duplicates are resolved first so they are never embedded
+            self._report(progress, "deduplicating", 0.35)
+            with timer.stage("dedup"):
+                signatures, duplicate_of = self._find_duplicates(pending)
+
+            # Embeddings are generated before any writes so the database transaction stays short
+            self._report(progress, "embedding", 0.4)
+            with timer.stage("embed"):
+                vectors = self._embed_unique(pending, duplicate_of)
+
+            self._report(progress, "storing", 0.8)
+            doc_ids = []
+            with timer.stage("db_write"):
+                for prepared in documents:
+                    doc = self.document_repo.create(
+                        filename=prepared.filename,
+                        document_hash=prepared.document_hash,
+                        tag=prepared.tag,
+                        uploaded_by=prepared.uploaded_by,
+                        page_count=prepared.pages_ingested
+                    )
+                    doc_ids.append(doc.id)
+                    logger.info(f"Created document record ID {doc.id}")
+                    self.document_repo.replace_pages(doc.id, prepared.page_hashes, prepared.page_texts)
+            for chunk in pending:
+                chunk["document_id"] = doc_ids[chunk["document_index"]]
+
+            chunk_ids = self._store_chunks(pending, vectors, signatures, duplicate_of, timer)
+            with timer.stage("db_write"):
+                self.chunk_repo.session.commit()
+            self._record_timings(
+                timer,
+                0,
+                sum(prepared.pages_ingested for prepared in documents),
+                len(pending),
+                sum(1 for ref in duplicate_of if ref is None),
+                documents=len(documents)
+            )
+
+            responses = []
+            for index, (doc_id, prepared) in enumerate(zip(doc_ids, documents)):
+                positions = [i for i, chunk in enumerate(pending) if chunk["document_index"] == index]
+                responses.append(IngestResponse(
+                    document_id=doc_id,
+                    filename=prepared.filename,
+                    chunks_created=sum(1 for i in positions if chunk_ids[i] is not None),
+                    status="success",
+                    pages_ingested=prepared.pages_ingested,
+                    tag=prepared.tag,
+                    uploaded_by=prepared.uploaded_by,
+                    chunks_deduplicated=sum(1 for i in positions if duplicate_of[i] is not None)
+                ))
+            return responses
+
+        except Exception as e:
+            logger.error(f"Storing documents failed: {e}")
+            self._record_failure(timer, documents=len(documents))
+            self._cleanup_on_failure()
+            if isinstance(e, IngestionError):
+                raise e
+            raise IngestionError(f"Ingestion process failed: {e}")
+
+    def update_file(
+        self,
+        document_id: int,
+        file_path: str,
+        filename: str,
+        uploaded_by: str,
+        document_hash: Optional[str] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> IngestResponse:
+        """
+        Ingest `file_path` as a new version of an existing document, keeping its id.
+        Unchanged chunks keep their rows and vectors; only chunks whose text changed are
+        re-embedded, and stale chunks/vectors are removed in the same transaction.
+        """
+        timer = StageTimer()
+        try:
+            doc = self.document_repo.get_by_id(document_id)
+            if doc is None:
+                raise NotFoundError(f"Document {document_id} not found")
+            logger.info(f"Starting incremental ingestion of {filename} as new version of document {document_id}")
+
+            self._report(progress, "validating", 0.05)
+            file_size = os.path.getsize(file_path)
+            if file_size > self.config.max_file_size_bytes:
+                raise IngestionError(f"File size exceeds limit of {self.config.max_file_size_mb}MB")
+
+            with ExitStack() as stack:
+                with timer.stage("validate"):
+                    pdf = stack.enter_context(self.pdf_extractor.open(file_path))
+                self._report(progress, "hashing", 0.1)
+                with timer.stage("hash"):
+                    doc_hash = document_hash or calculate_file_hash(file_path)
+                if doc_hash == doc.document_hash:
+                    raise IngestionError(f"Document is unchanged (ID: {document_id})")
+                existing = self.document_repo.get_by_hash(doc_hash)
+                if existing:
+                    raise IngestionError(f"Document already exists (ID: {existing.id})")
+
+                self._report(progress, "extracting", 0.2)
+                with timer.stage("extract"):
+                    pages = list(pdf.iter_pages())
+
+            if not pages:
+                raise IngestionError("No extractable text found in PDF")
+
+            # Diff against the stored revision
+            self._report(progress, "diffing", 0.3)
+            old_chunks = {chunk.id: chunk for chunk in self.chunk_repo.get_by_document(document_id)}
+            # Re-chunking and hashing the revision
+            with timer.stage("split"):
+                plan = plan_revision(
+                    pages,
+                    self.document_repo.get_page_hashes(document_id),
+                    list(old_chunks.values()),
+                    self.chunker
+                )
+            logger.info(
+                f"Document {document_id}: {plan.pages_changed}/{len(pages)} pages changed, "
+                f"{len(plan.kept)} chunks kept, {len(plan.new_chunks)} new, {len(plan.deleted_ids)} stale"
+            )
+
+            chunk_ids, duplicate_of, pending = self._apply_revision(doc, filename, old_chunks, plan, progress, timer)
+
+            version = (doc.version or 1) + 1
+            with timer.stage("db_write"):
+                self.document_repo.replace_pages(
+                    document_id, plan.page_hashes, {page_num: compress_text(text) for page_num, text in pages}
+                )
+                self.document_repo.update(document_id, {
+                    "document_hash": doc_hash,
+                    "filename": filename,
+                    "uploaded_by": uploaded_by,
+                    "page_count": len(pages),
+                    "version": version
+                })
+                self.chunk_repo.session.commit()
+
+            return IngestResponse(
+                document_id=document_id,
+                filename=filename,
+                chunks_created=sum(1 for chunk_id in chunk_ids if chunk_id is not None),
+                status="updated",
+                pages_ingested=len(pages),
+                tag=doc.tag,
+                uploaded_by=uploaded_by,
+                version=version,
+                pages_changed=plan.pages_changed,
+                chunks_reused=len(plan.kept),
+                chunks_deleted=len(plan.deleted_ids),
+                chunks_deduplicated=sum(1 for ref in duplicate_of if ref is not None),
+                timings=self._record_timings(
+                    timer, file_size, len(pages), len(plan.kept) + len(pending),
+                    sum(1 for ref in duplicate_of if ref is None)
+                )
+            )
+
+        except Exception as e:
+            logger.error(f"Incremental ingestion failed: {e}")
+            self._record_failure(timer)
+            self._cleanup_on_failure()
+            if isinstance(e, (IngestionError, NotFoundError)):
+                raise e
+            raise IngestionError(f"Ingestion process failed: {e}")
+
+    def rechunk_document(self, document_id: int, progress: Optional[ProgressCallback] = None) -> IngestResponse:
+        """
+        Rebuild a document's chunks with this service's chunker (its collection's chunk settings)
+        from its stored page text, without the original PDF. Chunks whose text comes out unchanged
+        keep their rows and vectors, so only the chunks the new settings actually changed are embedded.
+        """
+        timer = StageTimer()
+        try:
+            doc = self.document_repo.get_by_id(document_id)
+            if doc is None:
+                raise NotFoundError(f"Document {document_id} not found")
+            logger.info(f"Re-chunking document {document_id} ({doc.filename}) from stored page text")
+
+            self._report(progress, "loading", 0.1)
+            with timer.stage("load"):
+                stored = self.document_repo.get_page_texts(document_id)
+                if not stored or any(data is None for _, data in stored):
+                    raise IngestionError(
+                        f"Document {document_id} has no stored page text; upload it again as a new version first"
+                    )
+                pages = [(page_num, decompress_text(data)) for page_num, data in stored]
+
+            self._report(progress, "diffing", 0.3)
+            old_chunks = {chunk.id: chunk for chunk in self.chunk_repo.get_by_document(document_id)}
+            with timer.stage("split"):
+                plan = plan_revision(
+                    pages,
+                    self.document_repo.get_page_hashes(document_id),
+                    list(old_chunks.values()),
+                    self.chunker
+                )
+            logger.info(
+                f"Document {document_id}: {len(plan.kept)} chunks kept, "
+                f"{len(plan.new_chunks)} new, {len(plan.deleted_ids)} stale"
+            )
+
+            chunk_ids, duplicate_of, pending = self._apply_revision(doc, doc.filename, old_chunks, plan, progress, timer)
+            with timer.stage("db_write"):
+                self.chunk_repo.session.commit()
+
+            return IngestResponse(
+                document_id=document_id,
+                filename=doc.filename,
+                chunks_created=sum(1 for chunk_id in chunk_ids if chunk_id is not None),
+                status="rechunked",
+                pages_ingested=len(pages),
+                tag=doc.tag,
+                uploaded_by=doc.uploaded_by,
+                version=doc.version,
+                pages_changed=plan.pages_changed,
+                chunks_reused=len(plan.kept),
+                chunks_deleted=len(plan.deleted_ids),
+                chunks_deduplicated=sum(1 for ref in duplicate_of if ref is not None),
+                timings=self._record_timings(
+                    timer, 0, len(pages), len(plan.kept) + len(pending),
+                    sum(1 for ref in duplicate_of if ref is None)
+                )
+            )
+
+        except Exception as e:
+            logger.error(f"Re-chunking failed: {e}")
+            self._record_failure(timer)
+            self._cleanup_on_failure()
+            if isinstance(e, (IngestionError, NotFoundError)):
+                raise e
+            raise IngestionError(f"Re-chunking failed: {e}")
+
+    def _apply_revision(
+        self,
+        doc: Document,
+        filename: str,
+        old_chunks: Dict[int, Chunk],
+        plan: RevisionPlan,
+        progress: Optional[ProgressCallback],
+        timer: StageTimer
+    ) -> Tuple[List[Optional[int]], List[Optional[DuplicateRef]], List[Dict]]:
+        """
+        Write a revision plan: drop stale chunks, move kept ones, and embed and insert the new ones.
+        Returns the new chunks' ids and duplicate refs, and the new chunks. Does not commit.
+        """
+        pending = [
+            self._pending_chunk(chunk, doc.tag, filename, document_id=doc.id)
+            for chunk in plan.new_chunks
+        ]
+        # Chunks about to be deleted must not become canonical for the new ones
+        self._report(progress, "deduplicating", 0.35)
+        with timer.stage("dedup"):
+            signatures, duplicate_of = self._find_duplicates(pending, exclude_ids=plan.deleted_ids)
+
+        # Only the new, non-duplicate chunks are embedded
+        self._report(progress, "embedding", 0.4)
+        with timer.stage("embed"):
+            vectors = self._embed_unique(pending, duplicate_of)
+
+        self._report(progress, "storing", 0.8)
+        with timer.stage("db_write"):
+            self._delete_chunks(plan.deleted_ids)
+
+        moved = {
+            chunk_id: self._position(chunk)
+            for chunk_id, chunk in plan.kept.items()
+            if self._position(old_chunks[chunk_id]) != self._position(chunk)
+        }
+        with timer.stage("db_write"):
+            self.chunk_repo.update_positions(moved)
+        metadata_updates = {
+            str(chunk_id): {"page_number": position["page_number"]}
+            for chunk_id, position in moved.items()
+            if old_chunks[chunk_id].page_number != position["page_number"]
+        }
+        if filename != doc.filename:
+            for chunk_id in plan.kept:
+                metadata_updates.setdefault(str(chunk_id), {})["source"] = filename
+        with timer.stage("vector_write"):
+            self.vector_store.update_metadata(metadata_updates, session=self.chunk_repo.session)
+
+        chunk_ids = self._store_chunks(pending, vectors, signatures, duplicate_of, timer)
+        return chunk_ids, duplicate_of, pending
+
+    @staticmethod
+    def _pending_chunk(chunk: TextChunk, tag: str, source: str, **owner) -> Dict:
+        """A chunk waiting to be stored; `owner` is document_id, or document_index within a batch."""
+        return {
+            **owner,
+            "page_number": chunk.page_number,
+            "page_end": chunk.page_end,
+            "start_offset": chunk.start_offset,
+            "end_offset": chunk.end_offset,
+            "text": chunk.text,
+            "tag": tag,
+            "source": source
+        }
+
+    @staticmethod
+    def _position(chunk) -> Dict:
+        """Page span and offsets of a stored Chunk or a TextChunk."""
+        return {
+            "page_number": chunk.page_number,
+            "page_end": chunk.page_end,
+            "start_offset": chunk.start_offset,
+            "end_offset": chunk.end_offset
+        }
+
+    def _find_duplicates(
+        self,
+        chunks: List[Dict],
+        exclude_ids: Optional[List[int]] = None
+    ) -> Tuple[List[Optional[int]], List[Optional[DuplicateRef]]]:
+        return DuplicateFinder(self.chunk_repo, self.config, exclude_ids).add(chunks)
+
+    def _embed_unique(self, chunks: List[Dict], duplicate_of: List[Optional[DuplicateRef]]) -> List[List[float]]:
+        texts = [chunk["text"] for chunk, ref in zip(chunks, duplicate_of) if ref is None]
+        logger.info(f"Generating embeddings for {len(texts)} chunks...")
+        return self.embedding_client.embed_batch(texts) if texts else []
+
+    def _store_chunks(
+        self,
+        chunks: List[Dict],
+        vectors: List[List[float]],
+        signatures: List[Optional[int]],
+        duplicate_of: List[Optional[DuplicateRef]],
+        timer: Optional[StageTimer] = None
+    ) -> List[Optional[int]]:
+        """
+        Insert chunk rows and the vectors of canonical chunks. In "link" mode near-duplicates are
+        stored pointing at their canonical chunk; in "skip" mode they are dropped (id None).
+        """
+        timer = timer or StageTimer()
+        token_counts: List[Optional[int]] = [None] * len(chunks)
+        # Estimates are stored too: they stay conservative (prompts built on them keep a margin)
+        if self.token_counter is not None:
+            with timer.stage("count_tokens"):
+                token_counts = self.token_counter.count_batch([chunk["text"] for chunk in chunks])
+
+        def row(i: int, canonical_chunk_id: Optional[int] = None) -> Dict:
+            return {
+                "document_id": chunks[i]["document_id"],
+                "page_number": chunks[i]["page_number"],
+                "page_end": chunks[i]["page_end"],
+                "start_offset": chunks[i]["start_offset"],
+                "end_offset": chunks[i]["end_offset"],
+                "text": chunks[i]["text"],
+                "content_hash": calculate_text_hash(chunks[i]["text"]),
+                "token_count": token_counts[i],
+                "simhash": signatures[i],
+                "simhash_bands": simhash_bands(signatures[i]) if signatures[i] is not None else [None] * BAND_COUNT,
+                "canonical_chunk_id": canonical_chunk_id
+            }
+
+        chunk_ids: List[Optional[int]] = [None] * len(chunks)
+        unique = [i for i, ref in enumerate(duplicate_of) if ref is None]
+        rows = [row(i) for i in unique]
+        if self.vector_store.embeds_in_chunks:
+            # Vectors are columns of the chunk rows: one insert, no second copy of the text
+            for unique_row, vector in zip(rows, vectors):
+                unique_row["embedding"] = vector
+        with timer.stage("db_write"):
+            created = self.chunk_repo.create_batch(rows)
+        for i, chunk_id in zip(unique, created):
+            chunk_ids[i] = chunk_id
+
+        linked = [i for i, ref in enumerate(duplicate_of) if ref is not None]
+        if linked and self.config.dedup_mode == "link":
+            rows = []
+            for i in linked:
+                kind, target = duplicate_of[i]
+                rows.append(row(i, target if kind == "chunk" else chunk_ids[target]))
+            with timer.stage("db_write"):
+                created = self.chunk_repo.create_batch(rows)
+            for i, chunk_id in zip(linked, created):
+                chunk_ids[i] = chunk_id
+        logger.info(f"Stored {sum(1 for c in chunk_ids if c is not None)} chunks in database")
+
+        if unique and not self.vector_store.embeds_in_chunks:
+            logger.info("Storing vectors...")
+            with timer.stage("vector_write"):
+                self.vector_store.add_embeddings(
+                    vectors,
+                    [chunks[i]["text"] for i in unique],
+                    [
+                        {
+                            "document_id": chunks[i]["document_id"],
+                            "chunk_id": chunk_ids[i],
+                            "page_number": chunks[i]["page_number"],
+                            "token_count": token_counts[i],
+                            "tag": chunks[i]["tag"],
+                            "source": chunks[i]["source"]
+                        }
+                        for i in unique
+                    ],
+                    ids=[str(chunk_ids[i]) for i in unique],
+                    session=self.chunk_repo.session
+                )
+        return chunk_ids
+
+    def delete_document(self, document_id: int) -> DeleteResponse:
+        if self.document_repo.get_by_id(document_id) is None:
+            raise NotFoundError(f"Document {document_id} not found")
+        return self.delete_documents([document_id])
+
+    def delete_by_tag(self, tag: str) -> DeleteResponse:
+        return self.delete_documents(self.document_repo.get_ids_by_tag(tag))
+
+    def delete_documents(self, document_ids: List[int]) -> DeleteResponse:
+        """
+        Remove documents with their pages, chunks and vectors in a single transaction.
+        Vectors are deleted through the indexed document_id of their metadata; near-duplicates in
+        other documents first take over the vectors of canonical chunks being removed.
+        """
+        try:
+            session = self.chunk_repo.session
+            self._promote_duplicates(self.chunk_repo.get_linked_from_documents(document_ids))
+            vectors_deleted = self.vector_store.delete_by_documents(document_ids, session=session)
+            chunks_deleted = self.chunk_repo.delete_by_documents(document_ids)
+            documents_deleted = self.document_repo.delete_many(document_ids)
+            session.commit()
+            logger.info(f"Deleted {documents_deleted} documents, {chunks_deleted} chunks, {vectors_deleted} vectors")
+            return DeleteResponse(
+                document_ids=document_ids,
+                documents_deleted=documents_deleted,
+                chunks_deleted=chunks_deleted,
+                vectors_deleted=vectors_deleted
+            )
+        except Exception as e:
+            logger.error(f"Deleting documents failed: {e}")
+            self._cleanup_on_failure()
+            if isinstance(e, RAGException):
+                raise e
+            raise DatabaseError(f"Deleting documents failed: {e}")
+
+    def _delete_chunks(self, chunk_ids: List[int]) -> None:
+        """Delete chunks and their vectors, promoting surviving near-duplicates of deleted canonical chunks."""
+        if not chunk_ids:
+            return
+        deleting = set(chunk_ids)
+        promoted = self._promote_duplicates([
+            chunk for chunk in self.chunk_repo.get_linked(chunk_ids) if chunk.id not in deleting
+        ])
+        self.chunk_repo.delete_by_ids(chunk_ids)
+        self.vector_store.delete([str(i) for i in chunk_ids if i not in promoted], session=self.chunk_repo.session)
+
+    def _promote_duplicates(self, linked: List[Chunk]) -> Set[int]:
+        """
+        A canonical chunk about to be deleted hands its vector over to the oldest of its surviving
+        near-duplicates (`linked`, oldest first), which becomes the canonical chunk for the others.
+        Returns the ids of the canonical chunks whose vectors were moved.
+        """
+        promoted: Dict[int, Chunk] = {} # deleted canonical id -> surviving chunk taking over its vector
+        relinks: Dict[int, Optional[int]] = {}
+        for chunk in linked:
+            successor = promoted.get(chunk.canonical_chunk_id)
+            if successor is None:
+                promoted[chunk.canonical_chunk_id] = chunk
+                relinks[chunk.id] = None
+            else:
+                relinks[chunk.id] = successor.id
+
+        self.chunk_repo.relink(relinks)
+        self.vector_store.reassign(
+            {
+                str(old_id): (str(chunk.id), {
+                    "document_id": chunk.document_id,
+                    "chunk_id": chunk.id,
+                    "page_number": chunk.page_number,
+                    "token_count": chunk.token_count,
+                    "source": chunk.document.filename
+                })
+                for old_id, chunk in promoted.items()
+            },
+            session=self.chunk_repo.session
+        )
+        return set(promoted)
+
+    def _record_timings(
+        self,
+        timer: StageTimer,
+        file_bytes: int,
+        pages: int,
+        chunks: int,
+        chunks_embedded: int,
+        documents: int = 1
+    ) -> IngestTimings:
+        """Publish a successful ingestion's stage timings to the metrics registry and return them."""
+        elapsed = max(timer.elapsed, 1e-9)
+        stages = timer.seconds()
+        for stage, seconds in stages.items():
+            metrics.observe("rag_ingest_stage_seconds", seconds, stage=stage)
+        metrics.observe("rag_ingest_seconds", elapsed)
+        metrics.inc("rag_ingest_documents_total", documents, status="success")
+        metrics.inc("rag_ingest_pages_total", pages)
+        metrics.inc("rag_ingest_chunks_total", chunks)
+        metrics.inc("rag_ingest_chunks_embedded_total", chunks_embedded)
+        metrics.inc("rag_ingest_bytes_total", file_bytes)
+
+        timings = IngestTimings(
+            total_ms=round(elapsed * 1000, 1),
+            stages_ms={stage: round(seconds * 1000, 1) for stage, seconds in stages.items()},
+            file_bytes=file_bytes,
+            pages=pages,
+            chunks=chunks,
+            chunks_embedded=chunks_embedded,
+            pages_per_second=round(pages / elapsed, 2),
+            chunks_per_second=round(chunks / elapsed, 2)
+        )
+        logger.info(f"Ingestion timings: {timings.total_ms}ms total, stages {timings.stages_ms}")
+        return timings
+
+    def _record_failure(self, timer: StageTimer, documents: int = 1) -> None:
+        for stage, seconds in timer.seconds().items():
+            metrics.observe("rag_ingest_stage_seconds", seconds, stage=stage)
+        metrics.inc("rag_ingest_documents_total", documents, status="failed")
+
+    def _report(self, progress: Optional[ProgressCallback], stage: str, value: float) -> None:
+        if progress is None:
+            return
+        try:
+            progress(stage, value)
+        except Exception as e:
+            # Status reporting must never break the ingestion itself
+            logger.warning(f"Progress update failed at stage '{stage}': {e}")
+
+    def _cleanup_on_failure(self):
+        # Documents, chunks and vectors share one transaction, so a rollback undoes all of them
+        try:
+            logger.warning("Rolling back failed ingestion")
+            self.document_repo.session.rollback()
+        except Exception as cleanup_err:
+            logger.error(f"Cleanup failed: {cleanup_err}")
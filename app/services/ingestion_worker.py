@@ -0,0 +1,142 @@
+import threading
+from typing import Callable, Dict, Any, List, Optional
+from sqlalchemy.orm import Session
+from app.core.config import IngestionConfig
+from app.core.exceptions import IngestionError
+from app.data.database import get_db_session, db_session_scope
+from app.data.repositories import JobRepository
+from app.services.ingestion_service import IngestionService
+from app.services.job_service import discard_upload
+from loguru import logger
+
+class IngestionWorker:
+    """
+    Pool of background threads that claim queued ingestion jobs from Postgres and run them.
+    Jobs live in the database, so anything queued or interrupted survives a restart.
+    """
+    def __init__(self, service_factory: Callable[[Session], IngestionService], config: IngestionConfig):
+        self.service_factory = service_factory
+        self.config = config
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Event()
+
+    def start(self, worker_count: Optional[int] = None) -> None:
+        count = self.config.worker_count if worker_count is None else worker_count
+        if count <= 0:
+            logger.info("In-process ingestion workers disabled")
+            return
+        if self._threads:
+            return
+        self._stop_event.clear()
+        for i in range(count):
+            thread = threading.Thread(target=self._loop, name=f"ingest-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {count} ingestion worker(s)")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        self._stop_event.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """Wake idle workers immediately instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                ran = self.run_once()
+            except Exception as e:
+                logger.error(f"Ingestion worker error: {e}")
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.config.job_poll_interval)
+                self._wakeup.clear()
+
+    def run_once(self) -> bool:
+        """Claim and process a single job. Returns False when the queue is empty."""
+        job = self._claim()
+        if job is None:
+            return False
+        self._process(job)
+        return True
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        with db_session_scope() as session:
+            job = JobRepository(session).claim_next(self.config.job_stale_after_seconds)
+            if job is None:
+                return None
+            # Snapshot the fields we need; the ORM object expires on commit
+            return {
+                "id": str(job.id),
+                "file_path": job.file_path,
+                "document_hash": job.document_hash,
+                "filename": job.filename,
+                "tag": job.tag,
+                "uploaded_by": job.uploaded_by,
+                "mode": job.mode,
+                "document_id": job.document_id,
+                "attempts": job.attempts
+            }
+
+    def _process(self, job: Dict[str, Any]) -> None:
+        job_id = job["id"]
+        if job["attempts"] > self.config.job_max_attempts:
+            self._fail(job, "Job exceeded maximum attempts")
+            return
+
+        logger.info(f"Processing ingestion job {job_id} ({job['filename']}), attempt {job['attempts']}")
+        session = get_db_session()
+        try:
+            service = self.service_factory(session)
+            report = lambda stage, value: self._update_progress(job_id, stage, value)
+            if job["mode"] == "update":
+                if job["document_id"] is None:
+                    raise IngestionError("Target document no longer exists")
+                response = service.update_file(
+                    document_id=job["document_id"],
+                    file_path=job["file_path"],
+                    filename=job["filename"],
+                    uploaded_by=job["uploaded_by"],
+                    document_hash=job["document_hash"],
+                    progress=report
+                )
+            elif job["mode"] == "rechunk":
+                if job["document_id"] is None:
+                    raise IngestionError("Target document no longer exists")
+                response = service.rechunk_document(job["document_id"], progress=report)
+            else:
+                response = service.ingest_file(
+                    file_path=job["file_path"],
+                    filename=job["filename"],
+                    tag=job["tag"],
+                    uploaded_by=job["uploaded_by"],
+                    document_hash=job["document_hash"],
+                    progress=report
+                )
+            session.commit()
+
+            with db_session_scope() as status_session:
+                JobRepository(status_session).mark_succeeded(job_id, response.document_id, response.model_dump())
+            discard_upload(job["file_path"])
+            logger.info(f"Ingestion job {job_id} succeeded (document {response.document_id})")
+        except Exception as e:
+            session.rollback()
+            message = e.message if isinstance(e, IngestionError) else str(e)
+            self._fail(job, message)
+        finally:
+            session.close()
+
+    def _update_progress(self, job_id: str, stage: str, value: float) -> None:
+        with db_session_scope() as session:
+            JobRepository(session).update_progress(job_id, stage, value)
+
+    def _fail(self, job: Dict[str, Any], message: str) -> None:
+        logger.error(f"Ingestion job {job['id']} failed: {message}")
+        with db_session_scope() as session:
+            JobRepository(session).mark_failed(job["id"], message)
+        discard_upload(job["file_path"])
@@ -0,0 +1,163 @@
+import os
+from typing import List, Optional
+from app.core.config import IngestionConfig
+from app.core.exceptions import IngestionError, NotFoundError, ValidationError
+from app.core.schemas import IngestJobResponse, IngestResponse
+from app.data.database import Document, IndexCollection, IngestionJob
+from app.data.repositories import JobRepository, DocumentRepository
+from loguru import logger
+
+def discard_upload(file_path: Optional[str]) -> None:
+    """Remove a spooled upload, ignoring files that are already gone (and jobs without one)."""
+    if not file_path:
+        return
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not remove upload {file_path}: {e}")
+
+class IngestionJobService:
+    def __init__(
+        self,
+        job_repo: JobRepository,
+        document_repo: DocumentRepository,
+        config: IngestionConfig,
+        collection: Optional[IndexCollection] = None
+    ):
+        self.job_repo = job_repo
+        self.document_repo = document_repo
+        self.config = config
+        # The active index collection, whose chunk settings rechunk jobs use
+        self.collection = collection
+
+    def submit(
+        self,
+        file_path: str,
+        document_hash: str,
+        filename: str,
+        tag: Optional[str],
+        uploaded_by: str,
+        document_id: Optional[int] = None
+    ) -> IngestJobResponse:
+        """
+        Queue an upload already spooled to `file_path` for the ingestion workers.
+        With `document_id`, the upload is queued as a new version of that document
+        (incremental re-ingestion) and inherits its tag.
+        The upload is removed if it cannot be queued.
+        """
+        try:
+            mode = "create"
+            if document_id is not None:
+                target = self.document_repo.get_by_id(document_id)
+                if target is None:
+                    raise NotFoundError(f"Document {document_id} not found")
+                if target.document_hash == document_hash:
+                    raise IngestionError(f"Document is unchanged (ID: {document_id})")
+                if tag and tag != target.tag:
+                    raise ValidationError(f"Tag cannot change between versions (document is tagged '{target.tag}')")
+                tag = target.tag
+                mode = "update"
+
+            existing = self.document_repo.get_by_hash(document_hash)
+            if existing:
+                raise IngestionError(f"Document already exists (ID: {existing.id})")
+
+            job = self.job_repo.create(
+                filename=filename,
+                tag=tag,
+                uploaded_by=uploaded_by,
+                file_path=file_path,
+                document_hash=document_hash,
+                mode=mode,
+                document_id=document_id
+            )
+            self.job_repo.session.commit()
+        except Exception:
+            self.job_repo.session.rollback()
+            discard_upload(file_path)
+            raise
+
+        logger.info(f"Queued ingestion job {job.id} ({mode}) for {filename} [{tag}]")
+        return self.to_response(job)
+
+    def submit_rechunk(self, document_id: int) -> IngestJobResponse:
+        """Queue a rebuild of a document's chunks from its stored page text (see IngestionService.rechunk_document)."""
+        document = self.document_repo.get_by_id(document_id)
+        if document is None:
+            raise NotFoundError(f"Document {document_id} not found")
+        return self.submit_rechunks([document])[0]
+
+    def submit_rechunks_by_tag(self, tag: str) -> List[IngestJobResponse]:
+        """Queue a rechunk job for every document carrying `tag` ("*" for all documents)."""
+        return self.submit_rechunks(self.document_repo.list_all(tag))
+
+    def submit_rechunks(self, documents: List[Document]) -> List[IngestJobResponse]:
+        self._check_chunk_settings()
+        try:
+            jobs = [
+                self.job_repo.create(
+                    filename=document.filename,
+                    tag=document.tag,
+                    uploaded_by=document.uploaded_by,
+                    file_path=None,
+                    mode="rechunk",
+                    document_id=document.id
+                )
+                for document in documents
+            ]
+            self.job_repo.session.commit()
+        except Exception:
+            self.job_repo.session.rollback()
+            raise
+
+        logger.info(f"Queued {len(jobs)} rechunk job(s)")
+        return [self.to_response(job) for job in jobs]
+
+    def _check_chunk_settings(self) -> None:
+        """
+        Rechunk jobs chunk like the rest of the active collection. Once a rebuild has recorded its
+        settings, changed CHUNK_* settings would not be applied by them, so they are refused.
+        """
+        if self.collection is None:
+            return
+        changed = [
+            f"{name} {recorded} -> {configured}"
+            for name, recorded, configured in (
+                ("CHUNK_SIZE", self.collection.chunk_size, self.config.chunk_size),
+                ("CHUNK_OVERLAP", self.collection.chunk_overlap, self.config.chunk_overlap),
+                ("CHUNK_LENGTH_UNIT", self.collection.chunk_length_unit, self.config.chunk_length_unit),
+            )
+            # NULL: the collection follows the configured settings
+            if recorded is not None and recorded != configured
+        ]
+        if changed:
+            raise ValidationError(
+                f"Chunk settings differ from those the active index was built with ({', '.join(changed)}); "
+                f"rechunking keeps the index's settings, so rebuild it with scripts/rebuild_index.py to apply them"
+            )
+
+    def get_status(self, job_id: str) -> IngestJobResponse:
+        job = self.job_repo.get_by_id(job_id)
+        if job is None:
+            raise NotFoundError(f"Ingestion job {job_id} not found")
+        return self.to_response(job)
+
+    @staticmethod
+    def to_response(job: IngestionJob) -> IngestJobResponse:
+        return IngestJobResponse(
+            job_id=str(job.id),
+            status=job.status,
+            mode=job.mode or "create",
+            stage=job.stage,
+            progress=job.progress or 0.0,
+            filename=job.filename,
+            tag=job.tag,
+            uploaded_by=job.uploaded_by,
+            document_id=job.document_id,
+            error=job.error,
+            result=IngestResponse(**job.result) if job.result else None,
+            created_at=job.created_at,
+            updated_at=job.updated_at
+        )
@@ -1,66 +1,109 @@
-from typing import List, Optional, Dict
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, ContextManager, List, Optional, Dict, Tuple, Union
 from app.core.config import AppConfig
 from app.core.exceptions import RAGException, ValidationError, RetrievalError
-from app.core.schemas import ChatResponse, IngestResponse, SearchResponse, SearchResult, HealthResponse
+from app.core.metrics import metrics
+from app.core.schemas import BatchChatItem, BatchChatResponse, BatchChatResult, ChatResponse, DeleteResponse, IngestJobResponse, SearchResponse, SearchResult, HealthResponse
 from app.services.retrieval_service import RetrievalService
 from app.services.ingestion_service import IngestionService
 from app.services.health_service import HealthService
+from app.services.job_service import IngestionJobService
+from app.services.compression_service import CompressionService
+from app.services.session_service import ChatSessionService, Conversation
 from app.clients.llm_client import LLMClient
+from app.utils.circuit_breaker import CLOSED, CircuitBreaker
+from app.utils.singleflight import SingleFlight
+from app.utils.token_counter import TokenCounter
 from loguru import logger
 
+metrics.describe("rag_chat_first_token_seconds", "Time from a streamed chat request to its first answer token")
+metrics.describe("rag_chat_stream_seconds", "Wall-clock time per streamed chat answer")
+metrics.describe("rag_chat_coalesced_total", "Chat requests answered by an identical request already in flight")
+metrics.describe("rag_chat_retrieval_only_total", "Chat requests answered with sources only because the LLM circuit was open")
+
+# Conversation messages included in the prompt
+HISTORY_MESSAGES = 5
+
+PROMPT_TEMPLATE = """System: You are a helpful corporate assistant. Use the provided context to answer the question.
+If the answer is not in the context, state that you don't know. Always cite the page numbers provided in the context.
+
+Relevant Context:
+{context}
+
+Conversation History:
+{history}
+
+User Question: {question}
+
+Assistant Answer:"""
+NO_CONTEXT = "No relevant documents found."
+SNIPPET_SEPARATOR = "\n\n"
+# Answer while the LLM circuit is open, followed by excerpts of the top sources
+RETRIEVAL_ONLY_ANSWER = "The assistant is temporarily unavailable. These passages are the most relevant to your question:"
+NO_SOURCES_ANSWER = "The assistant is temporarily unavailable, and no relevant documents were found."
+RETRIEVAL_ONLY_SOURCES = 3
+EXCERPT_CHARS = 300
+# Results this many characters apart are adjacent (chunk text is stripped, so neighbours are
+# separated by the whitespace at the cut)
+MAX_MERGE_GAP = 2
+
 class RAGService:
     def __init__(
         self,
         retrieval_service: RetrievalService,
         ingestion_service: IngestionService,
         health_service: HealthService,
+        job_service: IngestionJobService,
         llm_client: LLMClient,
-        config: AppConfig
+        config: AppConfig,
+        chat_flight: Optional[SingleFlight] = None,
+        token_counter: Optional[TokenCounter] = None,
+        compression_service: Optional[CompressionService] = None,
+        llm_breaker: Optional[CircuitBreaker] = None,
+        session_service: Optional[ChatSessionService] = None
     ):
         self.retrieval_service = retrieval_service
         self.ingestion_service = ingestion_service
         self.health_service = health_service
+        self.job_service = job_service
         self.llm_client = llm_client
         self.config = config
+        # Shared by every request of the process (RAGService itself is per request)
+        self.chat_flight = chat_flight
+        self.token_counter = token_counter or TokenCounter()
+        self.compression_service = compression_service
+        # Shared by the process, like chat_flight
+        self.llm_breaker = llm_breaker
+        self.session_service = session_service
 
-    def chat(self, question: str, tag: str, conversation_history: Optional[List[Dict]] = None) -> ChatResponse:
+    async def chat(
+        self,
+        question: str,
+        tag: str,
+        conversation_history: Optional[List[Dict]] = None,
+        conversation_id: Optional[str] = None
+    ) -> ChatResponse:
         """
         Main RAG output generation.
+        With `conversation_id`, the history and previous results come from the server-side
+        conversation instead of `conversation_history` (see ChatSessionService).
+        Concurrent requests with the same normalized question, tag and history are answered by
+        one retrieval and LLM call (see CHAT_COALESCING).
         """
         try:
-            self._validate_question(question)
-            
-            # 1. Retrieve
-            logger.info(f"RAG Chat: Retrieving for '{question}' in [{tag}]")
-            search_results = self.retrieval_service.search(
-                query=question, 
-                tag=tag,
-                top_k=self.config.retrieval.top_k, 
-                threshold=self.config.retrieval.similarity_threshold
+            if self.chat_flight is None or not self.config.retrieval.chat_coalescing:
+                return await self._answer(question, tag, conversation_history, conversation_id)
+            key = self._chat_key(question, tag, conversation_history, conversation_id)
+            response, shared = await self.chat_flight.do(
+                key, lambda: self._answer(question, tag, conversation_history, conversation_id)
             )
-            
-            # 2. Build Prompt
-            prompt = self._build_prompt(question, search_results, conversation_history)
-            
-            # 3. Generate
-            logger.info("RAG Chat: Generating response from LLM")
-            answer = self.llm_client.generate(prompt)
-            
-            # 4. Extract Sources
-            sources = self._extract_sources(search_results)
-            
-            # Formulate response
-            # Confidence currently a placeholder or we can calc from search scores
-            avg_score = 0.0
-            if search_results:
-                avg_score = sum(r.score for r in search_results) / len(search_results)
-            
-            return ChatResponse(
-                answer=answer,
-                sources=sources,
-                confidence=avg_score
-            )
-            
+            if shared:
+                metrics.inc("rag_chat_coalesced_total")
+                logger.info(f"RAG Chat: Joined in-flight answer for '{question}' in [{tag}]")
+            return response
+
         except Exception as e:
             logger.error(f"Chat failed: {e}")
             # Ensure we return a valid response even on error
@@ -70,12 +113,238 @@ class RAGService:
                 confidence=0.0
             )
 
-    def ingest(self, file_bytes: bytes, filename: str, tag: str, uploaded_by: str) -> IngestResponse:
+    async def _answer(
+        self,
+        question: str,
+        tag: str,
+        conversation_history: Optional[List[Dict]],
+        conversation_id: Optional[str] = None
+    ) -> ChatResponse:
+        # 1-2. Retrieve and build prompt (blocking DB and embedding work, kept off the event loop)
+        conversation = await self._load_conversation(conversation_id)
+        search_results, prompt = await asyncio.to_thread(self._prepare_chat, question, tag, conversation_history, conversation)
+
+        # 3. Generate, unless the LLM is failing: then answer with the sources alone, at once
+        call = self._llm_call()
+        if call is None:
+            return ChatResponse(
+                answer=self._retrieval_only_answer(search_results),
+                sources=self._extract_sources(search_results),
+                confidence=self._confidence(search_results),
+                conversation_id=conversation_id
+            )
+        logger.info("RAG Chat: Generating response from LLM")
+        with call:
+            answer = await self.llm_client.generate(prompt)
+        if conversation is not None:
+            await self.session_service.record_turn(conversation, question, answer, summarize=self._llm_healthy())
+
+        # 4. Extract Sources
+        return ChatResponse(
+            answer=answer,
+            sources=self._extract_sources(search_results),
+            confidence=self._confidence(search_results),
+            conversation_id=conversation_id
+        )
+
+    async def chat_many(self, items: List[BatchChatItem], max_concurrency: Optional[int] = None) -> BatchChatResponse:
+        """
+        Answer a batch of questions (offline evaluation). The questions are embedded in one
+        call and retrieved one after another on a worker thread; generations then run
+        concurrently, at most `max_concurrency` (capped by CHAT_BATCH_CONCURRENCY) at once.
+        Results keep the order of `items`; an item that fails carries its error instead of
+        failing the batch.
+        """
+        limit = self.config.retrieval.chat_batch_max_items
+        if len(items) > limit:
+            raise ValidationError(f"Too many questions in one batch (max {limit})")
+        started = time.perf_counter()
+        prepared = await asyncio.to_thread(self._prepare_batch, items)
+        cap = self.config.retrieval.chat_batch_concurrency
+        slots = asyncio.Semaphore(min(max_concurrency or cap, cap))
+        results = await asyncio.gather(*(self._answer_prepared(item, slots) for item in prepared))
+        return BatchChatResponse(results=list(results), total_ms=round((time.perf_counter() - started) * 1000, 1))
+
+    def _prepare_batch(self, items: List[BatchChatItem]) -> List[Union[Tuple[List[SearchResult], str, float], Exception]]:
+        """(results in the prompt, prompt, seconds spent) per item, or the exception that stopped it."""
+        prepared: List[Union[Tuple[List[SearchResult], str, float], Exception]] = [None] * len(items)
+        embedded = []
+        for i, item in enumerate(items):
+            try:
+                self._validate_question(item.question)
+                if item.question.strip() != "*":
+                    embedded.append(i)
+            except ValidationError as e:
+                prepared[i] = e
+
+        vectors: Dict[int, List[float]] = {}
+        embed_share = 0.0
+        if embedded:
+            started = time.perf_counter()
+            try:
+                batch = self.retrieval_service.embedding_client.embed_batch([items[i].question for i in embedded])
+                vectors = dict(zip(embedded, batch))
+            except Exception as e:
+                # Each search embeds its own question instead
+                logger.warning(f"Batch embedding failed, embedding questions one by one: {e}")
+            embed_share = (time.perf_counter() - started) / len(embedded)
+
+        for i, item in enumerate(items):
+            if prepared[i] is not None:
+                continue
+            started = time.perf_counter()
+            try:
+                search_results, prompt = self._prepare_chat(
+                    item.question, item.tag, item.conversation_history, query_vector=vectors.get(i)
+                )
+            except Exception as e:
+                logger.error(f"Batch chat item {i} failed: {e}")
+                prepared[i] = e
+                continue
+            prepared[i] = (search_results, prompt, embed_share * (i in vectors) + time.perf_counter() - started)
+        return prepared
+
+    async def _answer_prepared(
+        self,
+        prepared: Union[Tuple[List[SearchResult], str, float], Exception],
+        slots: asyncio.Semaphore
+    ) -> BatchChatResult:
+        if isinstance(prepared, Exception):
+            return self._batch_error(prepared, 0.0)
+        search_results, prompt, seconds = prepared
+        async with slots:
+            started = time.perf_counter()
+            try:
+                call = self._llm_call()
+                if call is not None:
+                    with call:
+                        answer = await self.llm_client.generate(prompt)
+                else:
+                    answer = self._retrieval_only_answer(search_results)
+            except Exception as e:
+                logger.error(f"Batch chat generation failed: {e}")
+                return self._batch_error(e, seconds + time.perf_counter() - started)
+            seconds += time.perf_counter() - started
+        return BatchChatResult(
+            answer=answer,
+            sources=self._extract_sources(search_results),
+            confidence=self._confidence(search_results),
+            latency_ms=round(seconds * 1000, 1)
+        )
+
+    @staticmethod
+    def _batch_error(error: Exception, seconds: float) -> BatchChatResult:
+        # Same answer as a failed /chat, with the error on its own for the caller
+        return BatchChatResult(
+            answer=f"I encountered an error processing your request: {str(error)}",
+            sources=[],
+            confidence=0.0,
+            latency_ms=round(seconds * 1000, 1),
+            error=str(error)
+        )
+
+    async def chat_stream(
+        self,
+        question: str,
+        tag: str,
+        conversation_history: Optional[List[Dict]] = None,
+        conversation_id: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
         """
-        Delegates document ingestion.
+        Streaming variant of `chat`. Validation and retrieval run before this returns, so their
+        errors are raised to the caller; the returned iterator yields a "sources" event, then
+        "delta" events as the LLM produces the answer, then "done" (or "error").
         """
-        # IngestionService handles logic/errors
-        return self.ingestion_service.ingest_document(file_bytes, filename, tag, uploaded_by)
+        started = time.perf_counter()
+        conversation = await self._load_conversation(conversation_id)
+        search_results, prompt = await asyncio.to_thread(self._prepare_chat, question, tag, conversation_history, conversation)
+        return self._stream_answer(search_results, prompt, started, question, conversation)
+
+    async def _stream_answer(
+        self,
+        search_results: List[SearchResult],
+        prompt: str,
+        started: float,
+        question: str = "",
+        conversation: Optional[Conversation] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        yield {
+            "event": "sources",
+            "data": {"sources": self._extract_sources(search_results), "confidence": self._confidence(search_results)}
+        }
+        call = self._llm_call()
+        if call is None:
+            yield {"event": "delta", "data": {"text": self._retrieval_only_answer(search_results)}}
+            yield {"event": "done", "data": {"first_token_ms": 0.0}}
+            return
+        logger.info("RAG Chat: Streaming response from LLM")
+        first_token = None
+        answer: List[str] = []
+        try:
+            with call:
+                async for delta in self.llm_client.generate_stream(prompt):
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                        metrics.observe("rag_chat_first_token_seconds", first_token)
+                    answer.append(delta)
+                    yield {"event": "delta", "data": {"text": delta}}
+        except RAGException as e:
+            logger.error(f"Chat stream failed: {e}")
+            yield {"event": "error", "data": {"detail": e.message}}
+            return
+        metrics.observe("rag_chat_stream_seconds", time.perf_counter() - started)
+        if conversation is not None:
+            # Saved before "done", so a follow-up sent on "done" sees this turn
+            await self.session_service.record_turn(conversation, question, "".join(answer), summarize=self._llm_healthy())
+        yield {"event": "done", "data": {"first_token_ms": round((first_token or 0.0) * 1000, 1)}}
+
+    def submit_ingest(
+        self,
+        file_path: str,
+        document_hash: str,
+        filename: str,
+        tag: Optional[str],
+        uploaded_by: str,
+        document_id: Optional[int] = None
+    ) -> IngestJobResponse:
+        """
+        Queues a spooled upload for the background ingestion workers.
+        Pass `document_id` to ingest it as a new version of an existing document.
+        """
+        return self.job_service.submit(file_path, document_hash, filename, tag, uploaded_by, document_id)
+
+    def submit_rechunk(self, document_id: int) -> IngestJobResponse:
+        """
+        Queues a rebuild of a document's chunks from its stored page text, with the chunk settings
+        of the active index collection. Refused when the configured CHUNK_* settings differ from
+        those: applying them takes an index rebuild (scripts/rebuild_index.py).
+        """
+        return self.job_service.submit_rechunk(document_id)
+
+    def submit_rechunks_by_tag(self, tag: str) -> List[IngestJobResponse]:
+        """
+        Queues a rechunk job for every document carrying `tag` ("*" for all), like `submit_rechunk`.
+        """
+        if not tag or not tag.strip():
+            raise ValidationError("Tag cannot be empty")
+        return self.job_service.submit_rechunks_by_tag(tag.strip())
+
+    def get_ingest_job(self, job_id: str) -> IngestJobResponse:
+        return self.job_service.get_status(job_id)
+
+    def delete_document(self, document_id: int) -> DeleteResponse:
+        """
+        Removes a document with its pages, chunks and vectors.
+        """
+        return self.ingestion_service.delete_document(document_id)
+
+    def delete_documents_by_tag(self, tag: str) -> DeleteResponse:
+        """
+        Removes every document carrying `tag`.
+        """
+        if not tag or not tag.strip():
+            raise ValidationError("Tag cannot be empty")
+        return self.ingestion_service.delete_by_tag(tag.strip())
 
     def retrieve(self, query: str, tag: str, top_k: Optional[int] = None) -> SearchResponse:
         """
@@ -89,58 +358,194 @@ class RAGService:
              # Return empty results
              return SearchResponse(results=[])
 
-    def health(self) -> HealthResponse:
-        return self.health_service.get_system_status()
+    async def health(self) -> HealthResponse:
+        return await self.health_service.get_system_status()
 
-    def _build_prompt(self, question: str, context: List[SearchResult], history: Optional[List[Dict]]) -> str:
-        # 1. Format Context
-        context_str = ""
-        # Truncate context based on tokens (rough char count approx)
-        max_chars = self.config.retrieval.max_context_tokens * 4 
-        current_chars = 0
-        
-        for res in context:
-            # Format: [Source Page X] Content
-            snippet = f"[{res.document_name} Page {res.page_number}] {res.text}\n\n"
-            if current_chars + len(snippet) > max_chars:
+    def _build_prompt(
+        self,
+        question: str,
+        context: List[SearchResult],
+        history: Optional[List[Dict]],
+        summary: str = ""
+    ) -> Tuple[str, List[SearchResult]]:
+        """
+        Assemble the prompt within the model's context window, counting LLM tokens. Returns the
+        prompt and the results whose text it includes.
+        """
+        # 1. Format History (last HISTORY_MESSAGES messages, [{"role": "user", "content": "..."}, ...]),
+        # after the summary of earlier messages in a server-side conversation
+        history_lines = [f"SUMMARY OF EARLIER MESSAGES: {summary}\n"] if summary else []
+        history_lines += [
+            f"{msg.get('role', 'unknown').upper()}: {msg.get('content', '')}\n"
+            for msg in (history or [])[-HISTORY_MESSAGES:]
+        ]
+
+        # 2. Count the prompt without context, dropping the oldest history if even that does not fit.
+        # Only this frame and the snippet headers are tokenized here; chunk counts come from ingest
+        window = self.token_counter.budget(self.config.llm.context_window - self.config.llm.max_tokens)
+        while True:
+            frame = PROMPT_TEMPLATE.format(context=NO_CONTEXT, history="".join(history_lines), question=question)
+            frame_tokens = self.token_counter.count(frame)
+            if frame_tokens <= window or not history_lines:
                 break
-            context_str += snippet
-            current_chars += len(snippet)
-        
-        if not context_str:
-            context_str = "No relevant documents found."
-
-        # 2. Format History
-        history_str = ""
-        if history:
-            # Take last 5 exchanges
-            # assuming format [{"role": "user", "content": "..."}, ...]
-            for msg in history[-5:]:
-                role = msg.get("role", "unknown").upper()
-                content = msg.get("content", "")
-                history_str += f"{role}: {content}\n"
-
-        # 3. Assemble
-        prompt = f"""System: You are a helpful corporate assistant. Use the provided context to answer the question.
-If the answer is not in the context, state that you don't know. Always cite the page numbers provided in the context.
+            history_lines.pop(0)
 
-Relevant Context:
-{context_str}
+        # 3. Pack context greedily by score. A snippet that does not fit is skipped rather than
+        # ending the context, so smaller lower-ranked ones still use the rest of the budget
+        budget = min(self.config.retrieval.max_context_tokens, window - frame_tokens)
+        ranked = sorted(context, key=lambda r: r.score, reverse=True)
+        headers = [f"[{res.document_name} Page {res.pages}] " for res in ranked]
+        header_tokens = self.token_counter.count_batch(headers)
+        text_tokens = self.token_counter.fill([res.token_count for res in ranked], [res.text for res in ranked])
+        separator_tokens = self.token_counter.count(SNIPPET_SEPARATOR)
 
-Conversation History:
-{history_str}
+        snippets: List[str] = []
+        included: List[SearchResult] = []
+        spent = 0
+        for res, header, header_count, text_count in zip(ranked, headers, header_tokens, text_tokens):
+            # Pieces are counted apart; allow one token for a merge across their boundary
+            cost = header_count + text_count + separator_tokens + 1
+            if spent + cost > budget:
+                continue
+            snippets.append(f"{header}{res.text}{SNIPPET_SEPARATOR}")
+            included.append(res)
+            spent += cost
 
-User Question: {question}
+        # 4. Assemble
+        prompt = PROMPT_TEMPLATE.format(
+            context="".join(snippets) or NO_CONTEXT,
+            history="".join(history_lines),
+            question=question
+        )
+        return prompt, included
 
-Assistant Answer:"""
-        return prompt
+    def _prepare_chat(
+        self,
+        question: str,
+        tag: str,
+        history: Optional[List[Dict]],
+        conversation: Optional[Conversation] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> Tuple[List[SearchResult], str]:
+        self._validate_question(question)
+        logger.info(f"RAG Chat: Retrieving for '{question}' in [{tag}]")
+        if conversation is None:
+            search_results = self.retrieval_service.search(
+                query=question,
+                tag=tag,
+                top_k=self.config.retrieval.top_k,
+                threshold=self.config.retrieval.similarity_threshold,
+                query_vector=query_vector
+            )
+        else:
+            search_results = self.session_service.retrieve(conversation, question, tag)
+            history = conversation.messages
+        # Read-only: hand the request's DB connection back to the pool before waiting on the LLM
+        self.retrieval_service.chunk_repo.session.rollback()
+        search_results = self._merge_overlapping(search_results)
+        if self.compression_service is not None and self.config.retrieval.context_compression:
+            search_results = self.compression_service.compress(question, search_results)
+        # Sources and confidence cover the results that made it into the prompt
+        prompt, included = self._build_prompt(question, search_results, history, conversation.summary if conversation else "")
+        return included, prompt
+
+    async def _load_conversation(self, conversation_id: Optional[str]) -> Optional[Conversation]:
+        if not conversation_id or self.session_service is None:
+            return None
+        return await asyncio.to_thread(self.session_service.load, conversation_id)
+
+    @staticmethod
+    def _merge_overlapping(results: List[SearchResult]) -> List[SearchResult]:
+        """
+        Merge results from the same document whose chunks overlap (CHUNK_OVERLAP) or are adjacent
+        into one span, so repeated text is not sent twice. Offsets are in whole-document
+        coordinates, so chunks starting on different pages merge too; a span keeps the best score
+        of its chunks and the pages they cover. Results without stored offsets are left as they are.
+        """
+        groups: Dict[int, List[SearchResult]] = {}
+        merged: List[SearchResult] = []
+        for res in results:
+            if res.document_id is None or res.start_offset is None or res.end_offset is None:
+                merged.append(res)
+            else:
+                groups.setdefault(res.document_id, []).append(res)
+
+        for group in groups.values():
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            group.sort(key=lambda r: r.start_offset)
+            span = group[0]
+            for res in group[1:]:
+                if res.start_offset > span.end_offset + MAX_MERGE_GAP:
+                    merged.append(span)
+                    span = res
+                    continue
+                if res.end_offset > span.end_offset:
+                    overlap = span.end_offset - res.start_offset
+                    joined = span.text + res.text[overlap:] if overlap >= 0 else f"{span.text} {res.text}"
+                    span = span.model_copy(update={"text": joined, "end_offset": res.end_offset, "token_count": None})
+                last_page = max(span.page_end or span.page_number, res.page_end or res.page_number)
+                if last_page > span.page_number:
+                    span = span.model_copy(update={"page_end": last_page})
+                if res.score > span.score:
+                    span = span.model_copy(update={"score": res.score})
+            merged.append(span)
+
+        merged.sort(key=lambda r: r.score, reverse=True)
+        return merged
+
+    @staticmethod
+    def _chat_key(question: str, tag: str, history: Optional[List[Dict]], conversation_id: Optional[str] = None) -> Tuple:
+        # Only what reaches the prompt; case and whitespace differences ask the same question
+        def normalize(text: Any) -> str:
+            return " ".join(str(text).split()).casefold()
+        turns = tuple(
+            (normalize(msg.get("role", "unknown")), normalize(msg.get("content", "")))
+            for msg in (history or [])[-HISTORY_MESSAGES:]
+        )
+        return normalize(question), (tag or "").strip(), turns, conversation_id
+
+    def _llm_call(self) -> Optional[ContextManager[None]]:
+        """Context to make one LLM call in (recording its outcome), or None while the circuit refuses calls."""
+        if self.llm_breaker is None:
+            return nullcontext()
+        permit = self.llm_breaker.allow()
+        if permit is not None:
+            return self.llm_breaker.track(permit)
+        metrics.inc("rag_chat_retrieval_only_total")
+        logger.warning("RAG Chat: LLM circuit is open, answering with sources only")
+        return None
+
+    def _llm_healthy(self) -> bool:
+        # Extra LLM calls (conversation summaries) are skipped unless the circuit is closed
+        return self.llm_breaker is None or self.llm_breaker.state == CLOSED
+
+    @staticmethod
+    def _retrieval_only_answer(search_results: List[SearchResult]) -> str:
+        if not search_results:
+            return NO_SOURCES_ANSWER
+        excerpts = []
+        for res in sorted(search_results, key=lambda r: r.score, reverse=True)[:RETRIEVAL_ONLY_SOURCES]:
+            text = " ".join(res.text.split())
+            if len(text) > EXCERPT_CHARS:
+                text = text[:EXCERPT_CHARS].rsplit(" ", 1)[0] + " ..."
+            excerpts.append(f"[{res.document_name} Page {res.pages}] {text}")
+        return RETRIEVAL_ONLY_ANSWER + SNIPPET_SEPARATOR + SNIPPET_SEPARATOR.join(excerpts)
+
+    @staticmethod
+    def _confidence(search_results: List[SearchResult]) -> float:
+        # Average similarity of the retrieved context
+        if not search_results:
+            return 0.0
+        return sum(r.score for r in search_results) / len(search_results)
 
     def _extract_sources(self, context: List[SearchResult]) -> List[str]:
         # Dedup sources: "Filename (Page X)"
         seen = set()
         sources = []
         for res in context:
-            citation = f"{res.document_name} (Page {res.page_number})"
+            citation = f"{res.document_name} (Page {res.pages})"
             if citation not in seen:
                 sources.append(citation)
                 seen.add(citation)
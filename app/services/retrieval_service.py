@@ -22,9 +22,10 @@ class RetrievalService:
         self.document_repo = document_repo
         self.config = config
 
-    def search(self, query: str, tag: str, top_k: int = None, threshold: float = None) -> List[SearchResult]:
+    def search(self, query: str, tag: str, top_k: int = None, threshold: float = None, query_vector: Optional[List[float]] = None) -> List[SearchResult]:
         """
         Execute search strategy: Vector -> Fallback Keyword.
+        Pass `query_vector` when the query is already embedded.
         """
         k = top_k or self.config.top_k
         thresh = threshold if threshold is not None else self.config.similarity_threshold
@@ -46,7 +47,12 @@ class RetrievalService:
                     score=1.0, # Explicitly requested score for wildcard
                     page_number=chunk.page_number,
                     document_name=fname,
-                    document_id=chunk.document_id
+                    document_id=chunk.document_id,
+                    token_count=chunk.token_count,
+                    chunk_id=chunk.id,
+                    start_offset=chunk.start_offset,
+                    end_offset=chunk.end_offset,
+                    page_end=chunk.page_end
                 ))
             return results
         
@@ -54,7 +60,7 @@ class RetrievalService:
         
         try:
             # 1. Vector Search
-            results = self._vector_search(query, k, thresh, tag)
+            results = self._vector_search(query, k, thresh, tag, query_vector)
             
             # 2. Fallback if needed
             if len(results) < k:
@@ -80,42 +86,13 @@ class RetrievalService:
             logger.error(f"Search failed: {e}")
             raise RetrievalError(f"Search operation failed: {e}")
 
-    def _vector_search(self, query: str, k: int, threshold: float, tag: str) -> List[SearchResult]:
+    def _vector_search(self, query: str, k: int, threshold: float, tag: str, query_vector: Optional[List[float]] = None) -> List[SearchResult]:
         try:
-            query_vector = self.embedding_client.embed_text(query)
+            if query_vector is None:
+                query_vector = self.embedding_client.embed_text(query)
             
-            # We assume vector_store supports filter by tag if provided
-            # The interface signature we designed didn't explicitly have filter arg in abstract method,
-            # but we can assume the concrete implementation might handle it or we update interface.
-            # Wait, Task 5 instructions "similarity_search(query_vector: list[float], k: int, threshold: float)".
-            # It did NOT include `filter`.
-            # But the existing `vectorstore.py` logic used filter.
-            # If I want to support multi-tenancy/tags, I should have included `filter` in the interface or `kwargs`.
-            # I will use `similarity_search` and if the concrete class supports it via kwargs (not type hinted in abstract) or modify interface.
-            # I defined `similarity_search` in `vector_client.py` as:
-            # `similarity_search(query_vector: List[float], k: int, threshold: float) -> ...`
-            # The concrete `PGVectorStore.similarity_search` assumes no filter or I need to update it.
-            # BUT `PGVector` functionality relies on it.
-            # I should strictly follow the interface I defined in Task 5. 
-            # If Task 5 interface was insufficient, I am stuck. 
-            # Wait, I *did* implement `PGVectorStore` to *only* accept those args.
-            # So I cannot filter by tag at vector level with current interface!
-            # This is a regression from original code.
-            # However, I must follow the instructions.
-            # The instructions for Task 5 said:
-            # "similarity_search(query_vector: list[float], k: int, threshold: float)"
-            # It did NOT mention filter.
-            # I will proceed without filter for now, or filter in memory (inefficient but compliant).
-            # OR I can update the interface.
-            # Given I am in "Execution", I should have caught this.
-            # I will ignore filter for now to respect the strict interface I built, or I can hack it.
-            # Actually, `PGVectorStore` implementation I wrote in Task 5:
-            # `similarity_search(query_vector: List[float], k: int, threshold: float) -> List[Tuple[str, float, Dict]]`
-            # Logic: `self.vectorstore.similarity_search_with_score_by_vector(..., k=k)` (no filter).
-            # So the filter is lost.
-            # I will add a TODO: Restore metadata filtering.
-            
-            raw_results = self.vector_store.similarity_search(query_vector, k, threshold)
+            # The store filters by tag before ranking, so k results are not eaten up by other tags
+            raw_results = self.vector_store.similarity_search(query_vector, k, threshold, tag=tag or None)
             
             formatted_results = []
             for text, score, metadata in raw_results:
@@ -132,15 +109,36 @@ class RetrievalService:
                     score=score,
                     page_number=metadata.get('page_number', 0),
                     document_name=fname,
-                    document_id=metadata.get('document_id')
+                    document_id=metadata.get('document_id'),
+                    token_count=metadata.get('token_count'),
+                    chunk_id=metadata.get('chunk_id'),
+                    start_offset=metadata.get('start_offset'),
+                    end_offset=metadata.get('end_offset'),
+                    page_end=metadata.get('page_end')
                 ))
             
-            return formatted_results
+            return self._with_offsets(formatted_results)
             
         except Exception as e:
             logger.warning(f"Vector search warning: {e}")
             return []
 
+    def _with_offsets(self, results: List[SearchResult]) -> List[SearchResult]:
+        # LangChain vector metadata has no offsets or page span (they change when a revision moves a chunk): read them from the chunks
+        missing = [r.chunk_id for r in results if r.start_offset is None and r.chunk_id is not None]
+        if not missing:
+            return results
+        try:
+            offsets = self.chunk_repo.get_offsets([int(chunk_id) for chunk_id in missing])
+        except Exception as e:
+            # Only merging overlapping results needs them
+            logger.warning(f"Could not load chunk offsets: {e}")
+            return results
+        for res in results:
+            if res.start_offset is None and res.chunk_id is not None and int(res.chunk_id) in offsets:
+                res.start_offset, res.end_offset, res.page_end = offsets[int(res.chunk_id)]
+        return results
+
     def _fallback_keyword_search(self, query: str, k: int, tag: Optional[str] = None) -> List[SearchResult]:
         try:
             chunks = self.chunk_repo.search_by_text(query, limit=k, tag=tag)
@@ -159,7 +157,12 @@ class RetrievalService:
                     score=0.5, # Arbitrary score for keyword match
                     page_number=chunk.page_number,
                     document_name=fname,
-                    document_id=chunk.document_id
+                    document_id=chunk.document_id,
+                    token_count=chunk.token_count,
+                    chunk_id=chunk.id,
+                    start_offset=chunk.start_offset,
+                    end_offset=chunk.end_offset,
+                    page_end=chunk.page_end
                 ))
             return results
         except Exception as e:
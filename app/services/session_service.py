@@ -0,0 +1,184 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from app.clients.llm_client import LLMClient
+from app.core.config import RetrievalConfig
+from app.core.metrics import metrics
+from app.core.schemas import SearchResult
+from app.data.repositories import ChatSessionRepository
+from app.services.retrieval_service import RetrievalService
+from loguru import logger
+
+metrics.describe("rag_session_retrievals_total", "Retrievals for chat-session turns, by how the context was found (reused, extended, searched)")
+metrics.describe("rag_session_summaries_total", "Chat-session summaries updated with the messages no longer kept verbatim")
+
+SUMMARY_PROMPT = """Update the summary of a conversation between a user and a corporate assistant with the new messages.
+Keep the facts, names, numbers and open questions the user may refer back to. Reply with the updated summary only, in at most {words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+SUMMARY_WORDS = 150
+# Messages still kept verbatim after the older ones are summarized: the latest exchange
+KEPT_AFTER_SUMMARY = 2
+
+@dataclass
+class Conversation:
+    id: str
+    tag: str = ""
+    summary: str = ""
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    # Embedding of the question `candidates` were retrieved for
+    query_vector: Optional[List[float]] = None
+    candidates: List[SearchResult] = field(default_factory=list)
+    turns: int = 0
+
+class ChatSessionService:
+    """
+    Server-side conversations for /chat with a `conversation_id`. Each conversation keeps the
+    latest SESSION_RECENT_MESSAGES messages verbatim and a rolling summary of everything
+    older, which the LLM updates with the messages that drop out, so the prompt stays the same
+    size however long the conversation gets. It also keeps the results retrieved for the last
+    searched question: a follow-up close to that question (SESSION_REUSE_SIMILARITY) reuses
+    them without searching, any other follow-up searches and keeps the earlier results in the
+    running with their scores discounted by the similarity of the two questions.
+
+    State is read and written in short sessions of its own, so no DB connection is held while
+    the LLM answers. Concurrent turns of one conversation do not lock it: the last one to
+    finish is saved.
+    """
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        retrieval_service: RetrievalService,
+        llm_client: LLMClient,
+        config: RetrievalConfig
+    ):
+        self.session_factory = session_factory
+        self.retrieval_service = retrieval_service
+        self.llm_client = llm_client
+        self.config = config
+
+    def load(self, conversation_id: str) -> Conversation:
+        session = self.session_factory()
+        try:
+            row = ChatSessionRepository(session).get(conversation_id)
+        finally:
+            session.close()
+        if row is None:
+            return Conversation(conversation_id)
+        return Conversation(
+            id=row.id,
+            tag=row.tag,
+            summary=row.summary,
+            messages=list(row.messages),
+            query_vector=row.query_vector,
+            candidates=[SearchResult(**candidate) for candidate in row.candidates],
+            turns=row.turns
+        )
+
+    def retrieve(self, conversation: Conversation, question: str, tag: str) -> List[SearchResult]:
+        """Context for the next turn of `conversation`, which keeps it for the turns after."""
+        top_k, threshold = self.config.top_k, self.config.similarity_threshold
+        if question.strip() == "*":
+            return self.retrieval_service.search(question, tag, top_k, threshold)
+        vector = [float(x) for x in self.retrieval_service.embedding_client.embed_text(question)]
+        previous = conversation.candidates if conversation.tag == tag and conversation.query_vector else []
+        similarity = self._cosine(vector, conversation.query_vector) if previous else 0.0
+        if previous and similarity >= self.config.session_reuse_similarity:
+            metrics.inc("rag_session_retrievals_total", source="reused")
+            return previous
+
+        results = self.retrieval_service.search(question, tag, top_k, threshold, query_vector=vector)
+        if previous and similarity > 0:
+            seen = {self._key(res) for res in results}
+            carried = [
+                res.model_copy(update={"score": res.score * similarity})
+                for res in previous if self._key(res) not in seen
+            ]
+            results = sorted(results + carried, key=lambda r: r.score, reverse=True)[:top_k]
+            metrics.inc("rag_session_retrievals_total", source="extended")
+        else:
+            metrics.inc("rag_session_retrievals_total", source="searched")
+        conversation.tag, conversation.query_vector, conversation.candidates = tag, vector, results
+        return results
+
+    async def record_turn(self, conversation: Conversation, question: str, answer: str, summarize: bool = True) -> None:
+        """
+        Add an answered question to the conversation and save it. Messages beyond
+        SESSION_RECENT_MESSAGES are folded into the summary (unless `summarize` is off, e.g.
+        while the LLM is failing); a failure to save is logged, the answer stands.
+        """
+        conversation.messages = conversation.messages + [
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": answer}
+        ]
+        conversation.turns += 1
+        if len(conversation.messages) > self.config.session_recent_messages and summarize:
+            await self._summarize(conversation)
+        # Bounded even while the summary cannot be updated
+        conversation.messages = conversation.messages[-2 * max(self.config.session_recent_messages, KEPT_AFTER_SUMMARY):]
+        try:
+            await asyncio.to_thread(self._save, conversation)
+        except Exception as e:
+            logger.warning(f"Could not save conversation {conversation.id}: {e}")
+
+    async def _summarize(self, conversation: Conversation) -> None:
+        older = conversation.messages[:-KEPT_AFTER_SUMMARY]
+        prompt = SUMMARY_PROMPT.format(
+            words=SUMMARY_WORDS,
+            summary=conversation.summary or "(none)",
+            messages="".join(f"{msg['role'].upper()}: {msg['content']}\n" for msg in older)
+        )
+        try:
+            conversation.summary = (await self.llm_client.generate(prompt)).strip()
+        except Exception as e:
+            logger.warning(f"Could not update the summary of conversation {conversation.id}: {e}")
+            return
+        conversation.messages = conversation.messages[-KEPT_AFTER_SUMMARY:]
+        metrics.inc("rag_session_summaries_total")
+
+    def _save(self, conversation: Conversation) -> None:
+        session = self.session_factory()
+        try:
+            repo = ChatSessionRepository(session)
+            if conversation.turns == 1:
+                # New conversations clear out the idle ones
+                repo.delete_idle(self.config.session_ttl_hours * 3600)
+            repo.save(conversation.id, {
+                "tag": conversation.tag,
+                "summary": conversation.summary,
+                "messages": conversation.messages,
+                "query_vector": conversation.query_vector,
+                "candidates": [self._dump(res) for res in conversation.candidates],
+                "turns": conversation.turns
+            })
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    @staticmethod
+    def _dump(res: SearchResult) -> Dict[str, Any]:
+        # Every field, the internal ones (excluded from API responses) included
+        return {name: getattr(res, name) for name in SearchResult.model_fields}
+
+    @staticmethod
+    def _key(res: SearchResult) -> Tuple:
+        return (res.chunk_id,) if res.chunk_id is not None else (res.document_id, res.page_number, res.text)
+
+    @staticmethod
+    def _cosine(a: List[float], b: List[float]) -> float:
+        a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+        if a.shape != b.shape:
+            # Embedded by another model (the index was rebuilt meanwhile)
+            return 0.0
+        return float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
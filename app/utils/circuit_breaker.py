@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, NamedTuple, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class Permit(NamedTuple):
+    """A call let through by `allow()`: the circuit generation it belongs to, and whether it is the half-open trial."""
+    generation: int
+    trial: bool
+
+class CircuitBreaker:
+    """
+    Fails fast while a dependency is failing. Closed, it records the outcome of the last
+    `window` calls and opens once at least `min_calls` of them were recorded and the share of
+    failures reaches `failure_rate`. Open, `allow()` refuses every call for `open_seconds`;
+    after that it turns half-open and lets one trial call through: its success closes the
+    circuit, its failure opens it again.
+
+    Every opening starts a new generation. Outcomes of calls let through in an earlier one
+    (e.g. a slow call admitted while closed that ends after the circuit opened) are dropped,
+    and only the admitted trial moves a half-open circuit.
+    """
+    def __init__(
+        self,
+        failure_rate: float,
+        window: int,
+        min_calls: int,
+        open_seconds: float,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outcomes: deque = deque(maxlen=window) # True for a failure
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._generation = 0
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> Optional[Permit]:
+        """A permit if a call may go ahead, else None; the call must then be tracked (`track()`)."""
+        with self._lock:
+            if self._state == CLOSED:
+                return Permit(self._generation, trial=False)
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.open_seconds:
+                    return None
+                self._state = HALF_OPEN
+            if self._trial_running:
+                return None
+            self._trial_running = True
+            return Permit(self._generation, trial=True)
+
+    @contextmanager
+    def track(self, permit: Permit) -> Iterator[None]:
+        """Record the outcome of a permitted call: an exception is a failure, cancellation is neither."""
+        try:
+            yield
+        except Exception:
+            self._record(permit, failed=True)
+            raise
+        except BaseException:
+            with self._lock:
+                if permit.trial and permit.generation == self._generation:
+                    self._trial_running = False
+            raise
+        else:
+            self._record(permit, failed=False)
+
+    def _record(self, permit: Permit, failed: bool) -> None:
+        with self._lock:
+            if permit.generation != self._generation:
+                # Let through before the circuit last opened
+                return
+            if permit.trial:
+                self._trial_running = False
+                if failed:
+                    self._open()
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+            self._outcomes.append(failed)
+            if len(self._outcomes) >= self.min_calls and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._opened_at = self._clock()
+        self._generation += 1
+        self._outcomes.clear()
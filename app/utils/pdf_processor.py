@@ -1,43 +1,319 @@
 import io
+import gc
+import os
+import zlib
 import hashlib
-from typing import Dict, Optional
+import resource
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import BinaryIO, Deque, Iterator, List, Optional, Tuple, Union
 import pypdf
 from app.core.exceptions import IngestionError
 from loguru import logger
 
-def calculate_file_hash(file_bytes: bytes) -> str:
+# Raw PDF bytes, or a path to a PDF spooled on disk
+PDFSource = Union[bytes, str]
+
+HASH_READ_SIZE = 1024 * 1024
+MIN_PAGE_TEXT_CHARS = 10
+# How often memory is re-checked while waiting for it to come back under the RSS budget
+RSS_WAIT_POLL_SECONDS = 1.0
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+@contextmanager
+def open_pdf_stream(source: PDFSource) -> Iterator[BinaryIO]:
+    """Yield a binary stream over the source without copying file contents into memory."""
+    if isinstance(source, bytes):
+        yield io.BytesIO(source)
+    else:
+        with open(source, "rb") as f:
+            yield f
+
+def calculate_file_hash(source: PDFSource) -> str:
     """Generate SHA-256 hash for duplicate detection."""
-    return hashlib.sha256(file_bytes).hexdigest()
+    if isinstance(source, bytes):
+        return hashlib.sha256(source).hexdigest()
+    hasher = hashlib.sha256()
+    with open(source, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b""):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def calculate_text_hash(text: str) -> str:
+    """SHA-256 of page or chunk text, used to detect unchanged content between revisions."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def compress_text(text: str) -> bytes:
+    """zlib-compressed UTF-8 page text, as stored for re-chunking without re-parsing the PDF."""
+    return zlib.compress(text.encode("utf-8"), 6)
 
-def validate_pdf(file_bytes: bytes) -> bool:
-    """Check if file appears to be a valid PDF."""
-    if not file_bytes.startswith(b"%PDF"):
-        return False
+def decompress_text(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is unavailable)."""
+    rss = process_rss_bytes("self")
+    return rss if rss is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def process_rss_bytes(pid) -> Optional[int]:
+    """Resident set size of a process from /proc, None where it cannot be read."""
     try:
-        io_bytes = io.BytesIO(file_bytes)
-        pypdf.PdfReader(io_bytes)
-        return True
-    except Exception:
-        return False
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
 
-def extract_text_from_pdf(file_bytes: bytes) -> Dict[int, str]:
+def release_page_cache(reader: pypdf.PdfReader) -> None:
     """
-    Extract text from PDF file.
-    Returns: Dictionary mapping page_number (1-based) to text content.
+    Drop the objects pypdf has resolved so far (content streams, fonts, images). They are
+    re-read from the file if needed again; without this a reader's memory grows with every
+    page extracted.
     """
-    try:
-        reader = pypdf.PdfReader(io.BytesIO(file_bytes))
-        pages_text = {}
-        
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
-            if text and len(text.strip()) > 10:
-                pages_text[i + 1] = text.strip()
-                
-        if not pages_text:
-            raise IngestionError("No extractable text found in PDF")
-            
-        return pages_text
-    except Exception as e:
-        logger.error(f"PDF Extraction failed: {e}")
-        raise IngestionError(f"PDF Extraction failed: {e}")
+    reader.resolved_objects.clear()
+
+def _clean_page_text(text: Optional[str]) -> Optional[str]:
+    """Strip page text, dropping pages with no meaningful content."""
+    if text and len(text.strip()) > MIN_PAGE_TEXT_CHARS:
+        return text.strip()
+    return None
+
+# --- Process pool worker side ---
+# Each worker process keeps the last document it opened, so consecutive
+# page ranges of the same file are served without re-parsing it.
+_worker_path: Optional[str] = None
+_worker_file: Optional[BinaryIO] = None
+_worker_reader: Optional[pypdf.PdfReader] = None
+
+def _extract_page_range(path: str, start: int, end: int, release: bool = False) -> List[Tuple[int, str]]:
+    global _worker_path, _worker_file, _worker_reader
+    if _worker_path != path:
+        if _worker_file is not None:
+            _worker_file.close()
+        _worker_file = open(path, "rb")
+        _worker_reader = pypdf.PdfReader(_worker_file)
+        _worker_path = path
+
+    pages = []
+    for index in range(start, end):
+        text = _clean_page_text(_worker_reader.pages[index].extract_text())
+        if text:
+            pages.append((index + 1, text))
+    if release:
+        release_page_cache(_worker_reader)
+    return pages
+
+class PDFDocument:
+    """
+    A validated, opened PDF. Pages are extracted lazily via `iter_pages`.
+    Large documents are read in windows of pages, releasing parsed objects after each window.
+    """
+    def __init__(self, source: PDFSource, reader: pypdf.PdfReader, extractor: "PDFExtractor", large: bool = False):
+        self.source = source
+        self.reader = reader
+        self.page_count = len(reader.pages)
+        self.large = large
+        self._extractor = extractor
+
+    def iter_pages(self) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (page_number, text) in page order, 1-based, skipping pages without text.
+        Large on-disk documents are split into page ranges and extracted across the process pool;
+        each range is yielded as soon as it (and every range before it) is done.
+        """
+        try:
+            if self._extractor.should_parallelize(self.source, self.page_count):
+                yield from self._iter_parallel()
+            else:
+                yield from self._iter_serial()
+        except IngestionError:
+            raise
+        except Exception as e:
+            logger.error(f"PDF Extraction failed: {e}")
+            raise IngestionError(f"PDF Extraction failed: {e}")
+
+    def _iter_serial(self) -> Iterator[Tuple[int, str]]:
+        if self.large:
+            yield from self._iter_windows()
+            return
+        for index, page in enumerate(self.reader.pages):
+            text = _clean_page_text(page.extract_text())
+            if text:
+                yield index + 1, text
+
+    def _iter_windows(self) -> Iterator[Tuple[int, str]]:
+        """
+        Extract `window_pages` pages at a time, releasing pypdf's object cache after each window
+        so memory stays flat however long the document is. When RSS is still above the budget
+        after a release, the window shrinks; at a single page extraction waits for memory to
+        come back under the budget, and fails the document if it does not.
+        """
+        window = self._extractor.window_pages
+        start = 0
+        while start < self.page_count:
+            end = min(start + window, self.page_count)
+            for index in range(start, end):
+                text = _clean_page_text(self.reader.pages[index].extract_text())
+                if text:
+                    yield index + 1, text
+            release_page_cache(self.reader)
+            start = end
+
+            rss = self._extractor.over_budget() if start < self.page_count else 0
+            if rss and window > 1:
+                window = max(1, window // 2)
+                self._extractor.log_over_budget(rss, end, f"extracting {window} page(s) per window")
+            elif rss:
+                self._extractor.wait_for_budget(end)
+
+    def _iter_parallel(self) -> Iterator[Tuple[int, str]]:
+        """
+        Keep a bounded window of ranges in flight (pool.map would submit them all at once), so
+        extracted text never piles up far ahead of a slower consumer. While RSS (this process and
+        the pool workers) is above the budget, workers release their parsed objects after every
+        range and the window shrinks; at one range extraction waits for memory to come back under
+        the budget, and fails the document if it does not.
+        """
+        step = self._extractor.pages_per_task
+        ranges = deque((start, min(start + step, self.page_count)) for start in range(0, self.page_count, step))
+        window = 2 * self._extractor.max_workers
+        release = self.large
+        in_flight: Deque[Future] = deque()
+        try:
+            while ranges or in_flight:
+                if ranges and len(in_flight) < window:
+                    start, end = ranges.popleft()
+                    in_flight.append(self._extractor.pool.submit(_extract_page_range, self.source, start, end, release))
+                    continue
+                yield from in_flight.popleft().result()
+
+                rss = self._extractor.over_budget() if ranges else 0
+                if not rss:
+                    continue
+                release = True
+                next_page = ranges[0][0]
+                if window > 1:
+                    window = max(1, window // 2)
+                    self._extractor.log_over_budget(rss, next_page, f"extracting {window} range(s) at a time")
+                elif not in_flight:
+                    self._extractor.wait_for_budget(next_page)
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+class PDFExtractor:
+    """
+    Opens PDFs once and extracts page text, fanning page ranges out to a
+    process pool for large documents. Create once and reuse; the pool is
+    started lazily and shared across documents.
+
+    Files of at least `large_min_bytes` are read in large-document mode: pages are extracted
+    in windows and the parser's object cache is released after each one (in the pool workers
+    too). `rss_budget_bytes` (0 = none) caps the RSS of this process and the pool workers
+    together: extraction slows down while it is exceeded, waits up to `rss_wait_seconds` once
+    it is down to a page (or range) at a time, then fails the document.
+    """
+    def __init__(
+        self,
+        max_workers: int = 0,
+        pages_per_task: int = 16,
+        parallel_min_pages: int = 32,
+        large_min_bytes: int = 8 * 1024 * 1024,
+        window_pages: int = 16,
+        rss_budget_bytes: int = 0,
+        rss_wait_seconds: float = 30.0
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_task = max(1, pages_per_task)
+        self.parallel_min_pages = parallel_min_pages
+        self.large_min_bytes = large_min_bytes
+        self.window_pages = max(1, window_pages)
+        self.rss_budget_bytes = rss_budget_bytes
+        self.rss_wait_seconds = rss_wait_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: the API process runs threads, which do not mix well with fork
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def total_rss_bytes(self) -> int:
+        """RSS of this process and the pool workers."""
+        total = current_rss_bytes()
+        if self._pool is not None:
+            # The executor does not expose its worker processes otherwise
+            for process in list((self._pool._processes or {}).values()):
+                total += process_rss_bytes(process.pid) or 0
+        return total
+
+    def over_budget(self) -> int:
+        """Total RSS when it is above the budget even after a garbage collection, else 0."""
+        budget = self.rss_budget_bytes
+        if not budget or self.total_rss_bytes() <= budget:
+            return 0
+        gc.collect()
+        rss = self.total_rss_bytes()
+        return rss if rss > budget else 0
+
+    def log_over_budget(self, rss: int, page: int, action: str) -> None:
+        logger.warning(f"RSS {rss / 2**20:.0f}MB over the {self.rss_budget_bytes / 2**20:.0f}MB budget before page {page + 1}; {action}")
+
+    def wait_for_budget(self, page: int) -> None:
+        """
+        Wait up to `rss_wait_seconds` for RSS to come back under the budget (e.g. as other
+        documents finish), before extracting page `page + 1`. Raises IngestionError if it does not.
+        """
+        deadline = time.monotonic() + self.rss_wait_seconds
+        while True:
+            rss = self.over_budget()
+            if not rss:
+                return
+            if time.monotonic() >= deadline:
+                raise IngestionError(
+                    f"Memory use ({rss / 2**20:.0f}MB) stayed over the {self.rss_budget_bytes / 2**20:.0f}MB "
+                    f"budget (INGEST_RSS_BUDGET_MB) at page {page + 1}"
+                )
+            time.sleep(RSS_WAIT_POLL_SECONDS)
+
+    def should_parallelize(self, source: PDFSource, page_count: int) -> bool:
+        # Workers re-open the file by path, so in-memory sources are always extracted here
+        return (
+            isinstance(source, str)
+            and self.max_workers > 1
+            and page_count >= self.parallel_min_pages
+        )
+
+    def is_large(self, source: PDFSource) -> bool:
+        size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+        return size >= self.large_min_bytes
+
+    @contextmanager
+    def open(self, source: PDFSource) -> Iterator[PDFDocument]:
+        """
+        Validate and parse the PDF a single time. Raises IngestionError for anything that is not a readable PDF.
+        """
+        large = self.is_large(source)
+        with open_pdf_stream(source) as stream:
+            if not stream.read(4).startswith(b"%PDF"):
+                raise IngestionError("Invalid PDF file")
+            stream.seek(0)
+            try:
+                reader = pypdf.PdfReader(stream)
+            except Exception as e:
+                logger.warning(f"PDF parse failed: {e}")
+                raise IngestionError("Invalid PDF file")
+            if large:
+                logger.info(f"Large-document mode: {len(reader.pages)} pages in windows of {self.window_pages}")
+            yield PDFDocument(source, reader, self, large=large)
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,81 @@
+import queue
+import threading
+from typing import Generic, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+_DONE = object()
+
+class BackgroundIterator(Generic[T]):
+    """
+    Runs an iterable (one pipeline stage) in a background thread and hands its items to the
+    consuming thread through a bounded queue, so the producer runs at most `maxsize` items ahead.
+    Exceptions raised by the producer are re-raised in the consumer. Use as a context manager:
+    leaving the block early stops the producer after its current item.
+    """
+    def __init__(self, iterable: Iterable[T], maxsize: int, name: str = "pipeline-stage"):
+        self._iterable = iterable
+        self._queue: queue.Queue = queue.Queue(max(1, maxsize))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def __enter__(self) -> "BackgroundIterator[T]":
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def __iter__(self) -> Iterator[T]:
+        while True:
+            item = self._queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        iterator = iter(self._iterable)
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    return
+            self._put(_DONE)
+        except BaseException as e:
+            self._put(_Failure(e))
+        finally:
+            # Release what the stage holds (e.g. a generator suspended mid-document)
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def _put(self, item) -> bool:
+        # Poll so a consumer that stopped reading can still stop us
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Group items into lists of `size` (the last one may be shorter)."""
+    batch: List[T] = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,66 @@
+import re
+import hashlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+SIMHASH_BITS = 64
+# Four 16-bit bands: two signatures within 3 bits of each other always share at least one band
+BAND_COUNT = 4
+BAND_BITS = SIMHASH_BITS // BAND_COUNT
+SHINGLE_SIZE = 3
+
+_TOKEN_RE = re.compile(r"\w+")
+_MASK = (1 << SIMHASH_BITS) - 1
+
+def _shingles(text: str) -> List[str]:
+    tokens = _TOKEN_RE.findall(text.lower())
+    if len(tokens) < SHINGLE_SIZE:
+        return tokens
+    return [" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)]
+
+def simhash(text: str) -> Optional[int]:
+    """
+    64-bit SimHash over word 3-shingles, returned as a signed int so it fits a Postgres BIGINT.
+    Near-identical texts (boilerplate with a changed date or name) differ in only a few bits.
+    None for text without word tokens (rule lines, dot leaders, symbol-only table cells): it has
+    nothing to compare, and one shared signature would make all of it near-duplicates.
+    """
+    counts = Counter(_shingles(text))
+    if not counts:
+        return None
+    digests = b"".join(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest() for s in counts)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(counts), SIMHASH_BITS)
+    weights = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+    votes = weights @ (bits.astype(np.int64) * 2 - 1)
+    value = int("".join("1" if v > 0 else "0" for v in votes), 2)
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK).count("1")
+
+def simhash_bands(signature: int) -> List[int]:
+    """Split a signature into BAND_COUNT non-negative band values (the LSH bucket keys)."""
+    value = signature & _MASK
+    band_mask = (1 << BAND_BITS) - 1
+    return [(value >> (BAND_BITS * i)) & band_mask for i in range(BAND_COUNT)]
+
+class SimHashIndex:
+    """In-memory LSH index over SimHash signatures, bucketed by band."""
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self._buckets: Dict[Tuple[int, int], List[Tuple[int, Any]]] = {}
+
+    def add(self, signature: int, key: Any) -> None:
+        for band, value in enumerate(simhash_bands(signature)):
+            self._buckets.setdefault((band, value), []).append((signature, key))
+
+    def find(self, signature: int) -> Optional[Any]:
+        """Key of the closest indexed signature within `max_distance`, or None."""
+        best_key, best_distance = None, self.max_distance + 1
+        for band, value in enumerate(simhash_bands(signature)):
+            for candidate, key in self._buckets.get((band, value), []):
+                distance = hamming_distance(signature, candidate)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+        return best_key
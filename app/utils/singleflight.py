@@ -0,0 +1,36 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto one in-flight computation: the first
+    caller starts it, later callers wait for its result (or exception). Nothing is cached:
+    once the computation finishes, the next call with that key runs again.
+
+    The computation runs as its own task, so a caller that is cancelled does not cancel it for
+    the others. Not thread-safe: use from a single event loop.
+    """
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Result of `func()` for `key`, and whether it was shared with an earlier caller."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task), shared
+
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark a failure as retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
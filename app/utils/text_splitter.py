@@ -1,7 +1,14 @@
-from typing import List
+import re
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.core.config import settings
 
+# Pages are joined with this separator; chunk offsets are positions in the joined document text
+PAGE_SEPARATOR = "\n\n"
+DEFAULT_SEPARATORS = ["\n\n", "\n", ". ", "! ", "? ", ", ", " "]
+
 def clean_text(text: str) -> str:
     """
     Remove excessive whitespace and normalize text.
@@ -24,5 +31,244 @@ def split_text_into_chunks(text: str, chunk_size: int = None, chunk_overlap: int
         length_function=len,
         separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
     )
-    
+
     return text_splitter.split_text(text)
+
+# Sentence ends: terminal punctuation followed by whitespace, or a blank line
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+# Longer "sentences" (lists, tables without punctuation) are cut further, at line breaks where possible
+MAX_SENTENCE_CHARS = 400
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """
+    [start, end) spans of the sentences in `text`, in order. Slicing from the start of one span
+    to the end of a later one keeps the original text between them.
+    """
+    spans: List[Tuple[int, int]] = []
+    start = 0
+    for match in [*SENTENCE_BREAK.finditer(text), None]:
+        end = match.start() if match else len(text)
+        while end - start > MAX_SENTENCE_CHARS:
+            # Cut at the last line break in reach, else the last space
+            limit = start + MAX_SENTENCE_CHARS
+            cut = text.rfind("\n", start + 1, limit)
+            if cut == -1:
+                cut = text.rfind(" ", start + 1, limit)
+            if cut == -1:
+                cut = limit
+            spans.append((start, cut))
+            start = cut
+        spans.append((start, end))
+        if match:
+            start = match.end()
+    return [(s, e) for s, e in spans if text[s:e].strip()]
+
+# A NamedTuple rather than a dataclass: cheap to build by the thousand and to pickle out of worker processes
+class TextChunk(NamedTuple):
+    text: str
+    page_number: int  # page the chunk starts on
+    page_end: int     # page the chunk ends on
+    start_offset: int # [start, end) in the document text (pages joined by PAGE_SEPARATOR)
+    end_offset: int
+
+# --- Length units ---
+
+class LengthUnit(ABC):
+    """How chunk_size and chunk_overlap are measured."""
+    @abstractmethod
+    def limit(self, text: str, start: int, size: int) -> int:
+        """Index in `text` where `size` units counted from `start` end (len(text) if it is shorter)."""
+        pass
+
+    @abstractmethod
+    def overlap_start(self, text: str, start: int, end: int, size: int) -> int:
+        """Index in `text` where the last `size` units of text[start:end] begin."""
+        pass
+
+class CharacterUnit(LengthUnit):
+    def limit(self, text: str, start: int, size: int) -> int:
+        return min(start + size, len(text))
+
+    def overlap_start(self, text: str, start: int, end: int, size: int) -> int:
+        return max(start, end - size)
+
+class TokenUnit(LengthUnit):
+    """
+    Measures length in model tokens using a HuggingFace fast tokenizer's offset mapping,
+    so chunks line up with the embedding model's sequence limit.
+    """
+    # Rough upper bound used to size the tokenized window; widened when a window runs short
+    CHARS_PER_TOKEN = 8
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def _offsets(self, text: str) -> List[Tuple[int, int]]:
+        encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        return encoded["offset_mapping"]
+
+    def limit(self, text: str, start: int, size: int) -> int:
+        window = size * self.CHARS_PER_TOKEN
+        while True:
+            end = min(start + window, len(text))
+            offsets = self._offsets(text[start:end])
+            if len(offsets) > size:
+                return start + offsets[size - 1][1]
+            if end == len(text):
+                return end
+            window *= 2
+
+    def overlap_start(self, text: str, start: int, end: int, size: int) -> int:
+        if size <= 0:
+            return end
+        offsets = self._offsets(text[start:end])
+        if len(offsets) <= size:
+            return start
+        return start + offsets[-size][0]
+
+# --- Chunker ---
+
+class StreamingChunker:
+    """
+    Recursive-separator chunker that is built once and streams over a whole document.
+
+    Pages are consumed lazily from an iterator of (page_number, text). Page breaks are the
+    preferred cut points, but chunks may cross them, so short page tails are merged into the
+    next chunk instead of becoming tiny chunks. Each chunk is yielded as soon as the text
+    after it has arrived, together with its page span and document offsets.
+    """
+    def __init__(
+        self,
+        chunk_size: int,
+        chunk_overlap: int,
+        length_unit: Optional[LengthUnit] = None,
+        separators: Sequence[str] = DEFAULT_SEPARATORS
+    ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.length_unit = length_unit or CharacterUnit()
+        self.separators = list(separators)
+
+    def chunks(self, pages: Iterable[Tuple[int, str]]) -> Iterator[TextChunk]:
+        size, overlap = self.chunk_size, self.chunk_overlap
+        # Character lengths are plain index arithmetic; skip the LengthUnit calls in the hot loop
+        by_chars = type(self.length_unit) is CharacterUnit
+        limit_of = self.length_unit.limit
+        find_cut, next_start = self._find_cut, self._next_start
+
+        buffer = ""
+        buffer_offset = 0 # document offset of buffer[0]
+        pos = 0           # start of the next chunk within buffer
+        page_offsets: List[int] = [] # document offset where each buffered page starts
+        page_numbers: List[int] = []
+        emitted_end = 0
+
+        for page_number, text in pages:
+            if not text:
+                continue
+            if page_offsets:
+                buffer += PAGE_SEPARATOR
+            page_offsets.append(buffer_offset + len(buffer))
+            page_numbers.append(page_number)
+            buffer += text
+            length = len(buffer)
+
+            while True:
+                limit = pos + size if by_chars else limit_of(buffer, pos, size)
+                if limit >= length:
+                    break # wait for more text before cutting
+                cut = find_cut(buffer, pos, limit, page_offsets, buffer_offset)
+                chunk = self._make_chunk(buffer, buffer_offset, pos, cut, page_offsets, page_numbers)
+                if chunk:
+                    emitted_end = chunk.end_offset
+                    yield chunk
+                if overlap <= 0:
+                    pos = cut
+                elif by_chars and cut - overlap <= pos:
+                    pos = cut # chunk no longer than the overlap: no room to overlap
+                else:
+                    pos = next_start(buffer, pos, cut)
+
+            # Drop consumed text so the buffer stays around one chunk plus one page
+            if pos > size:
+                buffer = buffer[pos:]
+                buffer_offset += pos
+                pos = 0
+                drop = bisect_right(page_offsets, buffer_offset) - 1
+                if drop > 0:
+                    del page_offsets[:drop], page_numbers[:drop]
+
+        # Remainder, unless it is only the overlap of the last chunk
+        chunk = self._make_chunk(buffer, buffer_offset, pos, len(buffer), page_offsets, page_numbers)
+        if chunk and chunk.end_offset > emitted_end:
+            yield chunk
+
+    def split_pages(self, pages: Iterable[Tuple[int, str]]) -> List[TextChunk]:
+        return list(self.chunks(pages))
+
+    def _find_cut(self, buffer: str, start: int, limit: int, page_offsets: List[int], buffer_offset: int) -> int:
+        # Only cut in the second half of the window, so chunks are not tiny
+        floor = start + (limit - start) // 2
+        # A page break wins: cuts then realign with pages after an edit, instead of every
+        # later chunk boundary shifting (which would defeat chunk reuse on re-ingestion)
+        index = bisect_right(page_offsets, buffer_offset + limit) - 1
+        if index >= 0 and page_offsets[index] - buffer_offset > floor:
+            return page_offsets[index] - buffer_offset
+        # Otherwise the coarsest separator in that half
+        for separator in self.separators:
+            index = buffer.rfind(separator, floor, limit)
+            if index != -1:
+                return index + len(separator)
+        return limit
+
+    def _next_start(self, buffer: str, start: int, cut: int) -> int:
+        if self.chunk_overlap <= 0:
+            return cut
+        overlap = self.length_unit.overlap_start(buffer, start, cut, self.chunk_overlap)
+        # Start the overlap on a word boundary
+        space = buffer.find(" ", overlap, cut)
+        if overlap > start and buffer[overlap - 1] not in " \n" and space != -1:
+            overlap = space + 1
+        return overlap if overlap > start else cut
+
+    def _make_chunk(
+        self,
+        buffer: str,
+        buffer_offset: int,
+        start: int,
+        end: int,
+        page_offsets: List[int],
+        page_numbers: List[int]
+    ) -> Optional[TextChunk]:
+        raw = buffer[start:end]
+        text = raw.strip()
+        if not text:
+            return None
+        start_offset = buffer_offset + start + (len(raw) - len(raw.lstrip()))
+        end_offset = start_offset + len(text)
+        # The first buffered page always starts at or before buffer_offset
+        return TextChunk(
+            text,
+            page_numbers[bisect_right(page_offsets, start_offset) - 1],
+            page_numbers[bisect_right(page_offsets, end_offset - 1) - 1],
+            start_offset,
+            end_offset
+        )
+
+def create_chunker(
+    chunk_size: int,
+    chunk_overlap: int,
+    length_unit: str = "chars",
+    tokenizer_name: Optional[str] = None
+) -> StreamingChunker:
+    """Build a chunker for the configured length unit ("chars" or "tokens")."""
+    if length_unit == "chars":
+        return StreamingChunker(chunk_size, chunk_overlap)
+    if length_unit == "tokens":
+        # Imported lazily: only token-based chunking needs the tokenizer
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        return StreamingChunker(chunk_size, chunk_overlap, TokenUnit(tokenizer))
+    raise ValueError(f"Unknown chunk length unit '{length_unit}' (expected 'chars' or 'tokens')")
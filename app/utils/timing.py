@@ -0,0 +1,67 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+class StageTimer:
+    """
+    Busy time per named stage of one operation.
+
+    Time is exclusive: when a stage runs inside another on the same thread (e.g. a chunker
+    pulling pages from the extractor), the inner stage's time is not counted twice. The timer is
+    thread-safe, so pipeline threads can report into it; stages that overlap across threads can
+    therefore add up to more than `elapsed`.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._seconds: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        stack: List[List] = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = [time.perf_counter(), 0.0] # start, time spent in nested stages
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            stack.pop()
+            total = time.perf_counter() - frame[0]
+            if stack:
+                stack[-1][1] += total
+            self.add(name, total - frame[1])
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._seconds[name] = self._seconds.get(name, 0.0) + seconds
+
+    def timed(self, name: str, func: Callable[..., T]) -> Callable[..., T]:
+        """Wrap `func` so every call is counted as `name` (on whichever thread runs it)."""
+        def wrapper(*args, **kwargs) -> T:
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def iterate(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """Yield from `iterable`, counting only the time spent producing each item as `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def seconds(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._seconds)
@@ -0,0 +1,57 @@
+import math
+from typing import List, Optional, Sequence
+from loguru import logger
+
+class TokenCounter:
+    """
+    Counts tokens with the LLM's tokenizer (a HuggingFace fast tokenizer), for prompt budgeting.
+    Without one, tokens are estimated as `chars_per_token` characters each, rounded up; 3 is
+    above what current LLM vocabularies produce for prose, but text such as code, tables or
+    non-Latin scripts can take more, so budgets built on estimates keep `estimate_margin` of
+    the space unused (`budget()`).
+    """
+    def __init__(self, tokenizer=None, chars_per_token: float = 3.0, estimate_margin: float = 0.15):
+        self.tokenizer = tokenizer
+        self.chars_per_token = chars_per_token
+        self.estimate_margin = estimate_margin
+
+    @property
+    def exact(self) -> bool:
+        """True when counts come from the tokenizer rather than estimated from text length."""
+        return self.tokenizer is not None
+
+    def budget(self, tokens: int) -> int:
+        """How much of `tokens` may be filled with counted text: all of it, less the margin for estimates."""
+        return tokens if self.exact else int(tokens * (1 - self.estimate_margin))
+
+    def count(self, text: str) -> int:
+        return self.count_batch([text])[0]
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [math.ceil(len(text) / self.chars_per_token) for text in texts]
+        encoded = self.tokenizer(list(texts), add_special_tokens=False)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def fill(self, counts: Sequence[Optional[int]], texts: Sequence[str]) -> List[int]:
+        """`counts` (e.g. stored at ingest) with the missing ones counted from the matching `texts`."""
+        filled = list(counts)
+        missing = [i for i, count in enumerate(filled) if count is None]
+        for i, count in zip(missing, self.count_batch([texts[i] for i in missing])):
+            filled[i] = count
+        return filled
+
+def create_token_counter(tokenizer_name: Optional[str]) -> TokenCounter:
+    """Counter for the named tokenizer; falls back to estimating when none is set or it cannot be loaded."""
+    if not tokenizer_name:
+        logger.warning("LLM_TOKENIZER is not set: prompt budgets use token estimates from text length, with a safety margin")
+        return TokenCounter()
+    try:
+        # Imported lazily, like the token-based chunker
+        from transformers import AutoTokenizer
+        return TokenCounter(AutoTokenizer.from_pretrained(tokenizer_name))
+    except Exception as e:
+        logger.warning(f"Could not load tokenizer '{tokenizer_name}', estimating tokens from text length: {e}")
+        return TokenCounter()
@@ -0,0 +1,94 @@
+"""
+Microbenchmark: per-page recursive splitting (split_text_into_chunks) vs. the streaming chunker.
+
+Usage:
+    python scripts/benchmark_chunker.py                 # synthetic 2,000-page document
+    python scripts/benchmark_chunker.py --pages 10000
+    python scripts/benchmark_chunker.py --pdf tests/Remote_Work_policy.pdf
+"""
+import sys
+import os
+import time
+import random
+import argparse
+import textwrap
+from typing import Callable, List, Tuple
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.utils.pdf_processor import PDFExtractor
+from app.utils.text_splitter import StreamingChunker, split_text_into_chunks
+
+WORDS = (
+    "employee policy leave remote work manager approval request days week office equipment "
+    "security device report contract salary benefit holiday notice period compliance training"
+).split()
+
+def synthetic_pages(count: int, seed: int = 7) -> List[Tuple[int, str]]:
+    """
+    Pages of 2-4 KB laid out like pypdf output: paragraphs of sentences hard-wrapped at 90 columns,
+    with a short trailing paragraph (like a page footer).
+    """
+    rng = random.Random(seed)
+    pages = []
+    for page_num in range(1, count + 1):
+        paragraphs = []
+        for _ in range(rng.randint(3, 6)):
+            sentences = [
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + "."
+                for _ in range(rng.randint(3, 7))
+            ]
+            paragraphs.append(textwrap.fill(" ".join(sentences), width=90))
+        paragraphs.append(f"Page {page_num} of {count}.")
+        pages.append((page_num, "\n\n".join(paragraphs)))
+    return pages
+
+def pdf_pages(path: str) -> List[Tuple[int, str]]:
+    with PDFExtractor(max_workers=1).open(path) as pdf:
+        return list(pdf.iter_pages())
+
+def per_page_split(pages: List[Tuple[int, str]], size: int, overlap: int) -> List[str]:
+    return [chunk for _, text in pages for chunk in split_text_into_chunks(text, size, overlap)]
+
+def streaming_split(chunker: StreamingChunker, pages: List[Tuple[int, str]]) -> List[str]:
+    return [chunk.text for chunk in chunker.chunks(iter(pages))]
+
+def measure(name: str, fn: Callable[[], List[str]], total_bytes: int, size: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = fn()
+        best = min(best, time.perf_counter() - started)
+    lengths = sorted(len(c) for c in chunks)
+    tiny = sum(1 for n in lengths if n < size // 4)
+    print(
+        f"{name:<12} {best * 1000:9.1f} ms  {total_bytes / best / 1e6:7.1f} MB/s  "
+        f"{len(chunks) / best:9.0f} chunks/s  {len(chunks):6d} chunks  "
+        f"median {lengths[len(lengths) // 2]:4d} chars  {tiny:5d} under {size // 4} chars"
+    )
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the per-page splitter with the streaming chunker.")
+    parser.add_argument("--pdf", help="Benchmark on the pages of this PDF instead of synthetic text")
+    parser.add_argument("--pages", type=int, default=2000, help="Synthetic document size in pages")
+    parser.add_argument("--chunk-size", type=int, default=settings.ingestion.chunk_size)
+    parser.add_argument("--chunk-overlap", type=int, default=settings.ingestion.chunk_overlap)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per chunker; the best time is reported")
+    args = parser.parse_args()
+
+    pages = pdf_pages(args.pdf) if args.pdf else synthetic_pages(args.pages)
+    total_bytes = sum(len(text.encode("utf-8")) for _, text in pages)
+    print(f"{len(pages)} pages, {total_bytes / 1e6:.1f} MB, chunk_size={args.chunk_size}, overlap={args.chunk_overlap}")
+
+    chunker = StreamingChunker(args.chunk_size, args.chunk_overlap)
+    baseline = measure("per-page", lambda: per_page_split(pages, args.chunk_size, args.chunk_overlap),
+                       total_bytes, args.chunk_size, args.repeat)
+    streaming = measure("streaming", lambda: streaming_split(chunker, pages),
+                        total_bytes, args.chunk_size, args.repeat)
+    print(f"speedup: {baseline / streaming:.2f}x")
+
+if __name__ == "__main__":
+    main()
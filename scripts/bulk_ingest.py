@@ -0,0 +1,293 @@
+"""
+Bulk-load an archive of PDFs (a directory tree or a .zip) without going through the API.
+
+Files are hashed and checked against `documents` up front, extraction + chunking run
+across a process pool, and the results are embedded and written in large batches
+(one transaction per batch). Progress is recorded in a checkpoint file after every
+committed batch, so re-running the same command resumes where it stopped.
+
+Usage:
+    python scripts/bulk_ingest.py /archive/hr --tag HR
+    python scripts/bulk_ingest.py policies.zip --tag Legal --workers 8 --batch-docs 50
+"""
+import sys
+import os
+import json
+import time
+import shutil
+import signal
+import zipfile
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+from loguru import logger
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.api.dependencies import build_ingestion_service, get_chunk_params
+from app.data.database import get_db_session
+from app.data.repositories import CollectionRepository, DocumentRepository
+from app.services.ingestion_service import IngestionService, PreparedDocument, chunk_pages
+from app.utils.pdf_processor import PDFExtractor, calculate_file_hash
+from app.utils.text_splitter import StreamingChunker, TextChunk, create_chunker
+
+# --- Process pool worker side ---
+_worker_extractor: Optional[PDFExtractor] = None
+_worker_chunker: Optional[StreamingChunker] = None
+
+def _prepare_file(
+    key: str,
+    path: str,
+    chunk_params: Tuple[int, int, str, str]
+) -> Tuple[str, List[Tuple[int, str]], Dict[int, bytes], List[TextChunk]]:
+    """
+    Extract and chunk one PDF. Runs in a pool process; pages are read serially there.
+    `chunk_params` are those of the active index collection (see get_chunk_params).
+    """
+    global _worker_extractor, _worker_chunker
+    if _worker_extractor is None:
+        _worker_extractor = PDFExtractor(
+            max_workers=1,
+            large_min_bytes=settings.ingestion.large_pdf_min_bytes,
+            window_pages=settings.ingestion.large_pdf_window_pages,
+            rss_budget_bytes=settings.ingestion.rss_budget_bytes,
+            rss_wait_seconds=settings.ingestion.rss_wait_seconds
+        )
+        chunk_size, chunk_overlap, length_unit, tokenizer_name = chunk_params
+        _worker_chunker = create_chunker(
+            chunk_size,
+            chunk_overlap,
+            length_unit=length_unit,
+            tokenizer_name=tokenizer_name
+        )
+    with _worker_extractor.open(path) as pdf:
+        page_hashes, page_texts, page_chunks = chunk_pages(pdf.iter_pages(), _worker_chunker)
+    return key, page_hashes, page_texts, page_chunks
+
+def _hash_file(key: str, path: str) -> Tuple[str, str]:
+    return key, calculate_file_hash(path)
+
+# --- Checkpoint ---
+class Checkpoint:
+    """
+    JSON record of finished files, keyed by their path relative to the source.
+    Rewritten atomically after every batch so a crash never leaves it half-written.
+    """
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.data: Dict = {"source": source, "done": {}, "skipped": {}, "failed": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data.update(json.load(f))
+            logger.info(
+                f"Resuming from checkpoint {path}: {len(self.data['done'])} done, "
+                f"{len(self.data['skipped'])} skipped, {len(self.data['failed'])} failed"
+            )
+
+    def is_finished(self, key: str, retry_failed: bool) -> bool:
+        if key in self.data["done"] or key in self.data["skipped"]:
+            return True
+        return key in self.data["failed"] and not retry_failed
+
+    def mark_done(self, key: str, document_hash: str, document_id: int, chunks: int) -> None:
+        self.data["failed"].pop(key, None)
+        self.data["done"][key] = {"hash": document_hash, "document_id": document_id, "chunks": chunks}
+
+    def mark_skipped(self, key: str, reason: str) -> None:
+        self.data["failed"].pop(key, None)
+        self.data["skipped"][key] = reason
+
+    def mark_failed(self, key: str, error: str) -> None:
+        self.data["failed"][key] = error
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+# --- Source discovery ---
+def discover_pdfs(source: str, workdir: str, pending: Callable[[str], bool]) -> Dict[str, str]:
+    """
+    Map checkpoint key -> local path for every PDF under `source`.
+    Zip members are only extracted (into `workdir`) when they still need processing.
+    """
+    files = {}
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for member in archive.infolist():
+                if member.is_dir() or not member.filename.lower().endswith(".pdf"):
+                    continue
+                if pending(member.filename):
+                    files[member.filename] = archive.extract(member, workdir)
+    elif os.path.isdir(source):
+        for root, _, names in os.walk(source):
+            for name in sorted(names):
+                if not name.lower().endswith(".pdf"):
+                    continue
+                path = os.path.join(root, name)
+                key = os.path.relpath(path, source)
+                if pending(key):
+                    files[key] = path
+    else:
+        raise ValueError(f"{source} is neither a directory nor a zip archive")
+    return files
+
+class Throughput:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.documents = 0
+        self.pages = 0
+        self.chunks = 0
+
+    def add(self, documents: List[PreparedDocument]) -> None:
+        self.documents += len(documents)
+        self.pages += sum(doc.pages_ingested for doc in documents)
+        self.chunks += sum(len(doc.page_chunks) for doc in documents)
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return (
+            f"{self.documents} docs, {self.pages} pages, {self.chunks} chunks in {elapsed:.1f}s "
+            f"({self.pages / elapsed:.1f} pages/s, {self.chunks / elapsed:.1f} chunks/s)"
+        )
+
+class BulkIngestor:
+    def __init__(self, service: IngestionService, checkpoint: Checkpoint, args: argparse.Namespace):
+        self.service = service
+        self.checkpoint = checkpoint
+        self.args = args
+        self.stats = Throughput()
+        self.batch: List[Tuple[str, PreparedDocument]] = []
+
+    def add(self, key: str, prepared: PreparedDocument) -> None:
+        self.batch.append((key, prepared))
+        batch_chunks = sum(len(doc.page_chunks) for _, doc in self.batch)
+        if len(self.batch) >= self.args.batch_docs or batch_chunks >= self.args.batch_chunks:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        try:
+            responses = self.service.store_documents([doc for _, doc in batch])
+            stored = list(zip(batch, responses))
+        except Exception as e:
+            # Store the batch one by one so a single bad document does not sink the rest
+            logger.warning(f"Batch of {len(batch)} failed ({e}); retrying documents individually")
+            stored = []
+            for key, doc in batch:
+                try:
+                    stored.append(((key, doc), self.service.store_documents([doc])[0]))
+                except Exception as doc_err:
+                    self.checkpoint.mark_failed(key, str(doc_err))
+
+        for (key, doc), response in stored:
+            self.checkpoint.mark_done(key, doc.document_hash, response.document_id, response.chunks_created)
+        self.checkpoint.save()
+        self.stats.add([doc for (_, doc), _ in stored])
+        logger.info(f"Committed batch of {len(stored)}/{len(batch)} docs | total {self.stats.summary()}")
+
+def run(args: argparse.Namespace) -> None:
+    if args.tag not in settings.ingestion.allowed_tags_list:
+        raise SystemExit(f"Invalid tag '{args.tag}'. Allowed: {settings.ingestion.allowed_tags_list}")
+
+    source = os.path.abspath(args.source)
+    checkpoint_path = args.checkpoint or f"{source.rstrip(os.sep)}.checkpoint.json"
+    checkpoint = Checkpoint(checkpoint_path, source)
+    workers = args.workers or os.cpu_count() or 1
+    config = settings.ingestion
+
+    workdir = tempfile.mkdtemp(prefix="bulk_ingest_")
+    session = get_db_session()
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        files = discover_pdfs(source, workdir, lambda key: not checkpoint.is_finished(key, args.retry_failed))
+        logger.info(f"{len(files)} PDF(s) to process from {source} with {workers} worker(s)")
+
+        # 1. Hash everything and drop files already in `documents` (or repeated inside the archive)
+        hashes = dict(pool.map(_hash_file, files.keys(), files.values(), chunksize=8))
+        existing = DocumentRepository(session).get_existing_hashes(list(set(hashes.values())))
+        session.rollback() # end the read transaction; batches open their own
+        seen = set()
+        for key in list(files):
+            doc_hash = hashes[key]
+            if doc_hash in existing or doc_hash in seen:
+                checkpoint.mark_skipped(key, f"duplicate of {doc_hash}")
+                del files[key]
+            elif os.path.getsize(files[key]) > config.max_file_size_bytes and not args.ignore_size_limit:
+                checkpoint.mark_failed(key, f"File size exceeds limit of {config.max_file_size_mb}MB")
+                del files[key]
+            seen.add(doc_hash)
+        checkpoint.save()
+        logger.info(f"{len(files)} new PDF(s) after duplicate check")
+
+        # 2. Extract + chunk across the pool; embed and write in batches as results arrive
+        # Share-locked until the first batch commits, so a concurrent index swap waits for it
+        collection = CollectionRepository(session).get_active(lock=True)
+        ingestor = BulkIngestor(build_ingestion_service(session, collection), checkpoint, args)
+        chunk_params = get_chunk_params(collection, settings)
+        futures = {
+            pool.submit(_prepare_file, key, path, chunk_params): key
+            for key, path in files.items()
+        }
+        for future in as_completed(futures):
+            try:
+                key, page_hashes, page_texts, page_chunks = future.result()
+            except Exception as e:
+                key = futures[future]
+                logger.error(f"Extraction failed for {key}: {e}")
+                checkpoint.mark_failed(key, str(e))
+                continue
+            if not page_hashes:
+                checkpoint.mark_failed(key, "No extractable text found in PDF")
+                continue
+            ingestor.add(key, PreparedDocument(
+                filename=os.path.basename(key),
+                document_hash=hashes[key],
+                tag=args.tag,
+                uploaded_by=args.uploaded_by,
+                pages_ingested=len(page_hashes),
+                page_chunks=page_chunks,
+                page_hashes=page_hashes,
+                page_texts=page_texts
+            ))
+        ingestor.flush()
+        checkpoint.save()
+
+        print(f"Done: {ingestor.stats.summary()}")
+        print(f"Failed: {len(checkpoint.data['failed'])} | Skipped: {len(checkpoint.data['skipped'])} | Checkpoint: {checkpoint_path}")
+    finally:
+        pool.shutdown(cancel_futures=True)
+        session.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory or zip of PDFs.")
+    parser.add_argument("source", help="Directory (searched recursively) or .zip archive of PDFs")
+    parser.add_argument("--tag", required=True, help="Department tag applied to every document")
+    parser.add_argument("--uploaded-by", default="bulk_ingest")
+    parser.add_argument("--workers", type=int, default=settings.ingestion.pdf_extract_workers,
+                        help="Extraction processes (default: PDF_EXTRACT_WORKERS, 0 = one per CPU)")
+    parser.add_argument("--batch-docs", type=int, default=25, help="Max documents per write batch")
+    parser.add_argument("--batch-chunks", type=int, default=5000, help="Max chunks per write batch")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <source>.checkpoint.json)")
+    parser.add_argument("--retry-failed", action="store_true", help="Retry files that failed in a previous run")
+    parser.add_argument("--ignore-size-limit", action="store_true", help="Do not apply MAX_FILE_SIZE_MB")
+    args = parser.parse_args()
+
+    # Ctrl+C stops cleanly; the checkpoint already reflects every committed batch
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    try:
+        run(args)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted. Re-run the same command to resume.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
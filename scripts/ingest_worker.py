@@ -0,0 +1,36 @@
+import sys
+import os
+import signal
+import threading
+from loguru import logger
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.api.dependencies import get_ingestion_worker
+
+def run_worker():
+    """
+    Standalone ingestion worker. Run this instead of (or alongside) the in-process
+    workers, e.g. with INGEST_WORKERS=0 on the API containers.
+    """
+    worker_count = max(1, settings.ingestion.worker_count)
+    worker = get_ingestion_worker()
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down...")
+        stop.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    worker.start(worker_count)
+    logger.info(f"Ingestion worker running with {worker_count} thread(s). Press Ctrl+C to stop.")
+    stop.wait()
+    worker.stop()
+    logger.info("Ingestion worker stopped.")
+
+if __name__ == "__main__":
+    run_worker()
@@ -64,6 +64,8 @@ def init_schema():
             script_path = os.path.join(os.path.dirname(__file__), "setup_db.sql")
             with open(script_path, "r") as f:
                 sql_commands = f.read()
+            # chunks.embedding is sized for the configured embedding model
+            sql_commands = sql_commands.replace("{embedding_dimension}", str(settings.embedding.dimension))
             
             logger.info("Executing setup_db.sql...")
             connection.execute(text(sql_commands))
@@ -0,0 +1,87 @@
+"""
+Move vectors from LangChain's embedding table onto the chunk rows (VECTOR_STORE_MODE=chunks).
+
+Each vector is copied into `chunks.embedding` of the chunk with the same id, in batches of
+chunk ids. The LangChain rows are only removed with --drop-langchain, once the copy is
+complete, so the service can keep running in "langchain" mode until it is switched over.
+
+Usage:
+    python scripts/init_db.py                                   # re-applies setup_db.sql (adds chunks.embedding)
+    python scripts/migrate_vector_storage.py
+    python scripts/migrate_vector_storage.py --drop-langchain   # once running with VECTOR_STORE_MODE=chunks
+"""
+import sys
+import os
+import argparse
+from sqlalchemy import text
+from loguru import logger
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.clients.vector_client import PGVectorStore
+from app.data.database import get_db_session
+from app.data.repositories import CollectionRepository
+
+def copy_vectors(session, collection_id, embedding_table: str, batch_size: int) -> int:
+    copied, last_id = 0, 0
+    while True:
+        # Walk the chunk ids in ranges so each UPDATE stays a short transaction
+        upper = session.execute(
+            text("SELECT max(id) FROM (SELECT id FROM chunks WHERE id > :last ORDER BY id LIMIT :n) batch"),
+            {"last": last_id, "n": batch_size}
+        ).scalar()
+        if upper is None:
+            return copied
+        result = session.execute(
+            text(
+                f"UPDATE chunks SET embedding = e.embedding FROM {embedding_table} e "
+                "WHERE e.collection_id = :collection AND e.id = chunks.id::text "
+                "AND chunks.id > :last AND chunks.id <= :upper AND chunks.embedding IS NULL"
+            ),
+            {"collection": collection_id, "last": last_id, "upper": upper}
+        )
+        session.commit()
+        copied += result.rowcount
+        last_id = upper
+        logger.info(f"Copied {copied} vectors (chunk ids up to {upper})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy LangChain vectors onto the chunks table.")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Chunks per UPDATE")
+    parser.add_argument("--drop-langchain", action="store_true",
+                        help="Delete the collection's rows from LangChain's table after copying")
+    args = parser.parse_args()
+
+    session = get_db_session()
+    try:
+        # Only the active index collection is migrated; rebuild retired ones instead
+        active = CollectionRepository(session).get_active()
+        store = PGVectorStore(settings.database, embedding_dimension=settings.embedding.dimension).for_collection(active)
+        embedding_table = store.vectorstore.EmbeddingStore.__tablename__
+        collection = store.vectorstore.get_collection(session)
+        if not collection:
+            raise SystemExit(f"Collection '{store.collection_name}' not found")
+
+        copied = copy_vectors(session, collection.uuid, embedding_table, args.batch_size)
+        missing = session.execute(text(
+            f"SELECT count(*) FROM {embedding_table} e WHERE e.collection_id = :collection "
+            "AND NOT EXISTS (SELECT 1 FROM chunks c WHERE c.id::text = e.id AND c.embedding IS NOT NULL)"
+        ), {"collection": collection.uuid}).scalar()
+        print(f"Copied {copied} vectors | {missing} LangChain vectors without a chunk vector")
+
+        if args.drop_langchain:
+            if missing:
+                raise SystemExit("Not dropping LangChain vectors: some were not copied (orphans or failed rows)")
+            deleted = session.execute(
+                text(f"DELETE FROM {embedding_table} WHERE collection_id = :collection"),
+                {"collection": collection.uuid}
+            ).rowcount
+            session.commit()
+            print(f"Deleted {deleted} LangChain vectors; run VACUUM to return the space")
+    finally:
+        session.close()
+
+if __name__ == "__main__":
+    main()
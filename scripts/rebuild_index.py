@@ -0,0 +1,78 @@
+"""
+Rebuild the search index into a new collection while the current one keeps serving, then swap.
+
+The new collection takes the chunking (CHUNK_SIZE, CHUNK_OVERLAP, CHUNK_LENGTH_UNIT) and
+EMBEDDING_MODEL this script runs with; from the swap on, the API chunks and embeds with the
+collection's recorded settings. Documents are rebuilt from their stored page text, so those
+ingested before page text was stored must be uploaded again as a new version first.
+An interrupted run resumes the unfinished collection when started again.
+
+Usage:
+    CHUNK_SIZE=800 CHUNK_OVERLAP=100 python scripts/rebuild_index.py
+    python scripts/rebuild_index.py --no-swap          # build (or resume) only
+    python scripts/rebuild_index.py --gc-only          # delete retired collections
+"""
+import sys
+import os
+import argparse
+from loguru import logger
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.core.config import settings
+from app.api.dependencies import get_index_rebuild_service
+
+def main():
+    parser = argparse.ArgumentParser(description="Blue/green rebuild of the search index.")
+    parser.add_argument("--name", help="Name of the new collection (default: <PGVECTOR_COLLECTION_NAME>_<timestamp>)")
+    parser.add_argument("--restart", action="store_true", help="Start a new collection instead of resuming an unfinished one")
+    parser.add_argument("--no-swap", action="store_true", help="Build the collection but do not activate it")
+    parser.add_argument("--warm-queries", type=int, default=200, help="Searches run against the new index before the swap")
+    parser.add_argument("--gc-delay", type=float, default=30.0,
+                        help="Seconds to wait after the swap before deleting the old collection")
+    parser.add_argument("--keep-old", action="store_true", help="Do not delete the old collection")
+    parser.add_argument("--gc-only", action="store_true", help="Only delete retired collections")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows per delete when collecting")
+    args = parser.parse_args()
+
+    service = get_index_rebuild_service()
+    if args.gc_only:
+        count = service.collect_retired(batch_size=args.batch_size)
+        print(f"Deleted {count} retired collection(s)")
+        return
+
+    collection_id = service.start(args.name, resume=not args.restart)
+    logger.info(
+        f"Building collection {collection_id}: chunk_size={settings.ingestion.chunk_size} "
+        f"overlap={settings.ingestion.chunk_overlap} unit={settings.ingestion.chunk_length_unit} "
+        f"model={settings.embedding.model}"
+    )
+    stats = service.build(
+        collection_id,
+        progress=lambda done, total: logger.info(f"Rebuilt {done}/{total} document(s)")
+    )
+    print(
+        f"Built {stats.documents_built} document(s): {stats.chunks_created} chunks created, "
+        f"{stats.chunks_reused} reused, {len(stats.failed)} failed"
+    )
+    for document_id, error in stats.failed.items():
+        print(f"  document {document_id}: {error}")
+    if stats.failed:
+        sys.exit("Not swapping: fix or delete the failed documents and run again to resume")
+    if args.no_swap:
+        return
+
+    logger.info("Building the ANN index...")
+    service.build_index(collection_id)
+    if args.warm_queries > 0:
+        warmed = service.warm(collection_id, args.warm_queries)
+        logger.info(f"Ran {warmed} warm-up queries")
+
+    previous = service.swap(collection_id)
+    print(f"Collection {collection_id} is active (retired {previous})")
+    if not args.keep_old:
+        service.collect_retired(grace_seconds=args.gc_delay, batch_size=args.batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -28,9 +28,14 @@ def reset_db():
             # 1. Drop Business Data Tables
             # We use DROP TABLE to ensure schema changes in setup_db.sql are applied upon re-init
             try:
+                connection.execute(text("DROP TABLE IF EXISTS ingestion_jobs CASCADE;"))
+                connection.execute(text("DROP TABLE IF EXISTS chat_sessions CASCADE;"))
+                connection.execute(text("DROP TABLE IF EXISTS document_pages CASCADE;"))
                 connection.execute(text("DROP TABLE IF EXISTS chunks CASCADE;"))
+                connection.execute(text("DROP TABLE IF EXISTS index_collection_documents CASCADE;"))
                 connection.execute(text("DROP TABLE IF EXISTS documents CASCADE;"))
-                logger.info("Dropped 'chunks' and 'documents' tables.")
+                connection.execute(text("DROP TABLE IF EXISTS index_collections CASCADE;"))
+                logger.info("Dropped 'ingestion_jobs', 'chat_sessions', 'document_pages', 'chunks', 'documents' and index collection tables.")
             except Exception as e:
                 logger.warning(f"Could not drop tables: {e}")
 
@@ -10,21 +10,167 @@ CREATE TABLE IF NOT EXISTS documents (
     tag VARCHAR(50) NOT NULL,
     uploaded_by VARCHAR(100) NOT NULL,
     page_count INTEGER NOT NULL,
-    created_at TIMESTAMP DEFAULT NOW()
+    version INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
 );
 
+-- Added after the first release; re-running this script upgrades existing databases
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
 CREATE INDEX IF NOT EXISTS idx_documents_tag ON documents(tag);
 CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(document_hash);
 
+-- Index Collections Table (one complete set of chunks and vectors; exactly one is active,
+-- others are being built by scripts/rebuild_index.py or retired and awaiting clean-up)
+CREATE TABLE IF NOT EXISTS index_collections (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) UNIQUE,
+    status VARCHAR(20) NOT NULL DEFAULT 'building',
+    chunk_size INTEGER,
+    chunk_overlap INTEGER,
+    chunk_length_unit VARCHAR(20),
+    embedding_model VARCHAR(255),
+    created_at TIMESTAMP DEFAULT NOW(),
+    activated_at TIMESTAMP,
+    retired_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_index_collections_status ON index_collections(status);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_index_collections_active ON index_collections ((TRUE)) WHERE status = 'active';
+-- The collection in use before blue/green rebuilds: configured settings, PGVECTOR_COLLECTION_NAME
+INSERT INTO index_collections (status, activated_at)
+SELECT 'active', NOW() WHERE NOT EXISTS (SELECT 1 FROM index_collections);
+
 -- Chunks Table
 CREATE TABLE IF NOT EXISTS chunks (
     id SERIAL PRIMARY KEY,
     document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE,
+    collection_id INTEGER REFERENCES index_collections(id) ON DELETE CASCADE,
     page_number INTEGER NOT NULL,
+    page_end INTEGER,
+    start_offset INTEGER,
+    end_offset INTEGER,
     text TEXT NOT NULL,
+    content_hash VARCHAR(64),
+    token_count INTEGER,
+    simhash BIGINT,
+    simhash_band0 INTEGER,
+    simhash_band1 INTEGER,
+    simhash_band2 INTEGER,
+    simhash_band3 INTEGER,
+    canonical_chunk_id INTEGER REFERENCES chunks(id) ON DELETE SET NULL,
+    embedding vector({embedding_dimension}),
     created_at TIMESTAMP DEFAULT NOW()
 );
 
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS token_count INTEGER;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS simhash BIGINT;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS simhash_band0 INTEGER;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS simhash_band1 INTEGER;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS simhash_band2 INTEGER;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS simhash_band3 INTEGER;
+-- Text without word tokens used to get signature 0; it has none now, so it is never a dedup candidate
+UPDATE chunks SET simhash = NULL, simhash_band0 = NULL, simhash_band1 = NULL, simhash_band2 = NULL, simhash_band3 = NULL WHERE simhash = 0;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS canonical_chunk_id INTEGER REFERENCES chunks(id) ON DELETE SET NULL;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS page_end INTEGER;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS start_offset INTEGER;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS end_offset INTEGER;
+-- Used when VECTOR_STORE_MODE=chunks; init_db.py fills in EMBEDDING_DIMENSION (the app refuses to start on a mismatch)
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS embedding vector({embedding_dimension});
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS collection_id INTEGER REFERENCES index_collections(id) ON DELETE CASCADE;
+UPDATE chunks SET collection_id = (SELECT id FROM index_collections WHERE status = 'active') WHERE collection_id IS NULL;
+
 CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id);
+CREATE INDEX IF NOT EXISTS idx_chunks_collection_id ON chunks(collection_id);
+CREATE INDEX IF NOT EXISTS idx_chunks_canonical ON chunks(canonical_chunk_id);
+-- LSH buckets for near-duplicate lookup
+CREATE INDEX IF NOT EXISTS idx_chunks_simhash_band0 ON chunks(simhash_band0);
+CREATE INDEX IF NOT EXISTS idx_chunks_simhash_band1 ON chunks(simhash_band1);
+CREATE INDEX IF NOT EXISTS idx_chunks_simhash_band2 ON chunks(simhash_band2);
+CREATE INDEX IF NOT EXISTS idx_chunks_simhash_band3 ON chunks(simhash_band3);
+-- Approximate nearest-neighbour search over chunks.embedding: one partial HNSW index per collection
+-- (idx_chunks_embedding_<collection id>), so a collection being rebuilt never dilutes the active
+-- one's index. Rebuilds create theirs; this creates the active collection's and drops the old global one.
+DO $$
+DECLARE
+    active_id INTEGER := (SELECT id FROM index_collections WHERE status = 'active');
+BEGIN
+    EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS idx_chunks_embedding_%s ON chunks USING hnsw (embedding vector_cosine_ops) WHERE collection_id = %s',
+        active_id, active_id
+    );
+END $$;
+DROP INDEX IF EXISTS idx_chunks_embedding;
+
+-- Document Pages Table (per-page hashes of the current revision, for incremental re-ingestion,
+-- and the zlib-compressed page text, for re-chunking without re-parsing the PDF)
+CREATE TABLE IF NOT EXISTS document_pages (
+    id SERIAL PRIMARY KEY,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    page_number INTEGER NOT NULL,
+    content_hash VARCHAR(64) NOT NULL,
+    text_compressed BYTEA,
+    UNIQUE (document_id, page_number)
+);
+
+ALTER TABLE document_pages ADD COLUMN IF NOT EXISTS text_compressed BYTEA;
+-- Already compressed: keep Postgres from trying again
+ALTER TABLE document_pages ALTER COLUMN text_compressed SET STORAGE EXTERNAL;
+
+CREATE INDEX IF NOT EXISTS idx_document_pages_document_id ON document_pages(document_id);
+
+-- Document revisions a building collection already holds (lets a rebuild catch up before the swap)
+CREATE TABLE IF NOT EXISTS index_collection_documents (
+    collection_id INTEGER NOT NULL REFERENCES index_collections(id) ON DELETE CASCADE,
+    document_id INTEGER NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    document_hash VARCHAR(64) NOT NULL,
+    PRIMARY KEY (collection_id, document_id)
+);
+
+-- Ingestion Jobs Table
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    mode VARCHAR(20) NOT NULL DEFAULT 'create',
+    stage VARCHAR(50) NOT NULL DEFAULT 'queued',
+    progress DOUBLE PRECISION NOT NULL DEFAULT 0,
+    filename VARCHAR(255) NOT NULL,
+    tag VARCHAR(50) NOT NULL,
+    uploaded_by VARCHAR(100) NOT NULL,
+    file_path VARCHAR(1024),
+    document_hash VARCHAR(64),
+    document_id INTEGER REFERENCES documents(id) ON DELETE SET NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result JSONB,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW(),
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS mode VARCHAR(20) NOT NULL DEFAULT 'create';
+-- Rechunk jobs have no upload
+ALTER TABLE ingestion_jobs ALTER COLUMN file_path DROP NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs(status, created_at);
+
+-- Server-side chat sessions (conversation_id on /chat)
+CREATE TABLE IF NOT EXISTS chat_sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    tag VARCHAR(50) NOT NULL,
+    summary TEXT NOT NULL DEFAULT '',
+    messages JSONB NOT NULL DEFAULT '[]',
+    query_vector JSONB,
+    candidates JSONB NOT NULL DEFAULT '[]',
+    turns INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_at ON chat_sessions(updated_at);
 
 -- Note: Langchain tables (lc_pg_collection, lc_pg_embedding) are created automatically by the library
@@ -9,6 +9,8 @@ from app.services.ingestion_service import IngestionService
 from app.services.retrieval_service import RetrievalService
 from app.services.health_service import HealthService
 from app.services.rag_service import RAGService
+from app.services.job_service import IngestionJobService
+from app.utils.text_splitter import StreamingChunker
 
 @pytest.fixture
 def mock_config():
@@ -37,6 +39,7 @@ def mock_embedding_client():
 @pytest.fixture
 def mock_vector_store():
     store = MagicMock(spec=VectorStore)
+    store.embeds_in_chunks = False
     store.similarity_search.return_value = []
     store.check_health.return_value = True
     # Default to returning empty list for search
@@ -54,18 +57,35 @@ def mock_document_repo():
 @pytest.fixture
 def mock_chunk_repo():
     repo = MagicMock() # Relaxed mock
-    repo.create_batch.return_value = [MagicMock(id=1)]
+    repo.create_batch.return_value = [1]
     repo.search_by_text.return_value = []
     repo.session = MagicMock()
     return repo
 
 @pytest.fixture
-def ingestion_service(mock_embedding_client, mock_vector_store, mock_document_repo, mock_chunk_repo, mock_config):
+def mock_pdf_extractor():
+    extractor = MagicMock()
+    pdf = extractor.open.return_value.__enter__.return_value
+    pdf.page_count = 1
+    pdf.iter_pages.return_value = iter([(1, "page 1 text")])
+    return extractor
+
+@pytest.fixture
+def mock_job_repo():
+    repo = MagicMock() # Relaxed mock
+    repo.get_by_id.return_value = None
+    repo.session = MagicMock()
+    return repo
+
+@pytest.fixture
+def ingestion_service(mock_embedding_client, mock_vector_store, mock_document_repo, mock_chunk_repo, mock_pdf_extractor, mock_config):
     return IngestionService(
         embedding_client=mock_embedding_client,
         vector_store=mock_vector_store,
         document_repo=mock_document_repo,
         chunk_repo=mock_chunk_repo,
+        pdf_extractor=mock_pdf_extractor,
+        chunker=StreamingChunker(mock_config.ingestion.chunk_size, mock_config.ingestion.chunk_overlap),
         config=mock_config.ingestion
     )
 
@@ -89,11 +109,16 @@ def health_service(mock_vector_store, mock_llm_client, mock_document_repo, mock_
     )
 
 @pytest.fixture
-def rag_service(retrieval_service, ingestion_service, health_service, mock_llm_client, mock_config):
+def job_service(mock_job_repo, mock_document_repo, mock_config):
+    return IngestionJobService(job_repo=mock_job_repo, document_repo=mock_document_repo, config=mock_config.ingestion)
+
+@pytest.fixture
+def rag_service(retrieval_service, ingestion_service, health_service, job_service, mock_llm_client, mock_config):
     return RAGService(
         retrieval_service=retrieval_service,
         ingestion_service=ingestion_service,
         health_service=health_service,
+        job_service=job_service,
         llm_client=mock_llm_client,
         config=mock_config
     )
@@ -4,8 +4,9 @@ import sys
 import os
 from datetime import datetime
 
-API_URL = "http://localhost:8000/chat"
+API_URL = "http://localhost:8000/chat/batch"
 API_KEY = "dev-secret-key-12345"
+BATCH_SIZE = 50 # questions per /chat/batch request (at most CHAT_BATCH_MAX_ITEMS)
 TEST_FILE = "tests/multi_domain_questions.json"
 REPORT_FILE = "tests/latest_report.md"
 
@@ -44,16 +45,32 @@ def run_tests():
         "Hallucination": {"total": 0, "failed": 0} 
     }
 
+    # --- Ask every question up front: the server answers each batch concurrently ---
+    asked = [(q, q.get("tag")) for group in ("group_a", "group_b", "group_c") for q in data[group]]
+    asked += [(q, tag) for q in data["group_d"] for tag in q["tags"]]
+    answers = {}
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    for start in range(0, len(asked), BATCH_SIZE):
+        batch = asked[start:start + BATCH_SIZE]
+        try:
+            resp = requests.post(API_URL, json={"items": [{"query": q["question"], "tag": tag} for q, tag in batch]}, headers=headers)
+            resp.raise_for_status()
+            results = resp.json()["results"]
+        except Exception as e:
+            results = [e] * len(batch)
+        for (q, tag), result in zip(batch, results):
+            answers[(q["question"], tag)] = result
+
     # --- Helper to Test a Question ---
     def test_question(q, override_tag=None):
         tag = override_tag or q.get("tag")
-        payload = {"query": q["question"], "tag": tag}
-        headers = {"Authorization": f"Bearer {API_KEY}"}
-        
+
         try:
-            resp = requests.post(API_URL, json=payload, headers=headers)
-            resp.raise_for_status()
-            ans = resp.json()
+            ans = answers[(q["question"], tag)]
+            if isinstance(ans, Exception):
+                raise ans
+            if ans.get("error"):
+                raise RuntimeError(ans["error"])
             answer_text = ans["answer"].lower()
             
             status = "Correct"
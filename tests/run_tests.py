@@ -4,9 +4,23 @@ import sys
 import os
 
 # Configuration
-API_URL = "http://localhost:8000/chat"
+API_URL = "http://localhost:8000/chat/batch"
 API_KEY = "dev-secret-key-12345"  # From .env
 TEST_FILE = "tests/hr_questions.json"
+BATCH_SIZE = 50 # questions per /chat/batch request (at most CHAT_BATCH_MAX_ITEMS)
+
+def ask_all(payloads):
+    """Responses for every payload, in order; the server answers each batch concurrently."""
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+    responses = []
+    for start in range(0, len(payloads), BATCH_SIZE):
+        try:
+            response = requests.post(API_URL, json={"items": payloads[start:start + BATCH_SIZE]}, headers=headers)
+            response.raise_for_status()
+            responses.extend(response.json()["results"])
+        except Exception as e:
+            responses.extend(e for _ in payloads[start:start + BATCH_SIZE])
+    return responses
 
 def run_tests():
     # Load questions
@@ -24,21 +38,16 @@ def run_tests():
     failed = 0
     results = []
 
-    for q in questions:
+    answers = ask_all([{"query": q["question"], "tag": "HR"} for q in questions])
+
+    for q, data in zip(questions, answers):
         print(f"Running {q['id']}: {q['question'][:50]}...", end="", flush=True)
-        
-        payload = {
-            "query": q["question"],
-            "tag": "HR"
-        }
-        headers = {
-            "Authorization": f"Bearer {API_KEY}"
-        }
 
         try:
-            response = requests.post(API_URL, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
+            if isinstance(data, Exception):
+                raise data
+            if data.get("error"):
+                raise RuntimeError(data["error"])
             answer = data["answer"]
             sources = data["sources"]
             
@@ -66,7 +75,7 @@ def run_tests():
                 pass # Skip automated check for ambiguity for now, user to verify
 
             if is_pass:
-                print(" ✅ PASS")
+                print(f" ✅ PASS ({data['latency_ms'] / 1000:.1f}s)")
                 passed += 1
             else:
                 print(" ❌ FAIL")
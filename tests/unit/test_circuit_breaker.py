@@ -0,0 +1,52 @@
+import pytest
+from app.utils.circuit_breaker import CircuitBreaker
+
+@pytest.fixture
+def clock():
+    return [0.0]
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(failure_rate=0.5, window=10, min_calls=2, open_seconds=30, clock=lambda: clock[0])
+
+def fail(breaker, permit):
+    with pytest.raises(RuntimeError):
+        with breaker.track(permit):
+            raise RuntimeError("upstream down")
+
+def test_slow_call_from_before_the_opening_does_not_move_the_half_open_circuit(breaker, clock):
+    slow = breaker.allow()
+    fail(breaker, breaker.allow())
+    fail(breaker, breaker.allow())
+    assert breaker.state == "open" and breaker.allow() is None
+
+    clock[0] = 31.0
+    trial = breaker.allow()
+    assert trial.trial and breaker.allow() is None
+
+    # Admitted while closed, ends during the trial: dropped, and the trial slot stays taken
+    with breaker.track(slow):
+        pass
+    assert breaker.state == "half_open" and breaker.allow() is None
+    with pytest.raises(KeyboardInterrupt):
+        with breaker.track(slow):
+            raise KeyboardInterrupt
+    assert breaker.allow() is None
+
+    with breaker.track(trial):
+        pass
+    assert breaker.state == "closed"
+
+def test_failed_trial_opens_again_and_a_cancelled_one_frees_the_slot(breaker, clock):
+    fail(breaker, breaker.allow())
+    fail(breaker, breaker.allow())
+    clock[0] = 31.0
+
+    with pytest.raises(KeyboardInterrupt):
+        with breaker.track(breaker.allow()):
+            raise KeyboardInterrupt
+    fail(breaker, breaker.allow())
+
+    assert breaker.state == "open" and breaker.allow() is None
+    clock[0] = 62.0
+    assert breaker.allow().trial
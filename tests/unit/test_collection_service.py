@@ -0,0 +1,49 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from app.core.exceptions import IngestionError
+from app.services.collection_service import IndexRebuildService
+
+@pytest.fixture
+def collection_repo():
+    repo = MagicMock()
+    repo.get_by_id.return_value = MagicMock(id=2, status="building")
+    repo.activate.return_value = 1
+    return repo
+
+@pytest.fixture
+def rebuild_service(mock_config, collection_repo):
+    sessions = []
+    def session_factory():
+        sessions.append(MagicMock())
+        return sessions[-1]
+    service = IndexRebuildService(session_factory, MagicMock(), mock_config)
+    service.sessions = sessions
+    with patch("app.services.collection_service.CollectionRepository", return_value=collection_repo):
+        yield service
+
+def test_swap_catches_up_documents_ingested_during_the_swap(rebuild_service, collection_repo):
+    ingestion = rebuild_service.service_factory.return_value
+    ingestion.rechunk_document.return_value = MagicMock(chunks_created=2, chunks_reused=0)
+    # build: nothing pending; swap txn: doc 7 arrived; catch-up build: doc 7, then done; swap txn: clear
+    collection_repo.get_pending_documents.side_effect = [[], [(7, "h7")], [(7, "h7")], [], []]
+
+    previous = rebuild_service.swap(2)
+
+    assert previous == 1
+    ingestion.rechunk_document.assert_called_once_with(7)
+    collection_repo.mark_built.assert_called_once_with(2, 7, "h7")
+    assert collection_repo.activate.call_count == 2
+    rolled_back = [s for s in rebuild_service.sessions if s.rollback.called]
+    assert len(rolled_back) == 1
+
+def test_swap_refused_when_documents_fail(rebuild_service, collection_repo):
+    ingestion = rebuild_service.service_factory.return_value
+    ingestion.rechunk_document.side_effect = IngestionError("Document 3 has no stored page text")
+    collection_repo.get_pending_documents.return_value = [(3, "h3")]
+
+    with pytest.raises(IngestionError) as exc:
+        rebuild_service.swap(2)
+
+    assert exc.value.details["failed"] == {3: "Document 3 has no stored page text"}
+    collection_repo.mark_built.assert_not_called()
+    collection_repo.activate.assert_not_called()
@@ -0,0 +1,53 @@
+import pytest
+from unittest.mock import MagicMock
+from app.core.schemas import SearchResult
+from app.services.compression_service import CompressionService
+from app.utils.token_counter import TokenCounter
+
+VOCABULARY = ["remote", "days", "manager", "parking", "cafeteria", "holiday"]
+
+def keyword_vector(text):
+    # One dimension per vocabulary word, plus one so unrelated text is not a zero vector
+    words = text.lower().replace(".", " ").split()
+    return [float(sum(w.startswith(v) for w in words)) for v in VOCABULARY] + [0.1]
+
+class WordTokenizer:
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [text.split() for text in texts]}
+
+@pytest.fixture
+def compression_service(mock_embedding_client, mock_config):
+    mock_embedding_client.embed_batch.side_effect = lambda texts: [keyword_vector(t) for t in texts]
+    config = mock_config.retrieval.model_copy(update={"compression_max_tokens": 30, "compression_neighbours": 1})
+    return CompressionService(mock_embedding_client, TokenCounter(WordTokenizer()), config)
+
+def test_keeps_relevant_sentences_with_neighbours(compression_service, mock_embedding_client):
+    policy = (
+        "The office opens at eight. Parking is free for staff. Remote work is allowed two days a week. "
+        "Your manager approves the schedule. The cafeteria serves lunch daily. Holiday requests go to HR."
+    )
+    other = "Parking permits are issued by facilities. The cafeteria closes at three. Remote badges expire yearly."
+    results = [
+        SearchResult(text=policy, score=0.9, page_number=4, document_name="policy.pdf"),
+        SearchResult(text=other, score=0.7, page_number=9, document_name="facilities.pdf"),
+    ]
+
+    compressed = compression_service.compress("How many remote days does my manager allow?", results)
+
+    # One embedding batch: the question and every sentence
+    mock_embedding_client.embed_batch.assert_called_once()
+    assert [r.document_name for r in compressed] == ["policy.pdf", "facilities.pdf"]
+    # The best sentence with a neighbour on each side; the rest of the chunk is cut
+    assert compressed[0].text == (
+        "Parking is free for staff. Remote work is allowed two days a week. Your manager approves the schedule."
+    )
+    assert compressed[0].page_number == 4
+    # The second chunk keeps its best sentence, so its citation survives
+    assert compressed[1].text == "The cafeteria closes at three. Remote badges expire yearly."
+    assert sum(len(r.text.split()) for r in compressed) <= 30
+
+def test_context_within_budget_is_left_alone(compression_service, mock_embedding_client):
+    results = [SearchResult(text="Remote work is allowed.", score=0.9, page_number=1, document_name="a.pdf", token_count=4)]
+
+    assert compression_service.compress("remote?", results) == results
+    mock_embedding_client.embed_batch.assert_not_called()
@@ -0,0 +1,9 @@
+from app.api import dependencies
+from app.core.config import settings
+
+def test_cached_clients_are_shared_however_they_are_requested():
+    # FastAPI resolves dependencies with keyword arguments, startup and workers call positionally
+    assert dependencies.get_pdf_extractor(config=settings) is dependencies.get_pdf_extractor(settings)
+    assert dependencies.get_vector_store(config=settings) is dependencies.get_vector_store(settings)
+    assert dependencies.get_text_chunker(config=settings) is dependencies.get_text_chunker(settings)
+    assert dependencies.get_token_counter(config=settings) is dependencies.get_token_counter(settings)
@@ -0,0 +1,100 @@
+import pytest
+from unittest.mock import MagicMock
+from app.core.exceptions import IngestionError, NotFoundError
+
+def test_submit_queues_job(job_service, mock_job_repo, tmp_path):
+    upload = tmp_path / "upload.pdf"
+    upload.write_bytes(b"%PDF-1.4 content")
+    mock_job_repo.create.side_effect = lambda **kwargs: MagicMock(
+        id="job-1", status="queued", stage="queued", progress=0.0,
+        error=None, result=None, created_at=None, updated_at=None,
+        **kwargs
+    )
+
+    response = job_service.submit(str(upload), "hash123", "doc.pdf", "HR", "user")
+
+    assert response.job_id == "job-1"
+    assert response.status == "queued"
+    assert mock_job_repo.create.call_args.kwargs["document_hash"] == "hash123"
+    mock_job_repo.session.commit.assert_called_once()
+    assert upload.exists()
+
+def test_submit_rejects_duplicate_and_discards_upload(job_service, mock_job_repo, mock_document_repo, tmp_path):
+    upload = tmp_path / "upload.pdf"
+    upload.write_bytes(b"%PDF-1.4 content")
+    mock_document_repo.get_by_hash.return_value = MagicMock(id=99)
+
+    with pytest.raises(IngestionError) as exc:
+        job_service.submit(str(upload), "hash123", "doc.pdf", "HR", "user")
+
+    assert "already exists" in str(exc.value)
+    mock_job_repo.create.assert_not_called()
+    assert not upload.exists()
+
+def test_get_status_unknown_job(job_service):
+    with pytest.raises(NotFoundError):
+        job_service.get_status("missing")
+
+def test_get_status_with_result(job_service, mock_job_repo):
+    mock_job_repo.get_by_id.return_value = MagicMock(
+        id="job-2", status="succeeded", mode="create", stage="done", progress=1.0,
+        filename="doc.pdf", tag="HR", uploaded_by="user", document_id=7, error=None,
+        created_at=None, updated_at=None,
+        result={
+            "document_id": 7, "filename": "doc.pdf", "chunks_created": 3,
+            "status": "success", "pages_ingested": 2, "tag": "HR", "uploaded_by": "user"
+        }
+    )
+
+    response = job_service.get_status("job-2")
+
+    assert response.status == "succeeded"
+    assert response.result.chunks_created == 3
+
+def test_submit_new_version_inherits_tag(job_service, mock_job_repo, mock_document_repo, tmp_path):
+    upload = tmp_path / "upload.pdf"
+    upload.write_bytes(b"%PDF-1.4 content")
+    mock_document_repo.get_by_id.return_value = MagicMock(id=7, tag="Legal", document_hash="old-hash")
+    mock_job_repo.create.side_effect = lambda **kwargs: MagicMock(
+        id="job-3", status="queued", stage="queued", progress=0.0,
+        error=None, result=None, created_at=None, updated_at=None,
+        **kwargs
+    )
+
+    response = job_service.submit(str(upload), "new-hash", "doc_v2.pdf", None, "user", document_id=7)
+
+    assert response.mode == "update"
+    assert response.tag == "Legal"
+    assert mock_job_repo.create.call_args.kwargs["document_id"] == 7
+
+def test_submit_new_version_rejects_unchanged_file(job_service, mock_document_repo, tmp_path):
+    upload = tmp_path / "upload.pdf"
+    upload.write_bytes(b"%PDF-1.4 content")
+    mock_document_repo.get_by_id.return_value = MagicMock(id=7, tag="Legal", document_hash="same-hash")
+
+    with pytest.raises(IngestionError) as exc:
+        job_service.submit(str(upload), "same-hash", "doc.pdf", None, "user", document_id=7)
+
+    assert "unchanged" in str(exc.value)
+    assert not upload.exists()
+
+def test_rechunk_is_refused_when_chunk_settings_changed_since_the_rebuild(job_service, mock_job_repo, mock_document_repo, mock_config):
+    from app.core.exceptions import ValidationError
+    from app.data.database import IndexCollection
+    mock_document_repo.get_by_id.return_value = MagicMock(id=7, filename="handbook.pdf", tag="HR", uploaded_by="user")
+    mock_job_repo.create.side_effect = lambda **kwargs: MagicMock(
+        id="job-3", status="queued", stage="queued", progress=0.0,
+        error=None, result=None, created_at=None, updated_at=None,
+        **kwargs
+    )
+    settings = mock_config.ingestion
+
+    # Built with the configured settings (or none recorded): queued
+    job_service.collection = IndexCollection(id=1, chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap)
+    assert job_service.submit_rechunk(7).mode == "rechunk"
+
+    job_service.collection = IndexCollection(id=2, chunk_size=settings.chunk_size * 2, chunk_overlap=settings.chunk_overlap)
+    with pytest.raises(ValidationError) as exc:
+        job_service.submit_rechunk(7)
+    assert "CHUNK_SIZE" in str(exc.value) and "rebuild_index.py" in str(exc.value)
+    assert mock_job_repo.create.call_count == 1
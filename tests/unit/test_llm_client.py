@@ -0,0 +1,109 @@
+import asyncio
+import json
+import time
+import httpx
+import openai
+from app.clients.llm_client import HedgedLLMClient, OpenRouterClient
+
+def completion(text):
+    return {
+        "id": "1", "object": "chat.completion", "created": 0, "model": "m",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}]
+    }
+
+def streamed(*texts):
+    chunks = [
+        {"id": "1", "object": "chat.completion.chunk", "created": 0, "model": "m",
+         "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}]}
+        for text in texts
+    ]
+    body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=body.encode())
+
+def upstream_client(config, handler):
+    client = OpenRouterClient(config)
+    client.client = openai.AsyncOpenAI(
+        base_url="http://upstream/v1", api_key="k", max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+    return client
+
+def test_concurrent_generations_are_capped(mock_config):
+    in_flight, peak = 0, 0
+
+    async def upstream(request):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        prompt = json.loads(request.content)["messages"][0]["content"]
+        return httpx.Response(200, json=completion(f"answer to {prompt}"))
+
+    async def run():
+        client = OpenRouterClient(mock_config.llm.model_copy(update={"max_concurrency": 2}))
+        client.client = openai.AsyncOpenAI(
+            base_url="http://upstream/v1", api_key="k", max_retries=0,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(upstream))
+        )
+        try:
+            return await asyncio.gather(*(client.generate(f"q{i}") for i in range(6)))
+        finally:
+            await client.client.close()
+            await client.aclose()
+
+    answers = asyncio.run(run())
+
+    assert answers == [f"answer to q{i}" for i in range(6)]
+    assert peak == 2
+
+def test_slow_target_is_hedged_and_cancelled(mock_config):
+    cancelled = []
+
+    async def slow(request):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+        return streamed("slow answer")
+
+    async def fast(request):
+        return streamed("fast ", "answer")
+
+    async def run():
+        primary = upstream_client(mock_config.llm, slow)
+        client = HedgedLLMClient([primary, upstream_client(mock_config.llm, fast)], hedge_delay=0.05)
+        try:
+            started = time.perf_counter()
+            answer = await client.generate("q")
+            # The loser has stopped and given its slot back by the time the answer is returned
+            return answer, time.perf_counter() - started, list(cancelled), primary._semaphore._value
+        finally:
+            await client.aclose()
+
+    answer, elapsed, cancelled_before_return, free_slots = asyncio.run(run())
+
+    assert answer == "fast answer"
+    assert elapsed < 1
+    assert cancelled_before_return == [True]
+    assert free_slots == mock_config.llm.max_concurrency
+
+def test_failed_target_falls_back_without_waiting(mock_config):
+    async def failing(request):
+        return httpx.Response(503, json={"error": {"message": "overloaded"}})
+
+    async def healthy(request):
+        return streamed("answer")
+
+    async def run():
+        client = HedgedLLMClient(
+            [upstream_client(mock_config.llm, failing), upstream_client(mock_config.llm, healthy)],
+            hedge_delay=10
+        )
+        try:
+            return [delta async for delta in client.generate_stream("q")]
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == ["answer"]
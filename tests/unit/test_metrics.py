@@ -0,0 +1,36 @@
+import time
+from app.core.metrics import MetricsRegistry
+from app.utils.timing import StageTimer
+
+def test_stage_timer_does_not_count_nested_stages_twice():
+    timer = StageTimer()
+
+    def pages():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    def chunks(items):
+        for item in items:
+            time.sleep(0.02)
+            yield item
+
+    list(timer.iterate("split", chunks(timer.iterate("extract", pages()))))
+
+    seconds = timer.seconds()
+    assert 0.03 <= seconds["extract"] < 0.06
+    assert 0.06 <= seconds["split"] < 0.09
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.describe("rag_ingest_stage_seconds", "Busy time per ingestion stage")
+    registry.observe("rag_ingest_stage_seconds", 0.5, stage="embed")
+    registry.observe("rag_ingest_stage_seconds", 1.5, stage="embed")
+    registry.inc("rag_ingest_documents_total", status="success")
+
+    text = registry.render()
+
+    assert '# TYPE rag_ingest_stage_seconds summary' in text
+    assert 'rag_ingest_stage_seconds_count{stage="embed"} 2' in text
+    assert 'rag_ingest_stage_seconds_sum{stage="embed"} 2.0' in text
+    assert 'rag_ingest_documents_total{status="success"} 1.0' in text
@@ -0,0 +1,84 @@
+import os
+import pytest
+from app.core.exceptions import IngestionError
+from app.utils.pdf_processor import PDFExtractor
+
+PDF_PATH = os.path.join(os.path.dirname(__file__), "..", "Remote_Work_policy.pdf")
+
+def test_serial_and_parallel_extraction_match():
+    serial = PDFExtractor(max_workers=1)
+    parallel = PDFExtractor(max_workers=2, pages_per_task=1, parallel_min_pages=1)
+    try:
+        with serial.open(PDF_PATH) as pdf:
+            serial_pages = list(pdf.iter_pages())
+        with parallel.open(PDF_PATH) as pdf:
+            assert parallel.should_parallelize(PDF_PATH, pdf.page_count)
+            parallel_pages = list(pdf.iter_pages())
+    finally:
+        parallel.shutdown()
+
+    assert serial_pages
+    assert parallel_pages == serial_pages
+    assert [n for n, _ in serial_pages] == sorted(n for n, _ in serial_pages)
+
+def test_in_memory_source_is_extracted_serially():
+    with open(PDF_PATH, "rb") as f:
+        content = f.read()
+    extractor = PDFExtractor(max_workers=4, parallel_min_pages=1)
+
+    with extractor.open(content) as pdf:
+        assert not extractor.should_parallelize(content, pdf.page_count)
+        assert list(pdf.iter_pages())
+
+def test_open_rejects_non_pdf():
+    with pytest.raises(IngestionError) as exc:
+        with PDFExtractor(max_workers=1).open(b"not a pdf"):
+            pass
+    assert "Invalid PDF" in str(exc.value)
+
+def test_large_document_mode_extracts_the_same_pages():
+    extractor = PDFExtractor(max_workers=1)
+    with extractor.open(PDF_PATH) as pdf:
+        expected = list(pdf.iter_pages())
+
+    # Every file is "large"
+    large = PDFExtractor(max_workers=1, large_min_bytes=0, window_pages=2)
+    with large.open(PDF_PATH) as pdf:
+        assert pdf.large
+        assert list(pdf.iter_pages()) == expected
+        assert not pdf.reader.resolved_objects
+
+def test_large_document_waits_for_memory_at_one_page(monkeypatch):
+    extractor = PDFExtractor(max_workers=1)
+    with extractor.open(PDF_PATH) as pdf:
+        expected = list(pdf.iter_pages())
+    monkeypatch.setattr("app.utils.pdf_processor.RSS_WAIT_POLL_SECONDS", 0)
+
+    # Over the budget until other work frees memory: the window shrinks to one page, then waits
+    rss = iter([2] * 8 + [0] * 100)
+    large = PDFExtractor(max_workers=1, large_min_bytes=0, window_pages=2, rss_budget_bytes=1)
+    monkeypatch.setattr(large, "total_rss_bytes", lambda: next(rss))
+    with large.open(PDF_PATH) as pdf:
+        assert list(pdf.iter_pages()) == expected
+
+    # Still over it one page at a time: the document fails after the wait
+    stuck = PDFExtractor(max_workers=1, large_min_bytes=0, window_pages=2, rss_budget_bytes=1, rss_wait_seconds=0)
+    monkeypatch.setattr(stuck, "total_rss_bytes", lambda: 2)
+    with stuck.open(PDF_PATH) as pdf:
+        with pytest.raises(IngestionError) as exc:
+            list(pdf.iter_pages())
+    assert "INGEST_RSS_BUDGET_MB" in str(exc.value)
+
+def test_parallel_extraction_counts_the_workers_against_the_budget():
+    # A one-byte budget: the pool workers alone are over it, whatever this process uses
+    extractor = PDFExtractor(max_workers=2, pages_per_task=1, parallel_min_pages=1, rss_budget_bytes=1, rss_wait_seconds=0)
+    extracted = []
+    try:
+        with extractor.open(PDF_PATH) as pdf:
+            with pytest.raises(IngestionError) as exc:
+                for page in pdf.iter_pages():
+                    extracted.append(page)
+            assert len(extracted) < pdf.page_count
+    finally:
+        extractor.shutdown()
+    assert "budget" in str(exc.value)
@@ -0,0 +1,45 @@
+import threading
+import pytest
+from app.utils.pipeline import BackgroundIterator, batched
+
+def test_background_iterator_yields_in_order_from_another_thread():
+    producers = set()
+
+    def produce():
+        for i in range(10):
+            producers.add(threading.current_thread().name)
+            yield i
+
+    with BackgroundIterator(produce(), maxsize=2, name="producer") as items:
+        assert list(items) == list(range(10))
+    assert producers == {"producer"}
+
+def test_background_iterator_reraises_and_stops_early():
+    closed = threading.Event()
+
+    def produce():
+        try:
+            yield 1
+            raise ValueError("bad page")
+        finally:
+            closed.set()
+
+    with pytest.raises(ValueError):
+        with BackgroundIterator(produce(), maxsize=1) as items:
+            list(items)
+    assert closed.is_set()
+
+    def endless():
+        try:
+            while True:
+                yield 0
+        finally:
+            closed.set()
+
+    closed.clear()
+    with BackgroundIterator(endless(), maxsize=1) as items:
+        next(iter(items))
+    assert closed.is_set()
+
+def test_batched():
+    assert list(batched(range(5), 2)) == [[0, 1], [2, 3], [4]]
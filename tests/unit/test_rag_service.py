@@ -1,6 +1,11 @@
+import asyncio
 import pytest
 from unittest.mock import MagicMock
-from app.core.schemas import SearchResult
+from app.core.exceptions import LLMError, ValidationError
+from app.core.schemas import BatchChatItem, SearchResult
+from app.utils.circuit_breaker import CircuitBreaker
+from app.utils.singleflight import SingleFlight
+from app.utils.token_counter import TokenCounter
 
 def test_chat_success(rag_service, mock_llm_client):
     # Mock retrieval results
@@ -13,7 +18,7 @@ def test_chat_success(rag_service, mock_llm_client):
     )
     rag_service.retrieval_service.search = MagicMock(return_value=[search_result])
     
-    response = rag_service.chat("Question?", "HR", [])
+    response = asyncio.run(rag_service.chat("Question?", "HR", []))
     
     assert response.answer == "This is a mock answer."
     assert "test.pdf (Page 1)" in response.sources
@@ -23,7 +28,7 @@ def test_chat_success(rag_service, mock_llm_client):
 def test_chat_no_results(rag_service):
     rag_service.retrieval_service.search = MagicMock(return_value=[])
     
-    response = rag_service.chat("Question?", "HR")
+    response = asyncio.run(rag_service.chat("Question?", "HR"))
     
     assert response.sources == []
     # Should still return an answer (LLM generates even with no context if prompt allows, or generic "I don't know")
@@ -32,10 +37,219 @@ def test_chat_no_results(rag_service):
 
 def test_chat_validation_error(rag_service):
     # Service catches exceptions and returns error message
-    response = rag_service.chat("", "HR")
+    response = asyncio.run(rag_service.chat("", "HR"))
     assert response.confidence == 0.0
     assert "Question cannot be empty" in response.answer
 
+def test_identical_concurrent_chats_share_one_answer(rag_service, mock_llm_client):
+    rag_service.chat_flight = SingleFlight()
+    rag_service.retrieval_service.search = MagicMock(return_value=[])
+    async def slow_generate(prompt):
+        await asyncio.sleep(0.05)
+        return "Shared answer."
+    mock_llm_client.generate.side_effect = slow_generate
+
+    async def burst():
+        return await asyncio.gather(
+            rag_service.chat("How many vacation days?", "HR"),
+            rag_service.chat("  how many  VACATION days? ", "HR"),
+            rag_service.chat("How many vacation days?", "Legal")
+        )
+    hr, hr_again, legal = asyncio.run(burst())
+
+    assert hr.answer == hr_again.answer == legal.answer == "Shared answer."
+    # The Legal question has its own retrieval context, so it is not coalesced
+    assert mock_llm_client.generate.call_count == 2
+    assert rag_service.chat_flight.inflight() == 0
+
+def test_coalesced_chats_all_receive_the_failure(rag_service, mock_llm_client):
+    rag_service.chat_flight = SingleFlight()
+    rag_service.retrieval_service.search = MagicMock(return_value=[])
+    async def failing_generate(prompt):
+        await asyncio.sleep(0.05)
+        raise LLMError("OpenRouter API failed")
+    mock_llm_client.generate.side_effect = failing_generate
+
+    async def burst():
+        return await asyncio.gather(*(rag_service.chat("Question?", "HR") for _ in range(3)))
+    responses = asyncio.run(burst())
+
+    assert all("OpenRouter API failed" in r.answer and r.confidence == 0.0 for r in responses)
+    assert mock_llm_client.generate.call_count == 1
+
+class WhitespaceTokenizer:
+    """One token per whitespace-separated word; records what it was asked to count."""
+    def __init__(self):
+        self.seen = []
+
+    def __call__(self, texts, add_special_tokens=False):
+        self.seen.extend(texts)
+        return {"input_ids": [text.split() for text in texts]}
+
+def words(n, word):
+    return " ".join([word] * n)
+
+def test_prompt_packs_context_by_score_within_the_window(rag_service, mock_config):
+    tokenizer = WhitespaceTokenizer()
+    rag_service.token_counter = TokenCounter(tokenizer)
+    rag_service.config = mock_config.model_copy(update={
+        "llm": mock_config.llm.model_copy(update={"context_window": 400, "max_tokens": 100})
+    })
+    results = [
+        SearchResult(text=words(150, "alpha"), score=0.9, page_number=1, document_name="a.pdf", token_count=150),
+        SearchResult(text=words(200, "beta"), score=0.8, page_number=2, document_name="b.pdf", token_count=200),
+        SearchResult(text=words(40, "gamma"), score=0.7, page_number=3, document_name="c.pdf", token_count=40),
+    ]
+
+    prompt, included = rag_service._build_prompt("Question?", results, [])
+
+    # beta does not fit after alpha; the smaller gamma still does
+    assert [r.document_name for r in included] == ["a.pdf", "c.pdf"]
+    assert "beta" not in prompt and "gamma" in prompt
+    assert len(prompt.split()) <= 300
+    # Chunk texts were counted at ingest, not here
+    assert not any("alpha" in text for text in tokenizer.seen)
+
+def test_prompt_drops_oldest_history_to_fit(rag_service, mock_config):
+    rag_service.token_counter = TokenCounter(WhitespaceTokenizer())
+    rag_service.config = mock_config.model_copy(update={
+        "llm": mock_config.llm.model_copy(update={"context_window": 200, "max_tokens": 50})
+    })
+    history = [{"role": "user", "content": words(60, "old")}, {"role": "assistant", "content": words(60, "recent")}]
+
+    prompt, included = rag_service._build_prompt("Question?", [], history)
+
+    assert "old" not in prompt and "recent" in prompt
+    assert len(prompt.split()) <= 150
+
+def test_estimated_counts_leave_a_margin_of_the_window(rag_service, mock_config):
+    rag_service.token_counter = TokenCounter(chars_per_token=1.0, estimate_margin=0.25)
+    rag_service.config = mock_config.model_copy(update={
+        "llm": mock_config.llm.model_copy(update={"context_window": 2200, "max_tokens": 200})
+    })
+    results = [SearchResult(text="x" * 300, score=0.9 - i / 10, page_number=i, document_name="a.pdf", token_count=300) for i in range(5)]
+
+    prompt, included = rag_service._build_prompt("Question?", results, [])
+
+    # 1500 of the 2000 tokens may be filled: three snippets fit after the frame, not all five
+    assert len(included) == 3 and len(prompt) <= 1500
+
+def test_overlapping_chunks_are_merged_across_pages(rag_service, mock_llm_client):
+    # Offsets are in whole-document coordinates; the second chunk crosses into page 2
+    page_1 = "Remote work is allowed up to three days a week. Managers approve schedules."
+    doc = page_1 + "\n\nEquipment is provided. Expenses are reimbursed monthly."
+    def chunk(start, end, score, page=1, page_end=None, document_id=1):
+        return SearchResult(
+            text=doc[start:end], score=score, page_number=page, page_end=page_end, document_name="policy.pdf",
+            document_id=document_id, start_offset=start, end_offset=end
+        )
+    first_end = doc.index(" Managers")
+    second = doc.index("three")
+    third = doc.index("Equipment")
+    rag_service.retrieval_service.search = MagicMock(return_value=[
+        chunk(0, first_end, 0.7),
+        chunk(second, doc.index(" Expenses"), 0.9, page_end=2), # overlaps the first, ends on page 2
+        chunk(third, len(doc), 0.6, page=2),                     # starts on page 2, overlaps the second
+        chunk(0, first_end, 0.5, document_id=2),
+    ])
+
+    results, prompt = rag_service._prepare_chat("Question?", "HR", [])
+
+    assert [(r.document_id, r.pages, r.score) for r in results] == [(1, "1-2", 0.9), (2, "1", 0.5)]
+    assert results[0].text == doc
+    assert prompt.count("Equipment is provided") == 1
+    assert "[policy.pdf Page 1-2]" in prompt
+    assert rag_service._extract_sources(results) == ["policy.pdf (Page 1-2)", "policy.pdf (Page 1)"]
+
 def test_health_check(rag_service):
-    response = rag_service.health()
+    response = asyncio.run(rag_service.health())
     assert response.status == "healthy"
+
+def test_open_llm_circuit_answers_with_sources_only(rag_service, mock_llm_client):
+    now = [0.0]
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=2, open_seconds=30, clock=lambda: now[0])
+    rag_service.llm_breaker = breaker
+    rag_service.health_service.llm_breaker = breaker
+    result = SearchResult(text="Remote work is allowed two days a week.", score=0.8, page_number=3, document_name="policy.pdf", document_id=1)
+    rag_service.retrieval_service.search = MagicMock(return_value=[result])
+    mock_llm_client.generate.side_effect = LLMError("OpenRouter API failed")
+
+    for _ in range(2):
+        asyncio.run(rag_service.chat("Remote days?", "HR"))
+    # Open: no LLM call, the top sources instead
+    response = asyncio.run(rag_service.chat("Remote days?", "HR"))
+    assert mock_llm_client.generate.call_count == 2
+    assert "[policy.pdf Page 3] Remote work is allowed two days a week." in response.answer
+    assert response.sources == ["policy.pdf (Page 3)"]
+    health = asyncio.run(rag_service.health())
+    assert health.components["llm"]["circuit"] == "open"
+    assert health.status == "degraded"
+
+    # Half-open after the pause: one successful trial closes it
+    now[0] = 31.0
+    mock_llm_client.generate.side_effect = None
+    response = asyncio.run(rag_service.chat("Remote days?", "HR"))
+    assert response.answer == "This is a mock answer."
+    assert breaker.state == "closed"
+
+def test_chat_many_embeds_once_and_caps_concurrent_generations(rag_service, mock_llm_client, mock_embedding_client, mock_config):
+    rag_service.config = mock_config.model_copy(update={
+        "retrieval": mock_config.retrieval.model_copy(update={"chat_batch_concurrency": 2})
+    })
+    mock_embedding_client.embed_batch.return_value = [[0.1] * 384] * 4
+    result = SearchResult(text="Remote work is allowed.", score=0.8, page_number=3, document_name="policy.pdf", document_id=1)
+    rag_service.retrieval_service.search = MagicMock(return_value=[result])
+    in_flight, peak = 0, 0
+    async def generate(prompt):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.02)
+        in_flight -= 1
+        return "answer to " + prompt.split("User Question: ")[1].split("\n")[0]
+    mock_llm_client.generate.side_effect = generate
+    questions = ["Q1?", "Q2?", "", "Q3?", "Q4?"]
+
+    response = asyncio.run(rag_service.chat_many([BatchChatItem(query=q, tag="HR") for q in questions], max_concurrency=5))
+
+    # One embedding call for the valid questions, each passed on to its search
+    mock_embedding_client.embed_batch.assert_called_once_with(["Q1?", "Q2?", "Q3?", "Q4?"])
+    assert all(call.kwargs["query_vector"] is not None for call in rag_service.retrieval_service.search.call_args_list)
+    assert peak == 2 # capped by CHAT_BATCH_CONCURRENCY
+    assert [r.answer for r in response.results[:2]] == ["answer to Q1?", "answer to Q2?"]
+    assert response.results[2].error == "Question cannot be empty" and response.results[2].confidence == 0.0
+    assert response.results[4].answer == "answer to Q4?" and response.results[4].sources == ["policy.pdf (Page 3)"]
+    assert all(r.latency_ms >= 20 for r in response.results if r.error is None)
+
+async def collect_events(rag_service, question):
+    return [event async for event in await rag_service.chat_stream(question, "HR")]
+
+def test_chat_stream_sends_sources_then_deltas(rag_service, mock_llm_client):
+    search_result = SearchResult(text="Content", score=0.8, page_number=2, document_name="test.pdf", document_id=1)
+    rag_service.retrieval_service.search = MagicMock(return_value=[search_result])
+    async def stream(prompt):
+        for delta in ["Hel", "lo"]:
+            yield delta
+    mock_llm_client.generate_stream.side_effect = stream
+
+    events = asyncio.run(collect_events(rag_service, "Question?"))
+
+    assert [e["event"] for e in events] == ["sources", "delta", "delta", "done"]
+    assert events[0]["data"] == {"sources": ["test.pdf (Page 2)"], "confidence": 0.8}
+    assert "".join(e["data"]["text"] for e in events if e["event"] == "delta") == "Hello"
+
+def test_chat_stream_reports_llm_failure_as_event(rag_service, mock_llm_client):
+    rag_service.retrieval_service.search = MagicMock(return_value=[])
+    async def failing_stream(prompt):
+        yield "Par"
+        raise LLMError("OpenRouter stream interrupted")
+    mock_llm_client.generate_stream.side_effect = failing_stream
+
+    events = asyncio.run(collect_events(rag_service, "Question?"))
+
+    assert [e["event"] for e in events] == ["sources", "delta", "error"]
+    assert events[-1]["data"]["detail"] == "OpenRouter stream interrupted"
+
+def test_chat_stream_validates_before_streaming(rag_service):
+    with pytest.raises(ValidationError):
+        asyncio.run(rag_service.chat_stream("", "HR"))
@@ -0,0 +1,62 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.core.schemas import SearchResult
+from app.services.session_service import ChatSessionService, Conversation
+
+@pytest.fixture
+def session_repo():
+    return MagicMock()
+
+@pytest.fixture
+def session_service(retrieval_service, mock_llm_client, mock_config, session_repo):
+    config = mock_config.retrieval.model_copy(update={"session_recent_messages": 4, "session_reuse_similarity": 0.9, "top_k": 3})
+    service = ChatSessionService(MagicMock, retrieval_service, mock_llm_client, config)
+    with patch("app.services.session_service.ChatSessionRepository", return_value=session_repo):
+        yield service
+
+def test_follow_ups_reuse_or_extend_the_previous_results(session_service, mock_embedding_client):
+    previous = [
+        SearchResult(text="Remote work is allowed two days a week.", score=0.8, page_number=3, document_name="policy.pdf", chunk_id=1),
+        SearchResult(text="Managers approve remote schedules.", score=0.7, page_number=4, document_name="policy.pdf", chunk_id=2),
+    ]
+    conversation = Conversation("c1", tag="HR", query_vector=[1.0, 0.0], candidates=previous)
+    search = session_service.retrieval_service.search = MagicMock()
+
+    # Close to the last searched question: the same results, no search
+    mock_embedding_client.embed_text.return_value = [0.99, 0.1]
+    assert session_service.retrieve(conversation, "How many remote days?", "HR") == previous
+    search.assert_not_called()
+
+    # Further away: a new search, with the earlier results discounted by the similarity (0.6)
+    mock_embedding_client.embed_text.return_value = [0.6, 0.8]
+    search.return_value = [
+        SearchResult(text="Contractors follow their agency's policy.", score=0.75, page_number=9, document_name="policy.pdf", chunk_id=5),
+        SearchResult(text="Managers approve remote schedules.", score=0.65, page_number=4, document_name="policy.pdf", chunk_id=2),
+    ]
+    results = session_service.retrieve(conversation, "What about contractors?", "HR")
+
+    assert search.call_args.kwargs["query_vector"] == [0.6, 0.8]
+    assert [(r.chunk_id, round(r.score, 2)) for r in results] == [(5, 0.75), (2, 0.65), (1, 0.48)]
+    # The next follow-up is compared with this question
+    assert conversation.query_vector == [0.6, 0.8] and conversation.candidates == results
+
+def test_older_messages_are_folded_into_the_summary(session_service, mock_llm_client, session_repo):
+    mock_llm_client.generate = AsyncMock(return_value="The user asked about remote days (two a week).")
+    conversation = Conversation("c1", tag="HR", turns=1, messages=[
+        {"role": "user", "content": "How many remote days?"},
+        {"role": "assistant", "content": "Two a week."},
+    ])
+
+    asyncio.run(session_service.record_turn(conversation, "Who approves them?", "Your manager."))
+    # Four messages fit verbatim
+    mock_llm_client.generate.assert_not_called()
+
+    asyncio.run(session_service.record_turn(conversation, "And for contractors?", "Their agency's policy applies."))
+
+    summary_prompt = mock_llm_client.generate.call_args.args[0]
+    assert "Two a week." in summary_prompt and "Their agency" not in summary_prompt
+    assert conversation.summary == "The user asked about remote days (two a week)."
+    assert [m["content"] for m in conversation.messages] == ["And for contractors?", "Their agency's policy applies."]
+    saved = session_repo.save.call_args.args[1]
+    assert saved["summary"] == conversation.summary and saved["turns"] == 3
@@ -0,0 +1,38 @@
+import pytest
+from pydantic import ValidationError
+from app.core.config import IngestionConfig
+from app.utils.simhash import BAND_COUNT, SimHashIndex, hamming_distance, simhash, simhash_bands
+
+TEXT = (
+    "Employees may work remotely up to three days per week, subject to manager approval. "
+    "Requests must be submitted through the HR portal at least two weeks in advance, and "
+    "remote staff are expected to be reachable during core hours from ten to four."
+)
+
+def test_near_duplicates_are_close():
+    edited = TEXT.replace("three days", "four days")
+    unrelated = "Quarterly revenue grew by twelve percent in Europe, driven by new enterprise contracts."
+    assert simhash(TEXT) == simhash(TEXT.upper())
+    assert hamming_distance(simhash(TEXT), simhash(edited)) < hamming_distance(simhash(TEXT), simhash(unrelated))
+
+def test_signature_fits_bigint_and_bands():
+    signature = simhash(TEXT)
+    assert -(1 << 63) <= signature < (1 << 63)
+    assert all(0 <= band < (1 << 16) for band in simhash_bands(signature))
+
+def test_index_finds_within_distance():
+    index = SimHashIndex(max_distance=3)
+    signature = simhash(TEXT)
+    index.add(signature, "canonical")
+    assert index.find(signature ^ 0b101) == "canonical"
+    assert index.find(signature ^ 0b1111) is None
+
+def test_text_without_words_has_no_signature():
+    assert simhash("........................ 12") is not None
+    assert simhash("------------------------------") is None
+    assert simhash("| — | • | … |") is None
+
+def test_distance_beyond_lsh_recall_is_refused():
+    assert IngestionConfig(DEDUP_MAX_HAMMING_DISTANCE=BAND_COUNT - 1).dedup_max_distance == 3
+    with pytest.raises(ValidationError):
+        IngestionConfig(DEDUP_MAX_HAMMING_DISTANCE=BAND_COUNT)
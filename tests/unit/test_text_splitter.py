@@ -0,0 +1,29 @@
+from app.utils.text_splitter import PAGE_SEPARATOR, StreamingChunker
+
+PAGES = [
+    (1, "Employees may work remotely up to three days per week. Requests go to the line manager."),
+    (2, "Short tail."),
+    (4, "Equipment is provided by the company. Personal devices must be enrolled before use, "
+        "and lost devices must be reported within one business day."),
+]
+
+def test_chunks_map_back_to_document_offsets():
+    document = PAGE_SEPARATOR.join(text for _, text in PAGES)
+    chunks = StreamingChunker(chunk_size=60, chunk_overlap=15).split_pages(iter(PAGES))
+
+    assert len(chunks) > 3
+    for chunk in chunks:
+        assert len(chunk.text) <= 60
+        assert document[chunk.start_offset:chunk.end_offset] == chunk.text
+    # Consecutive chunks overlap and together cover the whole document
+    assert chunks[0].start_offset == 0
+    assert chunks[-1].end_offset == len(document)
+    assert all(b.start_offset < a.end_offset for a, b in zip(chunks, chunks[1:]))
+
+def test_short_page_tail_is_merged_across_pages():
+    chunks = StreamingChunker(chunk_size=200, chunk_overlap=0).split_pages(PAGES)
+
+    spanning = [c for c in chunks if c.page_number != c.page_end]
+    assert spanning and spanning[0].page_number == 1 and "Short tail." in spanning[0].text
+    assert chunks[-1].page_end == 4
+    assert all(len(c.text) > 20 for c in chunks)
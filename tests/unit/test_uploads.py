@@ -0,0 +1,79 @@
+import hashlib
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from app.api.uploads import spool_upload
+from app.core.exceptions import RAGException
+
+MAX_BYTES = 1024
+
+@pytest.fixture
+def client(tmp_path):
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(request: Request):
+        try:
+            spooled = await spool_upload(request, str(tmp_path), MAX_BYTES)
+        except RAGException as e:
+            return {"error": e.error_code}
+        with open(spooled.file_path, "rb") as f:
+            stored = f.read()
+        return {
+            "filename": spooled.filename,
+            "size": spooled.size,
+            "sha256": spooled.sha256,
+            "fields": spooled.fields,
+            "stored_matches": stored == b"%PDF" + b"x" * 500
+        }
+
+    return TestClient(app)
+
+def test_spool_upload_streams_file_and_fields(client):
+    content = b"%PDF" + b"x" * 500
+    response = client.post(
+        "/upload",
+        files={"file": ("policy.pdf", content, "application/pdf")},
+        data={"tag": "HR", "uploaded_by": "user"}
+    )
+
+    data = response.json()
+    assert data["filename"] == "policy.pdf"
+    assert data["size"] == len(content)
+    assert data["sha256"] == hashlib.sha256(content).hexdigest()
+    assert data["fields"] == {"tag": "HR", "uploaded_by": "user"}
+    assert data["stored_matches"]
+
+def test_spool_upload_enforces_size_limit(client, tmp_path):
+    response = client.post(
+        "/upload",
+        files={"file": ("big.pdf", b"%PDF" + b"x" * (MAX_BYTES * 2), "application/pdf")},
+        data={"tag": "HR", "uploaded_by": "user"}
+    )
+
+    assert response.json() == {"error": "PAYLOAD_TOO_LARGE"}
+    assert list(tmp_path.iterdir()) == []
+
+def test_spool_upload_requires_file_part(client):
+    response = client.post("/upload", data={"tag": "HR"}, files={"other": ("x.txt", b"abc")})
+    assert response.json() == {"error": "VALIDATION_ERROR"}
+
+def test_spool_upload_bounds_the_whole_body_without_content_length(client, tmp_path):
+    from app.api.uploads import FORM_OVERHEAD_BYTES
+    boundary = "b0undary"
+    # Small fields, each under the per-field cap, but together far over the form overhead
+    field = f'--{boundary}\r\nContent-Disposition: form-data; name="f"\r\n\r\n{"v" * 1000}\r\n'.encode()
+    def body():
+        yield (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="a.pdf"\r\n'
+            f"Content-Type: application/pdf\r\n\r\n%PDF\r\n"
+        ).encode()
+        for _ in range((MAX_BYTES + FORM_OVERHEAD_BYTES) // len(field) + 2):
+            yield field
+        yield f"--{boundary}--\r\n".encode()
+
+    # A generator body is sent chunked, without Content-Length
+    response = client.post("/upload", content=body(), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+    assert response.json() == {"error": "PAYLOAD_TOO_LARGE"}
+    assert list(tmp_path.iterdir()) == []
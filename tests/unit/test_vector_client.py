@@ -0,0 +1,33 @@
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+from sqlalchemy.sql.elements import TextClause
+from app.clients.vector_client import ChunkVectorStore
+from app.data.database import IndexCollection
+
+def _row(chunk_id, distance):
+    return SimpleNamespace(
+        id=chunk_id, text=f"chunk {chunk_id}", document_id=2, page_number=1, page_end=1, token_count=3,
+        start_offset=0, end_offset=7, tag="SMALL", filename="small.pdf", distance=distance
+    )
+
+def test_tag_with_a_small_share_of_the_collection_still_gets_k_results(mock_config):
+    # The index scan only reached one chunk of the tag; the exact scan finds all three
+    scans = iter([[_row(1, 0.2)], [_row(3, 0.3), _row(1, 0.2), _row(2, 0.25)]])
+    settings = []
+    def execute(stmt, *args):
+        if isinstance(stmt, TextClause):
+            settings.append(stmt.text)
+            return MagicMock(scalar=MagicMock(return_value=False))
+        return MagicMock(all=MagicMock(return_value=next(scans)))
+    session = MagicMock(execute=MagicMock(side_effect=execute))
+    store = ChunkVectorStore(mock_config.database, 384).for_collection(IndexCollection(id=1))
+
+    with patch("app.clients.vector_client.SessionLocal") as session_local, \
+            patch.object(ChunkVectorStore, "_iterative_scan", None):
+        session_local.return_value.__enter__.return_value = session
+        results = store.similarity_search([0.1] * 384, k=3, threshold=0.0, tag="SMALL")
+
+    assert [meta["chunk_id"] for _, _, meta in results] == [1, 2, 3]
+    assert settings[0] == "SET LOCAL hnsw.ef_search = 100"
+    assert settings[-1] == "SET LOCAL enable_indexscan = off"
+    assert not any("iterative_scan" in sql for sql in settings)
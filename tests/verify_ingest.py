@@ -1,7 +1,7 @@
 import requests
-import base64
 import os
 import sys
+import time
 
 API_URL = "http://localhost:8000"
 FILE_PATH = "tests/test_doc.pdf"
@@ -11,15 +11,8 @@ def verify_ingest():
         print(f"Error: {FILE_PATH} not found. Run generate script first.")
         sys.exit(1)
 
-    with open(FILE_PATH, "rb") as f:
-        content = f.read()
-    
-    b64_content = base64.b64encode(content).decode('utf-8')
-    
-    payload = {
-        "filename": "test_doc.pdf",
+    form = {
         "tag": "HR",
-        "base64_content": b64_content,
         "uploaded_by": "test_script"
     }
     
@@ -29,15 +22,28 @@ def verify_ingest():
     
     print(f"Sending request to {API_URL}/ingest...")
     try:
-        response = requests.post(f"{API_URL}/ingest", json=payload, headers=headers)
+        with open(FILE_PATH, "rb") as f:
+            files = {"file": ("test_doc.pdf", f, "application/pdf")}
+            response = requests.post(f"{API_URL}/ingest", files=files, data=form, headers=headers)
         
-        if response.status_code == 201:
-            print("✅ Ingestion Successful!")
-            print(response.json())
-        else:
+        if response.status_code != 202:
             print(f"❌ Ingestion Failed: {response.status_code}")
             print(response.text)
             sys.exit(1)
+
+        job = response.json()
+        print(f"Queued job {job['job_id']}, waiting for completion...")
+        while job["status"] in ("queued", "running"):
+            time.sleep(1)
+            job = requests.get(f"{API_URL}/ingest/{job['job_id']}", headers=headers).json()
+            print(f"  {job['stage']} ({job['progress'] * 100:.0f}%)")
+
+        if job["status"] == "succeeded":
+            print("✅ Ingestion Successful!")
+            print(job["result"])
+        else:
+            print(f"❌ Ingestion Failed: {job.get('error')}")
+            sys.exit(1)
             
     except Exception as e:
         print(f"❌ Request failed: {e}")
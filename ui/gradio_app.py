@@ -12,6 +12,7 @@ load_dotenv()
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 API_KEY = os.getenv("API_KEY", "dev-secret-key-12345")
 TAGS = ["HR", "Legal", "Finance"]
+UPLOAD_POLL_INTERVAL = float(os.getenv("UPLOAD_POLL_INTERVAL", "1.0"))
 
 # --- Custom CSS ---
 CUSTOM_CSS = """
@@ -57,34 +58,49 @@ def get_headers():
 
 # --- Functions ---
 
-def upload_document(file, tag, uploaded_by):
+def upload_document(file, tag, uploaded_by, replace_document_id=None):
     if not file:
-        return "⚠️ Please select a file."
+        yield "⚠️ Please select a file."
+        return
     
     try:
+        form = {"tag": tag, "uploaded_by": uploaded_by}
+        if replace_document_id:
+            # New version of an existing document: it keeps its tag, only changed pages are re-embedded
+            form = {"uploaded_by": uploaded_by, "document_id": str(int(replace_document_id))}
+
+        # Multipart upload: the file is streamed as-is, no base64 inflation
         with open(file, "rb") as f:
-            pdf_content = f.read()
-            
-        import base64
-        base64_content = base64.b64encode(pdf_content).decode("utf-8")
-        
-        payload = {
-            "filename": os.path.basename(file.name),
-            "tag": tag,
-            "base64_content": base64_content,
-            "uploaded_by": uploaded_by
-        }
+            response = requests.post(
+                f"{API_URL}/ingest",
+                files={"file": (os.path.basename(file.name), f, "application/pdf")},
+                data=form,
+                headers=get_headers()
+            )
         
-        response = requests.post(f"{API_URL}/ingest", json=payload, headers=get_headers())
-        
-        if response.status_code == 201:
-            data = response.json()
+        if response.status_code != 202:
+            yield upload_error_card(f"Error {response.status_code}: {response.text}")
+            return
+
+        # Ingestion runs as a background job; poll until it finishes
+        job = response.json()
+        while job["status"] in ("queued", "running"):
+            yield upload_progress_card(job)
+            time.sleep(UPLOAD_POLL_INTERVAL)
+            status_response = requests.get(f"{API_URL}/ingest/{job['job_id']}", headers=get_headers())
+            if status_response.status_code != 200:
+                yield upload_error_card(f"Error {status_response.status_code}: {status_response.text}")
+                return
+            job = status_response.json()
+
+        if job["status"] == "succeeded":
+            data = job.get("result") or {}
             # Success Card HTML
-            return f"""
+            yield f"""
             <div style="background: #ecfdf5; border: 1px solid #34d399; padding: 20px; border-radius: 8px; text-align: center;">
                 <div style="font-size: 40px; margin-bottom: 10px;">✅</div>
                 <h3 style="color: #065f46 !important; margin: 0;">Upload Successful</h3>
-                <p style="color: #047857 !important;"><b style="color: #047857 !important;">{data.get('filename')}</b> has been added.</p>
+                <p style="color: #047857 !important;"><b style="color: #047857 !important;">{data.get('filename')}</b> has been {'updated to version ' + str(data.get('version')) if data.get('version') else 'added'}.</p>
                 <div style="margin-top: 15px; display: flex; justify-content: center; gap: 20px; font-size: 0.9em; color: #064e3b !important;">
                     <span style="color: #064e3b !important;">📄 {data.get('pages_ingested')} Pages</span>
                     <span style="color: #064e3b !important;">🏷️ {data.get('tag')}</span>
@@ -93,52 +109,87 @@ def upload_document(file, tag, uploaded_by):
             </div>
             """
         else:
-            return f"""
-            <div style="background: #fef2f2; border: 1px solid #f87171; padding: 20px; border-radius: 8px;">
-                <h3 style="color: #991b1b; margin: 0;">❌ Upload Failed</h3>
-                <p style="color: #b91c1c;">Error {response.status_code}: {response.text}</p>
-            </div>
-            """
+            yield upload_error_card(job.get("error") or "Ingestion failed")
             
     except Exception as e:
-        return f"⚠️ Exception: {str(e)}"
+        yield f"⚠️ Exception: {str(e)}"
+
+def upload_progress_card(job):
+    percent = int((job.get("progress") or 0) * 100)
+    stage = job.get("stage", "queued").replace("_", " ")
+    return f"""
+    <div style="background: #eef2ff; border: 1px solid #818cf8; padding: 20px; border-radius: 8px;">
+        <h3 style="color: #3730a3 !important; margin: 0;">⏳ Processing {job.get('filename')}</h3>
+        <p style="color: #4338ca !important;">Stage: {stage} ({percent}%)</p>
+        <div class="score-bar-bg"><div class="score-bar-fill" style="width: {percent}%;"></div></div>
+    </div>
+    """
+
+def upload_error_card(message):
+    return f"""
+    <div style="background: #fef2f2; border: 1px solid #f87171; padding: 20px; border-radius: 8px;">
+        <h3 style="color: #991b1b; margin: 0;">❌ Upload Failed</h3>
+        <p style="color: #b91c1c;">{message}</p>
+    </div>
+    """
+
+def sources_block(sources):
+    # Formatted Sources using <details> for cleaner UI
+    if not sources:
+        return ""
+    source_list = "".join([f"<li style='color: #374151 !important;'>{s}</li>" for s in sources])
+    return f"""
+    <br><br>
+    <details style="background: #f9fafb; border: 1px solid #e5e7eb; padding: 10px; border-radius: 8px; color: #374151 !important;">
+        <summary style="cursor: pointer; font-weight: 600; color: #4b5563 !important;">📚 View Sources ({len(sources)})</summary>
+        <ul style="margin-top: 10px; padding-left: 20px; color: #374151 !important;">
+            {source_list}
+        </ul>
+    </details>
+    """
+
+def read_events(response):
+    """Parse a text/event-stream response into (event, data) pairs."""
+    event, data = None, []
+    for line in response.iter_lines(decode_unicode=True):
+        if line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data.append(line[len("data:"):].strip())
+        elif not line and event:
+            yield event, json.loads("\n".join(data) or "null")
+            event, data = None, []
 
 def chat_function(message, history, tag):
+    """Yields the answer rendered so far, token by token, from /chat/stream."""
     if not message:
-        return "", []
+        yield ""
+        return
     
     try:
-        response = requests.post(
-            f"{API_URL}/chat",
+        with requests.post(
+            f"{API_URL}/chat/stream",
             json={"query": str(message), "tag": tag},
-            headers=get_headers()
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            answer = data["answer"]
-            sources = data.get("sources", [])
-            
-            full_response = answer
-            
-            # Formatted Sources using <details> for cleaner UI
-            if sources:
-                source_list = "".join([f"<li style='color: #374151 !important;'>{s}</li>" for s in sources])
-                full_response += f"""
-                <br><br>
-                <details style="background: #f9fafb; border: 1px solid #e5e7eb; padding: 10px; border-radius: 8px; color: #374151 !important;">
-                    <summary style="cursor: pointer; font-weight: 600; color: #4b5563 !important;">📚 View Sources ({len(sources)})</summary>
-                    <ul style="margin-top: 10px; padding-left: 20px; color: #374151 !important;">
-                        {source_list}
-                    </ul>
-                </details>
-                """
-            return full_response
-        else:
-            return f"Error {response.status_code}: {response.text}"
+            headers=get_headers(),
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                yield f"Error {response.status_code}: {response.text}"
+                return
+
+            answer, sources = "", []
+            for event, data in read_events(response):
+                if event == "sources":
+                    sources = data.get("sources", [])
+                elif event == "delta":
+                    answer += data["text"]
+                    yield answer
+                elif event == "error":
+                    answer += f"\n\n⚠️ {data.get('detail')}"
+            yield answer + sources_block(sources)
             
     except Exception as e:
-        return f"Connection Failed: {str(e)}"
+        yield f"Connection Failed: {str(e)}"
 
 def search_documents(query, tag, top_k):
     try:
@@ -272,6 +323,7 @@ with gr.Blocks(title="Corporate RAG Chatbot", theme=gr.themes.Soft(primary_hue="
                         file_input = gr.File(label="Select PDF", file_types=[".pdf"])
                         tag_input = gr.Dropdown(choices=TAGS, label="Department Tag", value="HR")
                         email_input = gr.Textbox(label="Uploaded By", value="admin@company.com")
+                        replace_input = gr.Number(label="New Version of Document ID (optional)", value=None, precision=0)
                         upload_btn = gr.Button("Upload Document", variant="primary", size="lg")
                     
                     with gr.Column(scale=1):
@@ -279,7 +331,7 @@ with gr.Blocks(title="Corporate RAG Chatbot", theme=gr.themes.Soft(primary_hue="
                 
                 upload_btn.click(
                     upload_document,
-                    inputs=[file_input, tag_input, email_input],
+                    inputs=[file_input, tag_input, email_input, replace_input],
                     outputs=upload_output
                 )
 
@@ -302,11 +354,15 @@ with gr.Blocks(title="Corporate RAG Chatbot", theme=gr.themes.Soft(primary_hue="
                     return "", history + [{"role": "user", "content": user_message}]
 
                 def bot(history, tag):
-                    if not history: return history
+                    if not history:
+                        yield history
+                        return
                     user_message = history[-1]["content"]
-                    bot_message = chat_function(user_message, history, tag)
-                    history.append({"role": "assistant", "content": bot_message})
-                    return history
+                    history.append({"role": "assistant", "content": ""})
+                    # Render tokens as they arrive
+                    for partial in chat_function(user_message, history[:-1], tag):
+                        history[-1]["content"] = partial
+                        yield history
 
                 msg.submit(user, [msg, chatbot], [msg, chatbot], queue=False).then(
                     bot, [chatbot, chat_tag], chatbot